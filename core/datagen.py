@@ -0,0 +1,139 @@
+"""
+Synthetic customer and loan data with the same columns as customer_data.csv and loan_data.csv.
+"""
+from datetime import date
+
+import numpy as np
+
+CUSTOMER_COLUMNS = [
+    'Customer ID', 'First Name', 'Last Name', 'Age', 'Phone Number',
+    'Monthly Salary', 'Approved Limit',
+]
+LOAN_COLUMNS = [
+    'Customer ID', 'Loan ID', 'Loan Amount', 'Tenure', 'Interest Rate',
+    'Monthly payment', 'EMIs paid on Time', 'Date of Approval', 'End Date',
+]
+CSV_DATE_FORMAT = '%d-%m-%Y'
+
+FIRST_NAMES = np.array([
+    'Aarav', 'Aditi', 'Amit', 'Ananya', 'Arjun', 'Divya', 'Farhan', 'Gaurav', 'Ishaan', 'Kavya',
+    'Meera', 'Neha', 'Nikhil', 'Pooja', 'Rahul', 'Riya', 'Rohan', 'Saanvi', 'Sanjay', 'Tanvi',
+    'Varun', 'Vikram', 'Yash', 'Zoya',
+])
+LAST_NAMES = np.array([
+    'Agarwal', 'Bhatt', 'Chopra', 'Das', 'Gill', 'Gupta', 'Iyer', 'Jain', 'Kapoor', 'Khan',
+    'Kumar', 'Mehta', 'Menon', 'Nair', 'Patel', 'Reddy', 'Riyat', 'Shah', 'Sharma', 'Singh',
+    'Verma', 'Yadav',
+])
+TENURES = np.array([6, 12, 18, 24, 36, 48, 60, 72, 84, 96, 108, 120, 144, 168])
+TENURE_WEIGHTS = np.array([3, 10, 6, 12, 14, 10, 12, 6, 5, 5, 4, 6, 4, 3], dtype=float)
+TENURE_WEIGHTS /= TENURE_WEIGHTS.sum()
+HISTORY_START = date(2010, 1, 1)
+
+
+def approved_limit_for(monthly_salary):
+    """Vectorized 36 * monthly_salary rounded to the nearest lakh, as in Customer.calculate_approved_limit."""
+    return (np.round(36 * monthly_salary / 100000) * 100000).astype(np.int64)
+
+
+def monthly_emi(principal, annual_rate, tenure, decimals=2):
+    """
+    Vectorized compound interest EMI, as in Loan.calculate_monthly_emi, rounded to
+    `decimals` places (not rounded if None).
+    """
+    monthly_rate = annual_rate / 1200
+    growth = (1 + monthly_rate) ** tenure
+    with np.errstate(divide='ignore', invalid='ignore'):
+        emi = np.where(
+            monthly_rate == 0,
+            principal / tenure,
+            principal * monthly_rate * growth / (growth - 1),
+        )
+    return emi if decimals is None else np.round(emi, decimals)
+
+
+def sample_loan_terms(rng, monthly_salary):
+    """
+    Draw (loan_amount, interest_rate, tenure) arrays for one loan per element of
+    `monthly_salary`: loans of a few months' to a few years' salary.
+    """
+    size = len(monthly_salary)
+    tenure = rng.choice(TENURES, size=size, p=TENURE_WEIGHTS)
+    loan_amount = np.round(monthly_salary * rng.gamma(2.0, 4.0, size=size), -3)
+    loan_amount = np.maximum(loan_amount, 10000).astype(np.int64)
+    interest_rate = np.round(np.clip(rng.normal(12.5, 3.0, size=size), 6.0, 24.0), 2)
+    return loan_amount, interest_rate, tenure
+
+
+def generate_chunk(rng, first_customer_id, num_customers, first_loan_id, loans_per_customer, today):
+    """
+    Generate `num_customers` customers with consecutive IDs and their loans.
+
+    Returns (customers, loans) DataFrames using the ingest CSV headers, with dates
+    kept as datetime64 so callers can format or store them as they need.
+    """
+    # Imported here so the web workers, which only use the numpy helpers above, don't load pandas.
+    import pandas as pd
+
+    customer_ids = np.arange(first_customer_id, first_customer_id + num_customers, dtype=np.int64)
+    monthly_salary = np.clip(
+        np.round(rng.lognormal(mean=np.log(45000), sigma=0.6, size=num_customers), -2),
+        10000, 1000000,
+    ).astype(np.int64)
+    customers = pd.DataFrame({
+        'Customer ID': customer_ids,
+        'First Name': rng.choice(FIRST_NAMES, size=num_customers),
+        'Last Name': rng.choice(LAST_NAMES, size=num_customers),
+        'Age': rng.integers(21, 66, size=num_customers),
+        # Unique by construction: a 9 followed by the zero-padded customer ID.
+        'Phone Number': pd.Series(customer_ids).map('9{:09d}'.format).to_numpy(),
+        'Monthly Salary': monthly_salary,
+        'Approved Limit': approved_limit_for(monthly_salary),
+    })
+
+    loan_counts = rng.poisson(loans_per_customer, size=num_customers)
+    num_loans = int(loan_counts.sum())
+    owner = np.repeat(np.arange(num_customers), loan_counts)
+
+    loan_amount, interest_rate, tenure = sample_loan_terms(rng, monthly_salary[owner])
+
+    history_days = (today - HISTORY_START).days
+    start_date = np.datetime64(HISTORY_START) + rng.integers(0, history_days, size=num_loans).astype('timedelta64[D]')
+    end_date = start_date + (30 * tenure).astype('timedelta64[D]')
+
+    # EMIs that have fallen due so far, of which a borrower-specific share was paid on time.
+    months_elapsed = (np.datetime64(today) - start_date).astype(np.int64) // 30
+    emis_due = np.minimum(tenure, months_elapsed)
+    punctuality = rng.beta(8.0, 1.5, size=num_customers)[owner]
+    emis_paid_on_time = rng.binomial(emis_due, punctuality)
+
+    loans = pd.DataFrame({
+        'Customer ID': customer_ids[owner],
+        'Loan ID': np.arange(first_loan_id, first_loan_id + num_loans, dtype=np.int64),
+        'Loan Amount': loan_amount,
+        'Tenure': tenure,
+        'Interest Rate': interest_rate,
+        'Monthly payment': monthly_emi(loan_amount, interest_rate, tenure),
+        'EMIs paid on Time': emis_paid_on_time,
+        'Date of Approval': start_date,
+        'End Date': end_date,
+    })
+    return customers, loans
+
+
+def generate(seed, num_customers, loans_per_customer, chunk_size, first_customer_id=1, first_loan_id=1, today=None):
+    """
+    Yield (customers, loans) DataFrame chunks of at most `chunk_size` customers.
+    The same seed and arguments always produce the same data.
+    """
+    rng = np.random.default_rng(seed)
+    today = today or date.today()
+    customer_id, loan_id = first_customer_id, first_loan_id
+    remaining = num_customers
+    while remaining > 0:
+        size = min(chunk_size, remaining)
+        customers, loans = generate_chunk(rng, customer_id, size, loan_id, loans_per_customer, today)
+        yield customers, loans
+        customer_id += size
+        loan_id += len(loans)
+        remaining -= size
@@ -0,0 +1,185 @@
+"""
+Streaming export of loans joined with their customer, for month-end reconciliation.
+
+Rows are read with QuerySet.iterator(), which uses a server-side cursor on
+PostgreSQL, and written out one chunk at a time, so memory stays bounded by
+the chunk size however many loans are exported. With several customer shards
+each is read through its own cursor and the sorted streams are merged.
+"""
+import csv
+import heapq
+import io
+import json
+from itertools import islice
+from operator import itemgetter
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Loan
+from .sharding import shard_aliases
+
+EXPORT_FORMATS = ('csv', 'ndjson', 'parquet')
+DEFAULT_CHUNK_SIZE = 5000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# (output column, ORM lookup)
+EXPORT_COLUMNS = [
+    ('loan_id', 'loan_id'),
+    ('customer_id', 'customer_id'),
+    ('first_name', 'customer__first_name'),
+    ('last_name', 'customer__last_name'),
+    ('phone_number', 'customer__phone_number'),
+    ('age', 'customer__age'),
+    ('monthly_salary', 'customer__monthly_salary'),
+    ('approved_limit', 'customer__approved_limit'),
+    ('current_debt', 'customer__current_debt'),
+    ('loan_amount', 'loan_amount'),
+    ('tenure', 'tenure'),
+    ('interest_rate', 'interest_rate'),
+    ('monthly_repayment', 'monthly_repayment'),
+    ('emis_paid_on_time', 'emis_paid_on_time'),
+    ('start_date', 'start_date'),
+    ('end_date', 'end_date'),
+    ('status', 'status'),
+]
+COLUMN_NAMES = [name for name, _ in EXPORT_COLUMNS]
+
+
+class ExportError(Exception):
+    pass
+
+
+def export_rows(statuses=None, start_date_from=None, start_date_to=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Loans from every shard as tuples in EXPORT_COLUMNS order, ordered by loan_id.
+    `statuses` limits the export to those loan statuses, and the date bounds
+    (inclusive) apply to start_date.
+    """
+    loans = Loan.objects.all()
+    if statuses:
+        loans = loans.filter(status__in=statuses)
+    if start_date_from:
+        loans = loans.filter(start_date__gte=start_date_from)
+    if start_date_to:
+        loans = loans.filter(start_date__lte=start_date_to)
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    loans = loans.order_by('loan_id').values_list(*lookups)
+    shards = [loans.using(alias).iterator(chunk_size=chunk_size) for alias in shard_aliases()]
+    if len(shards) == 1:
+        return shards[0]
+    return heapq.merge(*shards, key=itemgetter(0))
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def _csv_stream(rows, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMN_NAMES)
+    for chunk in _chunks(rows, chunk_size):
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def _ndjson_stream(rows, chunk_size):
+    for chunk in _chunks(rows, chunk_size):
+        yield ''.join(
+            json.dumps(dict(zip(COLUMN_NAMES, row)), cls=DjangoJSONEncoder) + '\n' for row in chunk
+        ).encode()
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever was written since the last take()."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def _parquet_stream(rows, chunk_size):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportError('Parquet export needs pyarrow; install it with `pip install pyarrow`.')
+
+    schema = pa.schema([
+        ('loan_id', pa.int64()),
+        ('customer_id', pa.int64()),
+        ('first_name', pa.string()),
+        ('last_name', pa.string()),
+        ('phone_number', pa.string()),
+        ('age', pa.int32()),
+        ('monthly_salary', pa.int64()),
+        ('approved_limit', pa.int64()),
+        ('current_debt', pa.int64()),
+        ('loan_amount', pa.decimal128(12, 2)),
+        ('tenure', pa.int32()),
+        ('interest_rate', pa.decimal128(5, 2)),
+        ('monthly_repayment', pa.decimal128(10, 2)),
+        ('emis_paid_on_time', pa.int32()),
+        ('start_date', pa.date32()),
+        ('end_date', pa.date32()),
+        ('status', pa.string()),
+    ])
+
+    def stream():
+        # Each chunk becomes one row group, written out as soon as it is complete.
+        sink = _ChunkSink()
+        with pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema) as writer:
+            for chunk in _chunks(rows, chunk_size):
+                columns = [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)]
+                writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+                yield sink.take()
+        yield sink.take()
+
+    return stream()
+
+
+def stream_export(export_format, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Encode `rows` from export_rows() as `export_format`, returning an iterator of byte
+    strings of about `chunk_size` rows each. Raises ExportError straight away, before
+    any output, if the format cannot be produced.
+    """
+    if export_format == 'csv':
+        return _csv_stream(rows, chunk_size)
+    if export_format == 'ndjson':
+        return _ndjson_stream(rows, chunk_size)
+    if export_format == 'parquet':
+        return _parquet_stream(rows, chunk_size)
+    raise ExportError(f'Unknown export format {export_format!r}; choose one of {", ".join(EXPORT_FORMATS)}.')
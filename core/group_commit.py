@@ -0,0 +1,179 @@
+"""
+Group commit for create-loan (GROUP_COMMIT_ENABLED).
+
+Approved loans from concurrent requests in a worker process are queued to one
+background thread. It collects them for up to GROUP_COMMIT_WINDOW seconds (or
+GROUP_COMMIT_MAX_BATCH loans), then for each customer shard allocates their loan
+IDs, inserts them with one bulk_create and adds to each customer's current_debt
+with one UPDATE, all in a single transaction. Each request waits for its own
+Future, so it only responds once its loan has committed, and each shard pays
+one commit per batch instead of one per loan.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+
+from .models import Customer, Loan
+from .sharding import next_loan_id
+from .snapshots import publish_customer_change
+
+logger = logging.getLogger(__name__)
+
+# Attempts for a single loan that keeps failing a constraint, e.g. because a concurrent
+# writer took its loan ID. Larger batches are split instead of retried whole.
+MAX_ATTEMPTS = 5
+
+
+class PendingLoan(NamedTuple):
+    loan: Loan
+    debt_increment: int
+    future: Future
+
+
+class GroupCommitter:
+
+    def __init__(self, window, max_batch):
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.loans = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread_pid = None
+
+    def submit(self, loan, debt_increment):
+        """
+        Queue an unsaved Loan (its loan_id is assigned in the batch) together with the
+        amount to add to its customer's current_debt. Returns a Future resolving to the
+        saved loan once its batch has committed.
+        """
+        self.start()
+        future = Future()
+        self._queue.put(PendingLoan(loan, debt_increment, future))
+        return future
+
+    def write(self, loan, debt_increment):
+        """
+        submit() the loan and wait for its batch; returns the saved loan. A batch slower
+        than GROUP_COMMIT_TIMEOUT is logged but still waited for: it may yet commit, and
+        failing the request would let the client retry and write the loan twice.
+        """
+        future = self.submit(loan, debt_increment)
+        try:
+            return future.result(settings.GROUP_COMMIT_TIMEOUT)
+        except FutureTimeoutError:
+            logger.warning('Group commit batch still running after %ss, waiting for it', settings.GROUP_COMMIT_TIMEOUT)
+            return future.result()
+
+    def start(self):
+        """
+        Start the writer thread if this process has none yet. Threads do not survive a
+        fork, so every worker process starts its own.
+        """
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid != os.getpid():
+                threading.Thread(target=self._run, name='group-commit', daemon=True).start()
+                self._thread_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            close_old_connections()
+            self.commit(batch)
+
+    def commit(self, batch):
+        """Write a batch in one transaction per shard and resolve its futures."""
+        shards = defaultdict(list)
+        for pending in batch:
+            shards[pending.loan._state.db].append(pending)
+        for shard_batch in shards.values():
+            self._commit_shard(shard_batch)
+
+    def _commit_shard(self, batch):
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                self._write(batch)
+            except IntegrityError as e:
+                if len(batch) > 1:
+                    # One loan may violate a constraint. Write each half on its own, so that in
+                    # the end only that loan fails and its neighbours still commit.
+                    middle = len(batch) // 2
+                    self._commit_shard(batch[:middle])
+                    self._commit_shard(batch[middle:])
+                    return
+                if attempt == MAX_ATTEMPTS:
+                    self._fail(batch, e)
+                    return
+                # A loan ingested concurrently may have taken the ID; try again with a fresh one.
+                logger.info('Loan ID collision in group commit, retrying (attempt %s)', attempt)
+            except Exception as e:
+                self._fail(batch, e)
+                return
+            else:
+                self.batches += 1
+                self.loans += len(batch)
+                for pending in batch:
+                    pending.future.set_result(pending.loan)
+                return
+
+    def _write(self, batch):
+        using = batch[0].loan._state.db
+        increments = defaultdict(int)
+        for pending in batch:
+            increments[pending.loan.customer_id] += pending.debt_increment
+        # IDs of one shard are spaced len(CUSTOMER_SHARDS) apart (see core.sharding). They are
+        # reserved before the transaction, so other workers do not wait for it to commit.
+        first_loan_id = next_loan_id(using, count=len(batch))
+        step = len(settings.CUSTOMER_SHARDS)
+        for offset, pending in enumerate(batch):
+            pending.loan.loan_id = first_loan_id + offset * step
+        with transaction.atomic(using=using):
+            Loan.objects.using(using).bulk_create([pending.loan for pending in batch])
+            Customer.objects.using(using).filter(customer_id__in=list(increments)).update(
+                current_debt=F('current_debt') + Case(
+                    *[When(customer_id=customer_id, then=Value(amount)) for customer_id, amount in increments.items()],
+                    output_field=PositiveIntegerField(),
+                ),
+                updated_at=timezone.now(),
+            )
+            for customer_id in increments:
+                publish_customer_change(customer_id, using=using)
+
+    def _fail(self, batch, exception):
+        logger.error('Group commit of %s loans failed', len(batch), exc_info=exception)
+        for pending in batch:
+            pending.future.set_exception(exception)
+
+
+_committer = None
+_committer_lock = threading.Lock()
+
+
+def get_group_committer():
+    global _committer
+    if _committer is None:
+        with _committer_lock:
+            if _committer is None:
+                _committer = GroupCommitter(settings.GROUP_COMMIT_WINDOW, settings.GROUP_COMMIT_MAX_BATCH)
+    return _committer
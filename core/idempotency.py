@@ -0,0 +1,137 @@
+import hashlib
+import json
+import logging
+import time
+from functools import wraps
+
+import redis
+from django.conf import settings
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+
+
+def request_fingerprint(data):
+    """
+    Stable hash of a request body, used to reject a key reused with a different payload.
+    """
+    payload = json.dumps(data, sort_keys=True, cls=JSONEncoder)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def idempotent(scope):
+    """
+    Decorator for APIView handlers that honours the `Idempotency-Key` header.
+
+    The first request with a given key runs the handler and its response is
+    stored in Redis for `settings.IDEMPOTENCY_KEY_TTL` seconds; repeats get the
+    stored response back with an `Idempotent-Replayed: true` header. A repeat
+    that arrives while the first request is still running waits for its result
+    instead of running the handler a second time. Requests without the header
+    are handled normally.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            idempotency_key = request.META.get('HTTP_IDEMPOTENCY_KEY')
+            if not idempotency_key:
+                return handler(view, request, *args, **kwargs)
+            if len(idempotency_key) > 255:
+                return Response({'error': 'Idempotency-Key must be at most 255 characters.'}, status=status.HTTP_400_BAD_REQUEST)
+
+            client_id = request.META.get('HTTP_X_CLIENT_ID', '')
+            key = f'idempotency:{scope}:{client_id}:{idempotency_key}'
+            fingerprint = request_fingerprint(request.data)
+            client = get_redis()
+            try:
+                claimed = _claim(client, key, fingerprint)
+            except redis.RedisError:
+                # Nothing has run yet, so handling the request unprotected cannot repeat it.
+                logger.warning('Idempotency store unavailable, handling request without it', exc_info=True)
+                return handler(view, request, *args, **kwargs)
+            if claimed is not True:
+                return claimed
+            return _run_and_store(client, key, fingerprint, handler, view, request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _claim(client, key, fingerprint):
+    """
+    True once this request holds `key`; otherwise the response to send instead
+    (the stored result, a mismatch error, or a conflict while still in flight).
+    """
+    in_flight = json.dumps({'state': IN_FLIGHT, 'fingerprint': fingerprint})
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+
+    while True:
+        if client.set(key, in_flight, nx=True, ex=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            return True
+
+        stored = client.get(key)
+        if stored is None:
+            # The first attempt failed and released the key; take over.
+            continue
+        entry = json.loads(stored)
+        if entry['fingerprint'] != fingerprint:
+            return Response(
+                {'error': 'Idempotency-Key was already used with a different request body.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+        if entry['state'] == DONE:
+            response = Response(entry['data'], status=entry['status'])
+            response['Idempotent-Replayed'] = 'true'
+            return response
+        if time.monotonic() >= deadline:
+            response = Response(
+                {'error': 'A request with this Idempotency-Key is still being processed.'},
+                status=status.HTTP_409_CONFLICT
+            )
+            response['Retry-After'] = '1'
+            return response
+        time.sleep(settings.IDEMPOTENCY_POLL_INTERVAL)
+
+
+def _run_and_store(client, key, fingerprint, handler, view, request, *args, **kwargs):
+    """
+    Run the handler while holding `key`. Once it has run its response is returned
+    even if Redis fails, since handling the request again could repeat its effects.
+    """
+    try:
+        response = handler(view, request, *args, **kwargs)
+    except Exception:
+        _release(client, key)
+        raise
+
+    if response.status_code >= 500:
+        # Server errors are not final; let the client retry for real.
+        _release(client, key)
+        return response
+
+    entry = {
+        'state': DONE,
+        'fingerprint': fingerprint,
+        'status': response.status_code,
+        'data': response.data,
+    }
+    try:
+        client.set(key, json.dumps(entry, cls=JSONEncoder), ex=settings.IDEMPOTENCY_KEY_TTL)
+    except redis.RedisError:
+        # Repeats get 409 until the in-flight entry expires, then run the handler again.
+        logger.error('Could not store the response for idempotency key %s', key, exc_info=True)
+    return response
+
+
+def _release(client, key):
+    try:
+        client.delete(key)
+    except redis.RedisError:
+        # The in-flight entry expires on its own after IDEMPOTENCY_LOCK_TIMEOUT.
+        logger.warning('Could not release idempotency key %s', key, exc_info=True)
@@ -0,0 +1,286 @@
+import json
+import random
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, models, transaction
+from django.db.migrations.serializer import serializer_factory
+from django.db.models import Max, Q
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIRequestFactory
+
+from core.models import Customer, Loan
+from core.query_plans import (
+    PLAN_TABLES, buffer_usage, explain, redundant_indexes, sequential_scans, table_indexes,
+)
+from core.sharding import shard_aliases, shard_for_customer
+from core.utils import calculate_credit_score
+from core.views import CheckEligibilityView, CreateLoanView, RegisterView, ViewLoanView, ViewLoansView
+
+# Indexes worth trying on top of the ones declared in the models, with the queries they target.
+CANDIDATE_INDEXES = [
+    (
+        Loan,
+        models.Index(
+            fields=['customer'],
+            include=['status', 'start_date', 'tenure', 'emis_paid_on_time', 'loan_amount', 'monthly_repayment'],
+            name='loans_customer_summary_idx',
+        ),
+        'covering index for the per-customer loan summary behind calculate_credit_score',
+    ),
+    (
+        Loan,
+        models.Index(
+            fields=['customer'],
+            condition=Q(status='ACTIVE'),
+            include=['monthly_repayment', 'tenure', 'emis_paid_on_time'],
+            name='loans_active_customer_idx',
+        ),
+        "partial index for the status='ACTIVE' EMI and outstanding debt sums",
+    ),
+]
+
+
+@contextmanager
+def rolled_back():
+    """A transaction on every database, rolled back on exit, so replayed writes never commit."""
+    with ExitStack() as stack:
+        for alias in settings.DATABASES:
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+        for alias in settings.DATABASES:
+            transaction.set_rollback(True, using=alias)
+
+
+class Command(BaseCommand):
+    help = (
+        'Replays the ORM queries of each API view and of calculate_credit_score against the '
+        'database, runs EXPLAIN (ANALYZE, BUFFERS) on them, flags sequential scans and redundant '
+        'indexes, and measures candidate index changes before proposing them as a migration. '
+        'Queries run on the shard of the sampled customer. PostgreSQL only; every write and '
+        'index change is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customer-id', type=int, help='Customer to replay requests for (default: owner of a random loan).')
+        parser.add_argument('--repeat', type=int, default=5, help='EXPLAIN ANALYZE runs per query; the median time is reported.')
+        parser.add_argument('--seq-scan-rows', type=int, default=1000, help='Flag sequential scans reading at least this many rows.')
+        parser.add_argument('--min-gain', type=float, default=0.10, help='Minimum relative reduction in buffers touched for a candidate index to be proposed.')
+        parser.add_argument('--json', dest='json_path', help='Also write the full report as JSON to this path.')
+
+    def handle(self, *args, **options):
+        if any(connections[alias].vendor != 'postgresql' for alias in shard_aliases()):
+            raise CommandError('advise_indexes needs PostgreSQL (EXPLAIN ANALYZE, BUFFERS).')
+        customer, loan = self.pick_sample(options['customer_id'])
+        self.using = customer._state.db
+        self.stdout.write(
+            f'Replaying queries for customer {customer.customer_id} and loan {loan.loan_id} on {self.using}...'
+        )
+
+        queries = self.capture_queries(customer, loan)
+        # Warm the cache first, then measure the baseline the same way as the trials so
+        # the only difference between them is the index change.
+        self.measure(queries, repeat=1)
+        baseline = self.trial(queries, options['repeat'])
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\nQuery plans (median of {options["repeat"]} runs):'))
+        for label, result in baseline.items():
+            self.stdout.write(
+                f'  {label:<32}{result["time_ms"]:>10.3f} ms   {result["plan"]["Node Type"]}'
+                f'   buffers hit={result["buffers"]["shared_hit"]} read={result["buffers"]["shared_read"]}'
+            )
+            for table, rows in sequential_scans(result['plan'], options['seq_scan_rows']):
+                self.stdout.write(self.style.WARNING(f'    ! sequential scan of {table} reading {rows} rows'))
+
+        indexes = table_indexes(self.using)
+        redundant = redundant_indexes(indexes)
+        self.stdout.write(self.style.MIGRATE_HEADING('\nRedundant indexes:'))
+        if not redundant:
+            self.stdout.write('  none')
+        for index, covering in redundant:
+            self.stdout.write(self.style.WARNING(
+                f'  {index["name"]} on {index["table"]}({", ".join(index["columns"])}) is covered by '
+                f'{covering["name"]}({", ".join(covering["columns"])}); {index["size"] // 1024} kB'
+            ))
+
+        existing = {index['name'] for index in indexes}
+        trials = []
+        for model, index, reason in CANDIDATE_INDEXES:
+            if index.name in existing:
+                continue
+            after = self.trial(queries, options['repeat'], add=(model, index))
+            trials.append(self.summarize_trial(f'add {index.name}', reason, baseline, after, ('add', model, index)))
+        for index, covering in redundant:
+            after = self.trial(queries, options['repeat'], drop=index['name'])
+            reason = f'covered by {covering["name"]}'
+            trials.append(self.summarize_trial(f'drop {index["name"]}', reason, baseline, after, ('drop', index)))
+
+        self.stdout.write(self.style.MIGRATE_HEADING('\nTrials (applied and rolled back):'))
+        proposals = []
+        for trial in trials:
+            self.stdout.write(
+                f'  {trial["change"]} ({trial["reason"]}): buffers {trial["before_buffers"]} -> {trial["after_buffers"]}, '
+                f'time {trial["before_ms"]:.3f} -> {trial["after_ms"]:.3f} ms'
+            )
+            for label, before, after in trial['changed']:
+                self.stdout.write(f'      {label:<32}{before} -> {after}')
+            action = trial['action']
+            if action[0] == 'add' and trial['gain'] >= options['min_gain']:
+                proposals.append(action)
+            elif action[0] == 'drop' and trial['gain'] > -options['min_gain']:
+                proposals.append(action)
+
+        self.stdout.write(self.style.MIGRATE_HEADING('\nProposed migration operations:'))
+        if not proposals:
+            self.stdout.write('  none')
+        for line in self.migration_lines(proposals):
+            self.stdout.write(line)
+
+        if options['json_path']:
+            report = {
+                'database': self.using,
+                'customer_id': customer.customer_id,
+                'loan_id': loan.loan_id,
+                'queries': {
+                    label: {
+                        'sql': queries[label], 'time_ms': result['time_ms'], 'buffers': result['buffers'],
+                        'sequential_scans': sequential_scans(result['plan'], options['seq_scan_rows']),
+                    }
+                    for label, result in baseline.items()
+                },
+                'redundant_indexes': [
+                    {'index': index['name'], 'covered_by': covering['name'], 'size': index['size']}
+                    for index, covering in redundant
+                ],
+                'trials': [{key: value for key, value in trial.items() if key != 'action'} for trial in trials],
+            }
+            with open(options['json_path'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    def pick_sample(self, customer_id):
+        customer = loan = None
+        if customer_id is not None:
+            using = shard_for_customer(customer_id)
+            customer = Customer.objects.using(using).filter(pk=customer_id).first()
+            loan = Loan.objects.using(using).filter(customer_id=customer_id).first()
+        else:
+            # Owners of a random loan are weighted towards customers with many loans.
+            aliases = shard_aliases()
+            random.shuffle(aliases)
+            for using in aliases:
+                max_loan_id = Loan.objects.using(using).aggregate(max_id=Max('loan_id'))['max_id'] or 0
+                loan = Loan.objects.using(using).filter(loan_id__gte=random.randint(0, max_loan_id)).order_by('loan_id').first()
+                if loan is not None:
+                    customer = loan.customer
+                    break
+        if customer is None or loan is None:
+            raise CommandError('No customer with loans found; seed the database first with generate_data.')
+        return customer, loan
+
+    def capture_queries(self, customer, loan):
+        """
+        Run each view and calculate_credit_score with every database's transaction rolled
+        back, and return {label: SQL} for the SELECT statements they issued on the
+        customer's shard. Group commit is turned off so create-loan writes in this thread.
+        """
+        factory = APIRequestFactory()
+        loan_request = {'customer_id': customer.customer_id, 'loan_amount': 50000, 'interest_rate': 12, 'tenure': 12}
+        scenarios = [
+            ('register', lambda: RegisterView.as_view(throttle_classes=[])(factory.post('/api/register/', {
+                'first_name': 'Plan', 'last_name': 'Advisor', 'age': 30, 'monthly_income': 50000,
+                'phone_number': '0000000000',
+            }, format='json'))),
+            ('check-eligibility', lambda: CheckEligibilityView.as_view(throttle_classes=[])(
+                factory.post('/api/check-eligibility/', loan_request, format='json'))),
+            ('create-loan', lambda: CreateLoanView.as_view(throttle_classes=[])(
+                factory.post('/api/create-loan/', loan_request, format='json'))),
+            ('view-loan', lambda: ViewLoanView.as_view(throttle_classes=[])(
+                factory.get(f'/api/view-loan/{loan.loan_id}/'), loan_id=loan.loan_id)),
+            ('view-loans', lambda: ViewLoansView.as_view(throttle_classes=[])(
+                factory.get(f'/api/view-loans/{customer.customer_id}/'), customer_id=customer.customer_id)),
+            ('calculate_credit_score', lambda: calculate_credit_score(customer)),
+        ]
+        queries = {}
+        for name, run in scenarios:
+            with override_settings(GROUP_COMMIT_ENABLED=False), rolled_back(), \
+                    CaptureQueriesContext(connections[self.using]) as captured:
+                run()
+            selects = [query['sql'] for query in captured if query['sql'].lstrip().upper().startswith('SELECT')]
+            for number, sql in enumerate(selects, start=1):
+                queries[f'{name} #{number}'] = sql
+        return queries
+
+    def measure(self, queries, repeat):
+        results = {}
+        for label, sql in queries.items():
+            plan, time_ms = explain(sql, using=self.using, repeat=repeat)
+            results[label] = {'plan': plan, 'time_ms': time_ms, 'buffers': buffer_usage(plan)}
+        return results
+
+    def trial(self, queries, repeat, add=None, drop=None):
+        connection = connections[self.using]
+        with transaction.atomic(using=self.using):
+            if add:
+                model, index = add
+                with connection.schema_editor(atomic=False) as schema_editor:
+                    schema_editor.add_index(model, index)
+            if drop:
+                with connection.cursor() as cursor:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(drop)}')
+            with connection.cursor() as cursor:
+                for table in PLAN_TABLES:
+                    cursor.execute(f'ANALYZE {table}')
+            results = self.measure(queries, repeat)
+            transaction.set_rollback(True, using=self.using)
+        return results
+
+    def summarize_trial(self, change, reason, baseline, after, action):
+        """
+        Compare a trial with the baseline. The decision uses shared buffers touched,
+        which are stable between runs, while execution times are reported alongside.
+        """
+        def buffers(results):
+            return sum(result['buffers']['shared_hit'] + result['buffers']['shared_read'] for result in results.values())
+
+        before_buffers, after_buffers = buffers(baseline), buffers(after)
+        changed = [
+            (label, baseline[label]['plan'], after[label]['plan'])
+            for label in baseline
+            if baseline[label]['plan']['Node Type'] != after[label]['plan']['Node Type']
+        ]
+        return {
+            'change': change,
+            'reason': reason,
+            'before_ms': sum(result['time_ms'] for result in baseline.values()),
+            'after_ms': sum(result['time_ms'] for result in after.values()),
+            'before_buffers': before_buffers,
+            'after_buffers': after_buffers,
+            'gain': (before_buffers - after_buffers) / before_buffers if before_buffers else 0.0,
+            'changed': [(label, before['Node Type'], after['Node Type']) for label, before, after in changed],
+            'action': action,
+        }
+
+    def migration_lines(self, proposals):
+        meta_indexes = {
+            index.name: model._meta.model_name
+            for model in (Customer, Loan) for index in model._meta.indexes
+        }
+        lines = []
+        for action in proposals:
+            if action[0] == 'add':
+                _, model, index = action
+                definition, _ = serializer_factory(index).serialize()
+                lines.append(f'        migrations.AddIndex(model_name={model._meta.model_name!r}, index={definition}),')
+                continue
+            index = action[1]
+            if index['name'] in meta_indexes:
+                lines.append(f'        migrations.RemoveIndex(model_name={meta_indexes[index["name"]]!r}, name={index["name"]!r}),')
+            elif len(index['columns']) == 1 and index['columns'][0].endswith('_id'):
+                field = index['columns'][0][:-len('_id')]
+                lines.append(f'        # {index["name"]}: set db_index=False on {index["table"]}.{field} and run makemigrations')
+            else:
+                lines.append(f'        migrations.RunSQL("DROP INDEX {index["name"]}"),')
+        if lines:
+            lines.append('    # Mirror the changes in the models\' Meta.indexes so the migration state matches.')
+        return lines
@@ -0,0 +1,259 @@
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from core.models import Customer, Loan
+from core.sharding import shard_aliases
+
+ROUTES = ['register', 'check-eligibility', 'create-loan', 'view-loan', 'view-loans', 'offers']
+DEFAULT_MIX = 'register=1,check-eligibility=4,create-loan=1,view-loan=3,view-loans=3'
+
+
+def parse_mix(value):
+    """Parse "route=weight,..." into a {route: weight} dict."""
+    mix = {}
+    for part in value.split(','):
+        route, _, weight = part.partition('=')
+        route = route.strip()
+        if route not in ROUTES:
+            raise CommandError(f'Unknown route in --mix: {route!r}. Choose from {", ".join(ROUTES)}.')
+        try:
+            mix[route] = float(weight or 1)
+        except ValueError:
+            raise CommandError(f'Invalid weight in --mix for {route}: {weight!r}.')
+        if not 0 <= mix[route] < float('inf'):
+            raise CommandError(f'Weights in --mix must be zero or more, got {weight!r} for {route}.')
+    if not any(mix.values()):
+        raise CommandError('At least one route in --mix needs a positive weight.')
+    return mix
+
+
+def sample_ids(queryset, field, count, rng, rounds=5):
+    """
+    Up to `count` existing values of the integer column `field`, picked at random between
+    its minimum and maximum. Unlike order_by('?'), no query sorts the whole table: each
+    round looks up a batch of random candidates, so gaps in the IDs only cost more rounds.
+    """
+    bounds = queryset.aggregate(low=Min(field), high=Max(field))
+    low, high = bounds['low'], bounds['high']
+    if low is None:
+        return []
+    count = min(count, high - low + 1)
+    found = set()
+    for _ in range(rounds):
+        candidates = {rng.randint(low, high) for _ in range(count - len(found))} - found
+        found.update(queryset.filter(**{f'{field}__in': candidates}).values_list(field, flat=True))
+        if len(found) >= count:
+            break
+    if len(found) < count:
+        # IDs too sparse to hit at random: fill up with the lowest ones, read in index order.
+        for value in queryset.order_by(field).values_list(field, flat=True)[:count]:
+            if len(found) >= count:
+                break
+            found.add(value)
+    return sorted(found)
+
+
+class RequestFactory:
+    """
+    Builds requests for each route from IDs that exist in the seeded database.
+    """
+
+    def __init__(self, base_url, customer_ids, loan_ids, rng):
+        self.base_url = base_url.rstrip('/')
+        self.customer_ids = customer_ids
+        self.loan_ids = loan_ids
+        self.rng = rng
+
+    def build(self, route):
+        customer_id = self.rng.choice(self.customer_ids)
+        if route == 'register':
+            return 'POST', '/register/', {
+                'first_name': 'Bench',
+                'last_name': 'User',
+                'age': self.rng.randint(21, 65),
+                'monthly_income': self.rng.randrange(20000, 200000, 100),
+                'phone_number': f'8{self.rng.randrange(10 ** 9):09d}',
+            }
+        if route in ('check-eligibility', 'create-loan'):
+            return 'POST', f'/{route}/', {
+                'customer_id': customer_id,
+                'loan_amount': self.rng.randrange(10000, 500000, 1000),
+                'interest_rate': round(self.rng.uniform(8, 18), 2),
+                'tenure': self.rng.choice([6, 12, 24, 36, 48, 60]),
+            }
+        if route == 'offers':
+            return 'GET', f'/offers/{customer_id}/?interest_rate={round(self.rng.uniform(8, 18), 2)}', None
+        if route == 'view-loan':
+            return 'GET', f'/view-loan/{self.rng.choice(self.loan_ids)}/', None
+        return 'GET', f'/view-loans/{customer_id}/', None
+
+    def send(self, method, path, body, client_id):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method)
+        request.add_header('Content-Type', 'application/json')
+        request.add_header('X-Client-Id', client_id)
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                return response.status, response.headers.get('X-DB-Query-Count')
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code, error.headers.get('X-DB-Query-Count')
+
+
+def summarize(samples, elapsed):
+    """Latency percentiles (ms), throughput and queries per request for one route."""
+    latencies = np.array([sample[0] for sample in samples]) * 1000
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    query_counts = [sample[2] for sample in samples if sample[2] is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, status, _ in samples if status is None or status >= 500),
+        'statuses': statuses,
+        'rps': round(len(samples) / elapsed, 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 2),
+        'queries_per_request': round(sum(query_counts) / len(query_counts), 2) if query_counts else None,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Return a list of human-readable regressions of `results` against `baseline`.
+    Latency and throughput may drift by `tolerance` (a fraction); query counts may not grow at all.
+    """
+    regressions = []
+    for route, current in results['routes'].items():
+        previous = baseline['routes'].get(route)
+        if not previous:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(f'{route}: {metric} {previous[metric]} -> {current[metric]}')
+        if current['rps'] < previous['rps'] * (1 - tolerance):
+            regressions.append(f'{route}: rps {previous["rps"]} -> {current["rps"]}')
+        if None not in (current['queries_per_request'], previous['queries_per_request']) \
+                and current['queries_per_request'] > previous['queries_per_request']:
+            regressions.append(
+                f'{route}: queries_per_request {previous["queries_per_request"]} -> {current["queries_per_request"]}'
+            )
+    return regressions
+
+
+class Command(BaseCommand):
+    help = (
+        'Drives a weighted mix of API requests against a running server and reports p50/p95/p99 '
+        'latency, requests per second and DB queries per request for each route. Start the server '
+        'against the same seeded database with THROTTLING_ENABLED=False and QUERY_COUNT_HEADER=True.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000/api')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help='Traffic mix as route=weight pairs.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Number of concurrent clients.')
+        parser.add_argument('--duration', type=float, default=30.0, help='Measured run time in seconds.')
+        parser.add_argument('--warmup', type=float, default=3.0, help='Unmeasured warm-up time in seconds.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default='benchmark_results.json', help='Where to write the results JSON.')
+        parser.add_argument('--baseline', help='Results JSON of an earlier run to compare against.')
+        parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed latency/throughput drift before a regression is reported.')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit with an error if any regression is found.')
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        # A sample from every shard.
+        per_shard = 10000 // len(shard_aliases())
+        rng = random.Random(options['seed'])
+        customer_ids, loan_ids = [], []
+        for alias in shard_aliases():
+            customer_ids += sample_ids(Customer.objects.using(alias), 'customer_id', per_shard, rng)
+            loan_ids += sample_ids(Loan.objects.using(alias), 'loan_id', per_shard, rng)
+        if not customer_ids or not loan_ids:
+            raise CommandError('The database has no customers or loans; seed it first with generate_data.')
+
+        routes, weights = list(mix), list(mix.values())
+        samples = {route: [] for route in routes}
+        lock = threading.Lock()
+        started = time.monotonic()
+        measure_from = started + options['warmup']
+        stop_at = measure_from + options['duration']
+
+        def client(index):
+            rng = random.Random(options['seed'] + index)
+            factory = RequestFactory(options['base_url'], customer_ids, loan_ids, rng)
+            client_id = f'benchmark-{index}'
+            while True:
+                now = time.monotonic()
+                if now >= stop_at:
+                    return
+                route = rng.choices(routes, weights)[0]
+                method, path, body = factory.build(route)
+                request_started = time.monotonic()
+                try:
+                    status, query_count = factory.send(method, path, body, client_id)
+                except OSError:
+                    status, query_count = None, None
+                finished = time.monotonic()
+                if request_started >= measure_from:
+                    with lock:
+                        samples[route].append(
+                            (finished - request_started, status, int(query_count) if query_count else None)
+                        )
+
+        self.stdout.write(f'Running {options["concurrency"]} clients for {options["warmup"]}s warm-up + {options["duration"]}s...')
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(client, range(options['concurrency'])))
+
+        all_samples = [sample for route_samples in samples.values() for sample in route_samples]
+        if not all_samples:
+            raise CommandError('No requests completed during the measured window.')
+        results = {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'base_url': options['base_url'],
+                'mix': mix,
+                'concurrency': options['concurrency'],
+                'duration': options['duration'],
+                'seed': options['seed'],
+            },
+            'routes': {
+                route: summarize(route_samples, options['duration'])
+                for route, route_samples in samples.items() if route_samples
+            },
+            'total': summarize(all_samples, options['duration']),
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+
+        self.stdout.write(f'{"route":<20}{"req":>8}{"rps":>10}{"p50":>10}{"p95":>10}{"p99":>10}{"queries":>9}')
+        for route, stats in list(results['routes'].items()) + [('TOTAL', results['total'])]:
+            self.stdout.write(
+                f'{route:<20}{stats["requests"]:>8}{stats["rps"]:>10}{stats["p50_ms"]:>10}'
+                f'{stats["p95_ms"]:>10}{stats["p99_ms"]:>10}{str(stats["queries_per_request"]):>9}'
+            )
+        self.stdout.write(f'Results written to {options["output"]}')
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+            regressions = compare(results, baseline, options['tolerance'])
+            if not regressions:
+                self.stdout.write(self.style.SUCCESS(f'No regressions against {options["baseline"]}.'))
+                return
+            for regression in regressions:
+                self.stdout.write(self.style.WARNING(f'Regression: {regression}'))
+            if options['fail_on_regression']:
+                raise CommandError(f'{len(regressions)} regression(s) against {options["baseline"]}.')
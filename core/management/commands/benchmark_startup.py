@@ -0,0 +1,181 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Customer
+from core.sharding import shard_aliases
+
+# Environment for each startup mode, on top of the current one.
+MODES = {
+    'cold': {'WARM_STARTUP': 'False', 'CONN_MAX_AGE': '0'},
+    'warm': {'WARM_STARTUP': 'True', 'CONN_MAX_AGE': '60'},
+}
+
+
+def timed_get(url, timeout):
+    """(status, seconds) of one GET; status is None if the server could not be reached."""
+    started = time.monotonic()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as error:
+        error.read()
+        status = error.code
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        status = None
+    return status, time.monotonic() - started
+
+
+def process_tree(pid):
+    """`pid` and its direct children, found through /proc (Linux only)."""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The process name may contain spaces; the parent PID is the 2nd field after it.
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if parent == pid:
+            children.append(int(entry))
+    return [pid] + children
+
+
+def proportional_memory_mb(pids):
+    """Summed PSS of `pids` in MB, so pages shared between them are counted once; None off Linux."""
+    total_kb = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                total_kb += next(int(line.split()[1]) for line in f if line.startswith('Pss:'))
+        except (OSError, StopIteration):
+            return None
+    return round(total_kb / 1024, 1)
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures web worker startup: starts gunicorn cold (every worker imports the app, '
+        'connections per request) and warm (preloaded app, persistent connections) and reports '
+        'time to the first response, first-request latency, latency while all workers take their '
+        'first requests, steady-state latency and memory.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+        parser.add_argument('--workers', type=int, default=4, help='Gunicorn workers.')
+        parser.add_argument('--requests', type=int, default=200, help='Sequential requests for steady-state latency.')
+        parser.add_argument('--path', help='Path to request (default: /api/view-loans/<a customer>/).')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--timeout', type=float, default=120.0, help='Seconds to wait for the first response.')
+        parser.add_argument('--json', dest='json_path', help='Also write the results as JSON to this path.')
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 0 or options['requests'] <= 0:
+            raise CommandError('--workers and --requests must be positive.')
+        path = options['path'] or self.default_path()
+        url = f'http://127.0.0.1:{options["port"]}{path}'
+
+        results = {}
+        for mode in options['modes']:
+            self.stdout.write(f'Starting gunicorn {mode} with {options["workers"]} workers...')
+            results[mode] = self.measure(mode, url, options)
+        self.report(results, options['json_path'])
+
+    def default_path(self):
+        for alias in shard_aliases():
+            customer_id = Customer.objects.using(alias).values_list('customer_id', flat=True).first()
+            if customer_id is not None:
+                return f'/api/view-loans/{customer_id}/'
+        raise CommandError('The database has no customers; seed it first with generate_data, or pass --path.')
+
+    def measure(self, mode, url, options):
+        env = {**os.environ, **MODES[mode], 'THROTTLING_ENABLED': 'False'}
+        command = [
+            sys.executable, '-m', 'gunicorn', '-c', str(settings.BASE_DIR / 'gunicorn.conf.py'),
+            '--bind', f'127.0.0.1:{options["port"]}', '--workers', str(options['workers']),
+            'credit_approval_system.wsgi:application',
+        ]
+        with tempfile.TemporaryFile() as log:
+            started = time.monotonic()
+            server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=log, stderr=log)
+            try:
+                return self.run_requests(server, started, url, options)
+            except CommandError:
+                log.seek(0)
+                self.stderr.write(log.read().decode(errors='replace')[-2000:])
+                raise
+            finally:
+                server.send_signal(signal.SIGTERM)
+                try:
+                    server.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+                    server.wait()
+
+    def run_requests(self, server, started, url, options):
+        # Time to the first response. Without preloading the master listens before its
+        # workers have imported the app, so the wait shows up in the first request itself.
+        while True:
+            if server.poll() is not None:
+                raise CommandError(f'gunicorn exited with status {server.returncode}.')
+            if time.monotonic() - started > options['timeout']:
+                raise CommandError(f'No response from {url} within {options["timeout"]}s.')
+            status, first_request = timed_get(url, options['timeout'])
+            if status is not None:
+                break
+            time.sleep(0.01)
+        if status != 200:
+            raise CommandError(f'{url} returned {status}.')
+        first_response = time.monotonic() - started
+
+        # Enough concurrent requests to reach every worker while some may still be starting.
+        with ThreadPoolExecutor(max_workers=options['workers'] * 2) as executor:
+            first_wave = list(executor.map(lambda _: timed_get(url, options['timeout']), range(options['workers'] * 4)))
+        steady = [timed_get(url, options['timeout']) for _ in range(options['requests'])]
+        errors = sum(1 for status, _ in first_wave + steady if status != 200)
+
+        first_wave_ms = np.array([seconds for _, seconds in first_wave]) * 1000
+        steady_ms = np.array([seconds for _, seconds in steady]) * 1000
+        return {
+            'first_response_s': round(first_response, 3),
+            'first_request_ms': round(first_request * 1000, 2),
+            'first_wave_p95_ms': round(float(np.percentile(first_wave_ms, 95)), 2),
+            'steady_p50_ms': round(float(np.percentile(steady_ms, 50)), 2),
+            'steady_p95_ms': round(float(np.percentile(steady_ms, 95)), 2),
+            'memory_pss_mb': proportional_memory_mb(process_tree(server.pid)),
+            'errors': errors,
+        }
+
+    def report(self, results, json_path):
+        columns = [
+            ('first_response_s', 'first response (s)'),
+            ('first_request_ms', 'first request (ms)'),
+            ('first_wave_p95_ms', 'first wave p95 (ms)'),
+            ('steady_p50_ms', 'steady p50 (ms)'),
+            ('steady_p95_ms', 'steady p95 (ms)'),
+            ('memory_pss_mb', 'memory PSS (MB)'),
+            ('errors', 'errors'),
+        ]
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'\n{"mode":<8}' + ''.join(f'{title:>22}' for _, title in columns)
+        ))
+        for mode, result in results.items():
+            self.stdout.write(f'{mode:<8}' + ''.join(f'{str(result[key]):>22}' for key, _ in columns))
+        if json_path:
+            with open(json_path, 'w') as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,122 @@
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.datagen import CSV_DATE_FORMAT, CUSTOMER_COLUMNS, LOAN_COLUMNS, generate
+from core.models import Customer, Loan
+from core.sharding import (
+    allocate_ids, atomic_on_shards, group_by_shard, next_customer_id, raise_id_floor, register_customer_phones,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates synthetic customers and loans for load testing, either as CSV files '
+        'in the ingest_data format or inserted directly into the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=10000, help='Number of customers to generate.')
+        parser.add_argument('--loans-per-customer', type=float, default=4.0, help='Mean number of loans per customer.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed; the same seed reproduces the same data.')
+        parser.add_argument('--format', choices=['csv', 'db'], default='csv', dest='output_format')
+        parser.add_argument('--output-dir', default='.', help='Directory for customer_data.csv and loan_data.csv.')
+        parser.add_argument('--chunk-size', type=int, default=50000, help='Customers generated and written per chunk.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT in db mode.')
+        parser.add_argument('--start-customer-id', type=int, help='First customer ID (db mode default: after the current maximum).')
+        parser.add_argument('--start-loan-id', type=int, help='First loan ID (db mode default: after the current maximum).')
+        parser.add_argument(
+            '--as-of', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(),
+            help='Date (YYYY-MM-DD) the loan history runs up to; defaults to today. Fix it to reproduce data exactly.'
+        )
+
+    def handle(self, *args, **options):
+        if options['customers'] <= 0 or options['chunk_size'] <= 0:
+            raise CommandError('--customers and --chunk-size must be positive.')
+
+        if options['output_format'] == 'db':
+            first_customer_id = options['start_customer_id'] or next_customer_id(count=options['customers'])
+            # The loan count is only known once generated, so write_db raises the counter past each chunk.
+            first_loan_id = options['start_loan_id'] or allocate_ids('loan')
+            write_chunk = self.write_db
+        else:
+            first_customer_id = options['start_customer_id'] or 1
+            first_loan_id = options['start_loan_id'] or 1
+            os.makedirs(options['output_dir'], exist_ok=True)
+            self.customer_path = os.path.join(options['output_dir'], 'customer_data.csv')
+            self.loan_path = os.path.join(options['output_dir'], 'loan_data.csv')
+            write_chunk = self.write_csv
+
+        started = time.monotonic()
+        total_customers = total_loans = 0
+        chunks = generate(
+            seed=options['seed'],
+            num_customers=options['customers'],
+            loans_per_customer=options['loans_per_customer'],
+            chunk_size=options['chunk_size'],
+            first_customer_id=first_customer_id,
+            first_loan_id=first_loan_id,
+            today=options['as_of'],
+        )
+        for index, (customers, loans) in enumerate(chunks):
+            write_chunk(customers, loans, first=index == 0, batch_size=options['batch_size'])
+            total_customers += len(customers)
+            total_loans += len(loans)
+            self.stdout.write(f'{total_customers} customers, {total_loans} loans written...')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {total_customers} customers and {total_loans} loans in {elapsed:.1f}s.'
+        ))
+
+    def write_csv(self, customers, loans, first, batch_size):
+        loans = loans.copy()
+        for column in ('Date of Approval', 'End Date'):
+            loans[column] = loans[column].dt.strftime(CSV_DATE_FORMAT)
+        mode = 'w' if first else 'a'
+        customers[CUSTOMER_COLUMNS].to_csv(self.customer_path, mode=mode, header=first, index=False)
+        loans[LOAN_COLUMNS].to_csv(self.loan_path, mode=mode, header=first, index=False)
+
+    def write_db(self, customers, loans, first, batch_size):
+        # Loans are COMPLETED once every EMI was paid on time, matching ingest_data;
+        # current debt is what remains on ACTIVE loans, matching Customer.update_current_debt.
+        completed = (loans['EMIs paid on Time'] == loans['Tenure']).to_numpy()
+        outstanding = np.where(
+            completed, 0.0,
+            (loans['Tenure'] - loans['EMIs paid on Time']).clip(lower=0) * loans['Monthly payment'],
+        )
+        offsets = (loans['Customer ID'] - customers['Customer ID'].iloc[0]).to_numpy()
+        current_debt = np.bincount(offsets, weights=outstanding, minlength=len(customers))
+
+        customer_objects = [
+            Customer(
+                customer_id=row[0], first_name=row[1], last_name=row[2], age=row[3],
+                phone_number=row[4], monthly_salary=row[5], approved_limit=row[6],
+                current_debt=int(round(debt)),
+            )
+            for row, debt in zip(customers[CUSTOMER_COLUMNS].itertuples(index=False), current_debt)
+        ]
+        loan_objects = [
+            Loan(
+                customer_id=row[0], loan_id=row[1], loan_amount=row[2], tenure=row[3],
+                interest_rate=row[4], monthly_repayment=row[5], emis_paid_on_time=row[6],
+                start_date=row[7].date(), end_date=row[8].date(),
+                status='COMPLETED' if is_completed else 'ACTIVE',
+            )
+            for row, is_completed in zip(loans[LOAN_COLUMNS].itertuples(index=False), completed)
+        ]
+        # Each customer goes to their shard, with their loans.
+        shard_customers = group_by_shard(customer_objects)
+        shard_loans = group_by_shard(loan_objects)
+        with transaction.atomic(), atomic_on_shards(list(shard_customers)):
+            raise_id_floor('customer', int(customers['Customer ID'].max()))
+            if len(loans):
+                raise_id_floor('loan', int(loans['Loan ID'].max()))
+            register_customer_phones(customer_objects, batch_size=batch_size)
+            for alias, objects in shard_customers.items():
+                Customer.objects.using(alias).bulk_create(objects, batch_size=batch_size)
+                Loan.objects.using(alias).bulk_create(shard_loans.get(alias, []), batch_size=batch_size)
@@ -1,10 +1,77 @@
-from django.core.management.base import BaseCommand
-from core.tasks import ingest_data
+import time
+from datetime import timedelta
+
+from celery.result import AsyncResult
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.models import IngestionRun
+from core.tasks import INGEST_BATCH_SIZE, ingest_data
+
+# A RUNNING run that has not checkpointed for this long is assumed to have lost its worker.
+STALE_AFTER = timedelta(minutes=2)
+
 
 class Command(BaseCommand):
     help = 'Ingests customer and loan data from CSV files into the database using a Celery task.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--customer-file', default='customer_data.csv', help='Path as seen by the Celery worker.')
+        parser.add_argument('--loan-file', default='loan_data.csv', help='Path as seen by the Celery worker.')
+        parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE, help='Rows per batch and checkpoint.')
+        parser.add_argument('--resume', type=int, metavar='RUN_ID', help='Resume an interrupted or failed run after its last committed batch.')
+        parser.add_argument('--follow', action='store_true', help='Print progress until the task finishes.')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between progress updates with --follow.')
+
     def handle(self, *args, **options):
-        self.stdout.write('Starting data ingestion task...')
-        task = ingest_data.delay()
-        self.stdout.write(self.style.SUCCESS(f'Data ingestion task queued with ID: {task.id}'))
+        if options['resume'] is not None:
+            run = IngestionRun.objects.filter(pk=options['resume']).first()
+            if run is None:
+                raise CommandError(f'Ingestion run {options["resume"]} does not exist.')
+            if run.status == 'COMPLETED':
+                raise CommandError(f'Ingestion run {run.pk} has already completed.')
+            if run.status == 'RUNNING' and timezone.now() - run.updated_at < STALE_AFTER:
+                raise CommandError(f'Ingestion run {run.pk} checkpointed {run.updated_at:%H:%M:%S} and may still be running.')
+            self.stdout.write(
+                f'Resuming ingestion run {run.pk} at {run.stage}, after {run.rows_done} rows ({run.batches_done} batches)...'
+            )
+        else:
+            if options['batch_size'] <= 0:
+                raise CommandError('--batch-size must be positive.')
+            run = IngestionRun.objects.create(
+                customer_file=options['customer_file'],
+                loan_file=options['loan_file'],
+                batch_size=options['batch_size'],
+            )
+            self.stdout.write('Starting data ingestion task...')
+
+        task = ingest_data.delay(run_id=run.pk)
+        run.task_id = task.id
+        run.save(update_fields=['task_id', 'updated_at'])
+        self.stdout.write(self.style.SUCCESS(f'Data ingestion task queued with ID: {task.id} (run {run.pk})'))
+
+        if options['follow']:
+            self.follow(AsyncResult(task.id), options['poll_interval'])
+
+    def follow(self, result, poll_interval):
+        last = None
+        while not result.ready():
+            if result.state == 'PROGRESS' and result.info != last:
+                last = result.info
+                self.stdout.write(self.format_progress(last))
+            time.sleep(poll_interval)
+        if result.failed():
+            raise CommandError(f'Ingestion failed: {result.result!r}')
+        self.stdout.write(self.style.SUCCESS(str(result.result)))
+
+    def format_progress(self, info):
+        line = f'[{info["stage"]}] {info["rows_done"]}'
+        if info['rows_total']:
+            line += f'/{info["rows_total"]} rows ({info["rows_done"] / info["rows_total"]:.1%})'
+        else:
+            line += ' rows'
+        line += f', batch {info["batches_done"]}, {info["rows_per_second"]:.0f} rows/s'
+        if info['eta_seconds'] is not None:
+            minutes, seconds = divmod(info['eta_seconds'], 60)
+            line += f', ETA {minutes}m{seconds:02d}s'
+        return line
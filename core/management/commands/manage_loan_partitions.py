@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.partitions import (
+    PartitionError, archive_loan_partition, check_archivable, ensure_loan_partitions, list_loan_partitions,
+)
+from core.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    help = 'Lists, creates and archives the yearly partitions of the loans table on every shard (PostgreSQL only).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ensure', action='store_true', help='Create partitions for the current year and the years ahead.')
+        parser.add_argument('--years-ahead', type=int, help='Years after the current one to create with --ensure.')
+        parser.add_argument('--archive', type=int, metavar='YEAR', help='Detach the partition of a fully COMPLETED year.')
+        parser.add_argument('--drop', action='store_true', help='With --archive, drop the partition instead of keeping it as loans_archive_y<YEAR>.')
+        parser.add_argument('--database', action='append', dest='databases', help='Only this shard; repeat for several (default: all).')
+
+    def handle(self, *args, **options):
+        aliases = options['databases'] or shard_aliases()
+        try:
+            if options['archive']:
+                # Archive on every shard or on none, so a year is not half visible.
+                for alias in aliases:
+                    check_archivable(options['archive'], using=alias)
+            for alias in aliases:
+                if len(aliases) > 1:
+                    self.stdout.write(self.style.MIGRATE_HEADING(f'{alias}:'))
+                if options['ensure']:
+                    created = ensure_loan_partitions(options['years_ahead'], using=alias)
+                    self.stdout.write(self.style.SUCCESS(f'Created partitions: {", ".join(created) or "none needed"}'))
+                if options['archive']:
+                    archived = archive_loan_partition(options['archive'], drop=options['drop'], using=alias)
+                    if archived:
+                        self.stdout.write(self.style.SUCCESS(f'Detached partition for {options["archive"]} as {archived}.'))
+                    else:
+                        self.stdout.write(self.style.SUCCESS(f'Dropped partition for {options["archive"]}.'))
+                for name, bound in list_loan_partitions(alias):
+                    self.stdout.write(f'{name}: {bound}')
+        except PartitionError as e:
+            raise CommandError(str(e))
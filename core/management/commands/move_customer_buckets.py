@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.sharding import BUCKETS, move_customer_buckets
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves the customers in a range of hash buckets, with their loans and credit scores, '
+        'to another database. Stop writes to those customers first, and afterwards give the '
+        'range to that database in CUSTOMER_SHARDS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('first', type=int, help='First bucket of the range.')
+        parser.add_argument('last', type=int, help='Bucket after the last one of the range.')
+        parser.add_argument('database', help='Alias of the database that takes the range, e.g. shard_1.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Customers moved per transaction.')
+
+    def handle(self, *args, **options):
+        first, last, target = options['first'], options['last'], options['database']
+        if not 0 <= first < last <= BUCKETS:
+            raise CommandError(f'The range must satisfy 0 <= first < last <= {BUCKETS}.')
+        if target not in settings.DATABASES:
+            raise CommandError(f'Unknown database {target!r}; add its host to SHARD_HOSTS.')
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size must be positive.')
+
+        moved = move_customer_buckets(first, last, target, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Moved {moved} customers in buckets [{first}, {last}) to {target}.'))
+        self.stdout.write(f'Now give buckets [{first}, {last}) to {target} in CUSTOMER_SHARDS and restart the workers.')
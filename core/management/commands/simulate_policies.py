@@ -0,0 +1,170 @@
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.datagen import sample_loan_terms
+from core.policy import DEFAULT_POLICY, CreditPolicy, evaluate_requests, load_customer_snapshots
+
+CUSTOMER_COLUMNS = ('credit_score', 'monthly_salary', 'approved_limit', 'current_debt', 'total_current_emi')
+METRICS = ('requests', 'approved', 'rate_corrected', 'rejected_score', 'rejected_debt', 'rejected_emi_cap',
+           'exposure', 'monthly_emi', 'emi_to_salary')
+
+# Filled in each worker by _init_worker, so the arrays reach a worker once rather than with every task.
+_arrays = {}
+
+
+def _init_worker(arrays):
+    _arrays.update(arrays)
+
+
+def _evaluate_chunk(policies, start, stop):
+    """Evaluate requests [start, stop) under each policy, returning one dict of summed metrics per policy."""
+    customer = _arrays['request_customer'][start:stop]
+    inputs = {name: _arrays[name][customer] for name in CUSTOMER_COLUMNS}
+    requests = {name: _arrays[name][start:stop] for name in ('loan_amount', 'interest_rate', 'tenure')}
+    debt_ok = inputs['current_debt'] <= inputs['approved_limit']
+
+    results = []
+    for policy in policies:
+        approved, rate, emi = evaluate_requests(policy, **inputs, **requests)
+        score_ok = inputs['credit_score'] > policy.low_slab
+        with np.errstate(divide='ignore', invalid='ignore'):
+            emi_to_salary = (inputs['total_current_emi'] + emi) / inputs['monthly_salary']
+        results.append({
+            'requests': stop - start,
+            'approved': int(approved.sum()),
+            'rate_corrected': int((approved & (rate > requests['interest_rate'])).sum()),
+            'rejected_score': int((~score_ok).sum()),
+            'rejected_debt': int((score_ok & ~debt_ok).sum()),
+            'rejected_emi_cap': int((score_ok & debt_ok & ~approved).sum()),
+            'exposure': float(requests['loan_amount'][approved].sum()),
+            'monthly_emi': float(emi[approved].sum()),
+            'emi_to_salary': float(emi_to_salary[approved].sum()),
+        })
+    return results
+
+
+class Command(BaseCommand):
+    help = (
+        'What-if analysis of the eligibility policy: loads every customer once into numpy arrays, '
+        'samples loan requests for them and reports approval rate and exposure for each policy in a '
+        'grid of credit score slabs, minimum corrected rates and EMI-to-salary caps.'
+    )
+
+    def add_arguments(self, parser):
+        grid = parser.add_argument_group('policy grid (each option takes one or more values)')
+        for field in CreditPolicy._fields:
+            grid.add_argument(
+                f'--{field.replace("_", "-")}', dest=field, type=float, nargs='+',
+                default=[getattr(DEFAULT_POLICY, field)],
+                help=f'Default: {getattr(DEFAULT_POLICY, field)}.'
+            )
+        parser.add_argument('--requests', type=int, help='Loan requests to sample (default: one per customer).')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the sampled requests.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes.')
+        parser.add_argument('--chunk-size', type=int, default=500000, help='Requests per task.')
+        parser.add_argument('--json', dest='json_path', help='Also write the results as JSON to this path.')
+
+    def handle(self, *args, **options):
+        policies = [DEFAULT_POLICY] + [
+            policy for policy in map(CreditPolicy._make, itertools.product(*(options[field] for field in CreditPolicy._fields)))
+            if policy != DEFAULT_POLICY
+        ]
+        invalid = [policy for policy in policies if not policy.is_valid()]
+        if invalid:
+            raise CommandError(f'Slabs must satisfy high >= mid >= low and the EMI cap must be positive: {invalid[0]}')
+        if options['chunk_size'] <= 0 or options['workers'] <= 0:
+            raise CommandError('--chunk-size and --workers must be positive.')
+
+        started = time.monotonic()
+        snapshots = load_customer_snapshots()
+        num_customers = len(snapshots['customer_id'])
+        if not num_customers:
+            raise CommandError('No customers found; load data first with ingest_data or generate_data.')
+        self.stdout.write(f'Loaded {num_customers} customers in {time.monotonic() - started:.1f}s.')
+
+        rng = np.random.default_rng(options['seed'])
+        if options['requests'] is None:
+            request_customer = np.arange(num_customers)
+        else:
+            request_customer = rng.integers(0, num_customers, size=options['requests'])
+        loan_amount, interest_rate, tenure = sample_loan_terms(rng, snapshots['monthly_salary'][request_customer])
+        arrays = {name: snapshots[name] for name in CUSTOMER_COLUMNS}
+        arrays.update(
+            request_customer=request_customer,
+            loan_amount=loan_amount.astype(np.float64),
+            interest_rate=interest_rate,
+            tenure=tenure,
+        )
+
+        started = time.monotonic()
+        totals = self.evaluate(policies, arrays, options['workers'], options['chunk_size'])
+        num_requests = len(request_customer)
+        self.stdout.write(
+            f'Evaluated {len(policies)} policies x {num_requests} requests in {time.monotonic() - started:.1f}s '
+            f'with {options["workers"]} workers.'
+        )
+        self.report(policies, totals, options['json_path'])
+
+    def evaluate(self, policies, arrays, workers, chunk_size):
+        num_requests = len(arrays['request_customer'])
+        bounds = [(start, min(start + chunk_size, num_requests)) for start in range(0, num_requests, chunk_size)]
+        totals = [dict.fromkeys(METRICS, 0) for _ in policies]
+        # Workers are forked and never touch the database; don't let them inherit open connections.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(bounds)),
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_worker,
+            initargs=(arrays,),
+        ) as executor:
+            futures = [executor.submit(_evaluate_chunk, policies, start, stop) for start, stop in bounds]
+            for future in futures:
+                for total, result in zip(totals, future.result()):
+                    for metric in METRICS:
+                        total[metric] += result[metric]
+        return totals
+
+    def report(self, policies, totals, json_path):
+        baseline = totals[0]
+        rows = []
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'\n{"slabs":<14}{"min rates":<13}{"EMI cap":>8}{"approval":>11}{"vs default":>12}'
+            f'{"corrected":>11}{"exposure":>18}{"vs default":>12}{"new EMI/month":>16}{"EMI/salary":>12}'
+        ))
+        for policy, total in zip(policies, totals):
+            approved = total['approved']
+            row = {
+                'policy': policy._asdict(),
+                'approval_rate': approved / total['requests'],
+                'rate_corrected_share': total['rate_corrected'] / approved if approved else 0.0,
+                'exposure': total['exposure'],
+                'monthly_emi': total['monthly_emi'],
+                'mean_emi_to_salary': total['emi_to_salary'] / approved if approved else 0.0,
+                **{metric: total[metric] for metric in ('requests', 'approved', 'rejected_score', 'rejected_debt', 'rejected_emi_cap')},
+            }
+            rows.append(row)
+            approval_change = (approved - baseline['approved']) / total['requests'] * 100
+            exposure_change = (total['exposure'] / baseline['exposure'] - 1) * 100 if baseline['exposure'] else 0.0
+            self.stdout.write(
+                f'{f"{policy.high_slab:g}/{policy.mid_slab:g}/{policy.low_slab:g}":<14}'
+                f'{f"{policy.mid_min_rate:g}%/{policy.low_min_rate:g}%":<13}'
+                f'{policy.emi_cap:>8.0%}'
+                f'{row["approval_rate"]:>11.2%}{approval_change:>+11.2f}pp'
+                f'{row["rate_corrected_share"]:>11.1%}{row["exposure"]:>18,.0f}{exposure_change:>+11.1f}%'
+                f'{row["monthly_emi"]:>16,.0f}{row["mean_emi_to_salary"]:>12.1%}'
+            )
+        self.stdout.write(
+            '\nThe first row is the current policy. "corrected" is the share of approvals given a higher '
+            'minimum rate; "EMI/salary" is the mean share of salary going to EMIs after approval.'
+        )
+        if json_path:
+            with open(json_path, 'w') as f:
+                json.dump(rows, f, indent=2)
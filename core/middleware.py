@@ -0,0 +1,111 @@
+import logging
+import time
+import uuid
+from contextlib import ExitStack
+
+import redis
+from django.conf import settings
+from django.db import connections
+from django.http import JsonResponse
+
+from .redis_client import get_redis
+from .throttling import get_route_name
+
+logger = logging.getLogger(__name__)
+
+# Counting semaphore shared by all web workers. Slots older than the timeout belong to
+# requests whose worker died without releasing them and are reclaimed.
+ACQUIRE_SLOT_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local now = tonumber(ARGV[2])
+local timeout = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - timeout)
+if redis.call('ZCARD', KEYS[1]) < limit then
+    redis.call('ZADD', KEYS[1], now, ARGV[4])
+    redis.call('EXPIRE', KEYS[1], math.ceil(timeout))
+    return 1
+end
+return 0
+"""
+
+
+class LoadSheddingMiddleware:
+    """
+    Rejects requests with 503 and a Retry-After header once a route already has
+    `settings.MAX_CONCURRENT_REQUESTS[<route name>]` requests in flight across all
+    workers, so bursts are shed before they pile up as queries in Postgres.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            slot = getattr(request, '_load_shedding_slot', None)
+            if slot is not None:
+                self.release(*slot)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route = get_route_name(request)
+        limit = settings.MAX_CONCURRENT_REQUESTS.get(route)
+        if not limit:
+            return None
+
+        key = f'inflight:{route}'
+        token = uuid.uuid4().hex
+        try:
+            acquired = get_redis().eval(
+                ACQUIRE_SLOT_SCRIPT, 1, key, limit, time.time(),
+                settings.LOAD_SHEDDING_SLOT_TIMEOUT, token
+            )
+        except redis.RedisError:
+            logger.warning('Load shedding unavailable, allowing request to %s', route, exc_info=True)
+            return None
+
+        if not acquired:
+            response = JsonResponse(
+                {'error': 'Server is busy, please retry later.'},
+                status=503
+            )
+            response['Retry-After'] = str(settings.LOAD_SHEDDING_RETRY_AFTER)
+            return response
+
+        request._load_shedding_slot = (key, token)
+        return None
+
+    def release(self, key, token):
+        try:
+            get_redis().zrem(key, token)
+        except redis.RedisError:
+            # The slot expires on its own after LOAD_SHEDDING_SLOT_TIMEOUT.
+            logger.warning('Could not release load shedding slot %s', key, exc_info=True)
+
+
+class QueryCountMiddleware:
+    """
+    Adds an X-DB-Query-Count header with the number of SQL queries a request ran,
+    for the benchmark_api command. Enabled with settings.QUERY_COUNT_HEADER.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_COUNT_HEADER:
+            return self.get_response(request)
+
+        count = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal count
+            count += 1
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count_query))
+            response = self.get_response(request)
+        response['X-DB-Query-Count'] = str(count)
+        return response
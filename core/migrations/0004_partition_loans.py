@@ -0,0 +1,95 @@
+"""
+Rebuilds `loans` as a PostgreSQL table range-partitioned by year of `start_date`.
+
+PostgreSQL requires the partition key in every unique constraint, so the primary
+key becomes (loan_id, start_date); the model still treats loan_id as its primary
+key, and 0006 keeps it unique across partitions. Indexes and foreign keys are recreated
+under their existing names so later migrations can refer to them. The Django model
+state does not change, and on other databases this migration does nothing.
+"""
+import re
+from datetime import date
+
+from django.db import migrations
+
+# Years after the current one to create up front; core.partitions keeps this going.
+YEARS_AHEAD = 2
+
+
+def _secondary_definitions(cursor, table):
+    """CREATE INDEX and ADD CONSTRAINT FOREIGN KEY statements for `table`, minus the primary key."""
+    cursor.execute(
+        """
+        SELECT indexdef FROM pg_indexes
+        WHERE tablename = %s AND indexname NOT IN (
+            SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'
+        )
+        """,
+        [table, table],
+    )
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute(
+        """
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f'
+        """,
+        [table],
+    )
+    foreign_keys = cursor.fetchall()
+    return indexes, foreign_keys
+
+
+def _rebuild(schema_editor, partitioned):
+    old_table = 'loans_partitioned' if not partitioned else 'loans_unpartitioned'
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE loans RENAME TO {old_table}')
+        indexes, foreign_keys = _secondary_definitions(cursor, old_table)
+        cursor.execute(f'ALTER TABLE {old_table} DROP CONSTRAINT loans_pkey')
+        for name, _ in foreign_keys:
+            cursor.execute(f'ALTER TABLE {old_table} DROP CONSTRAINT {name}')
+
+        partition_clause = ' PARTITION BY RANGE (start_date)' if partitioned else ''
+        cursor.execute(
+            f'CREATE TABLE loans (LIKE {old_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS){partition_clause}'
+        )
+        if partitioned:
+            cursor.execute(f'SELECT EXTRACT(YEAR FROM MIN(start_date))::int FROM {old_table}')
+            current_year = date.today().year
+            first_year = min(cursor.fetchone()[0] or current_year, current_year)
+            for year in range(first_year, current_year + YEARS_AHEAD + 1):
+                cursor.execute(
+                    f'CREATE TABLE loans_y{year} PARTITION OF loans FOR VALUES FROM (%s) TO (%s)',
+                    [date(year, 1, 1), date(year + 1, 1, 1)],
+                )
+            cursor.execute('CREATE TABLE loans_default PARTITION OF loans DEFAULT')
+
+        cursor.execute(f'INSERT INTO loans SELECT * FROM {old_table}')
+        cursor.execute(f'DROP TABLE {old_table} CASCADE')
+
+        primary_key = '(loan_id, start_date)' if partitioned else '(loan_id)'
+        cursor.execute(f'ALTER TABLE loans ADD CONSTRAINT loans_pkey PRIMARY KEY {primary_key}')
+        for definition in indexes:
+            cursor.execute(re.sub(rf' ON (ONLY )?((\S+\.)?){old_table} ', r' ON \2loans ', definition, count=1))
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE loans ADD CONSTRAINT {name} {definition}')
+
+
+def partition_loans(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        _rebuild(schema_editor, partitioned=True)
+
+
+def unpartition_loans(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        _rebuild(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_alter_customer_current_debt'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_loans, unpartition_loans),
+    ]
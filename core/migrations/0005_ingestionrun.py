@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-19 03:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_partition_loans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('customer_file', models.CharField(max_length=255)),
+                ('loan_file', models.CharField(max_length=255)),
+                ('batch_size', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('COMPLETED', 'Completed'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('stage', models.CharField(choices=[('customers', 'Customers'), ('loans', 'Loans')], default='customers', max_length=10)),
+                ('customer_rows_total', models.PositiveIntegerField(blank=True, null=True)),
+                ('loan_rows_total', models.PositiveIntegerField(blank=True, null=True)),
+                ('customer_rows_done', models.PositiveIntegerField(default=0)),
+                ('loan_rows_done', models.PositiveIntegerField(default=0)),
+                ('batches_done', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'ingestion_runs',
+            },
+        ),
+    ]
@@ -0,0 +1,107 @@
+"""
+Keeps loan_id unique across the partitions of `loans` and allocates new loan IDs
+from one counter.
+
+Partitioning (0004) made the primary key (loan_id, start_date), so on its own
+PostgreSQL would accept the same loan_id in two different years. Every loan_id
+is now also recorded in `loan_ids`, whose primary key rejects duplicates. A
+trigger keeps the table in step with inserts, deletes and loan_id updates, so a
+second row with an existing loan_id fails with an IntegrityError whatever its
+partition. Partitions that are detached for archiving keep their IDs reserved.
+
+The model state gains the composite key as a constraint. On other databases
+loan_id is still the whole primary key, and only the IdSequence table is created.
+"""
+from django.db import migrations, models, router
+
+REGISTER_LOAN_ID = """
+CREATE FUNCTION loans_register_loan_id() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        DELETE FROM loan_ids WHERE loan_id = OLD.loan_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO loan_ids (loan_id) VALUES (NEW.loan_id);
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+
+CLEAR_LOAN_IDS = """
+CREATE FUNCTION loans_clear_loan_ids() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    TRUNCATE loan_ids;
+    RETURN NULL;
+END
+$$
+"""
+
+
+def add_loan_id_registry(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('CREATE TABLE loan_ids (loan_id integer PRIMARY KEY)')
+        # Fails if the table already holds duplicates, which then need resolving by hand.
+        cursor.execute('INSERT INTO loan_ids (loan_id) SELECT loan_id FROM loans')
+        cursor.execute(REGISTER_LOAN_ID)
+        cursor.execute(
+            'CREATE TRIGGER loans_loan_id_unique AFTER INSERT OR DELETE OR UPDATE OF loan_id ON loans '
+            'FOR EACH ROW EXECUTE FUNCTION loans_register_loan_id()'
+        )
+        # Row triggers do not fire on TRUNCATE. Truncating a single partition is not covered.
+        cursor.execute(CLEAR_LOAN_IDS)
+        cursor.execute(
+            'CREATE TRIGGER loans_loan_ids_truncate AFTER TRUNCATE ON loans '
+            'FOR EACH STATEMENT EXECUTE FUNCTION loans_clear_loan_ids()'
+        )
+
+
+def remove_loan_id_registry(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP TRIGGER loans_loan_ids_truncate ON loans')
+        cursor.execute('DROP FUNCTION loans_clear_loan_ids()')
+        cursor.execute('DROP TRIGGER loans_loan_id_unique ON loans')
+        cursor.execute('DROP FUNCTION loans_register_loan_id()')
+        cursor.execute('DROP TABLE loan_ids')
+
+
+def create_loan_sequence(apps, schema_editor):
+    IdSequence = apps.get_model('core', 'IdSequence')
+    if not router.allow_migrate_model(schema_editor.connection.alias, IdSequence):
+        return
+    # Migration 0009 raises the counter past the loan IDs already stored.
+    IdSequence.objects.using(schema_editor.connection.alias).create(name='loan', last_value=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_ingestionrun'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_loan_id_registry, remove_loan_id_registry),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='loan',
+                    constraint=models.UniqueConstraint(fields=('loan_id', 'start_date'), name='loans_pkey'),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('name', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'id_sequences',
+            },
+        ),
+        migrations.RunPython(create_loan_sequence, migrations.RunPython.noop),
+    ]
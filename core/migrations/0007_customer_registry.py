@@ -0,0 +1,64 @@
+"""
+Registers every customer's phone number in `customer_phones` on 'default' and adds
+the 'customer' IdSequence counter, so registration no longer checks every shard.
+
+Each database registers the phone numbers of its own customers as it is migrated,
+so 'default' must be migrated before the shards (as the entrypoint does). When two
+shards already hold the same phone number, the first one migrated keeps it.
+"""
+from django.db import migrations, models, router
+
+BATCH_SIZE = 5000
+
+
+def register_phone_numbers(apps, schema_editor):
+    Customer = apps.get_model('core', 'Customer')
+    CustomerPhone = apps.get_model('core', 'CustomerPhone')
+    alias = schema_editor.connection.alias
+    if not router.allow_migrate_model(alias, Customer):
+        return
+    phones = Customer.objects.using(alias).values_list('phone_number', 'customer_id').order_by('customer_id')
+    batch = []
+    for phone_number, customer_id in phones.iterator(chunk_size=BATCH_SIZE):
+        batch.append(CustomerPhone(phone_number=phone_number, customer_id=customer_id))
+        if len(batch) == BATCH_SIZE:
+            CustomerPhone.objects.using('default').bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    CustomerPhone.objects.using('default').bulk_create(batch, ignore_conflicts=True)
+
+
+def create_customer_sequence(apps, schema_editor):
+    IdSequence = apps.get_model('core', 'IdSequence')
+    if not router.allow_migrate_model(schema_editor.connection.alias, IdSequence):
+        return
+    # Migration 0009 raises the counter past the customer IDs already stored.
+    IdSequence.objects.using(schema_editor.connection.alias).create(name='customer', last_value=0)
+
+
+def delete_customer_sequence(apps, schema_editor):
+    IdSequence = apps.get_model('core', 'IdSequence')
+    if not router.allow_migrate_model(schema_editor.connection.alias, IdSequence):
+        return
+    IdSequence.objects.using(schema_editor.connection.alias).filter(name='customer').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_loan_id_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerPhone',
+            fields=[
+                ('phone_number', models.CharField(max_length=15, primary_key=True, serialize=False)),
+                ('customer_id', models.IntegerField(db_index=True)),
+            ],
+            options={
+                'db_table': 'customer_phones',
+            },
+        ),
+        migrations.RunPython(register_phone_numbers, migrations.RunPython.noop),
+        migrations.RunPython(create_customer_sequence, delete_customer_sequence),
+    ]
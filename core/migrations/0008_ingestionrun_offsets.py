@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-19 04:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_customer_registry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionrun',
+            name='customer_offset',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingestionrun',
+            name='loan_offset',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,32 @@
+"""
+Raises the 'customer' and 'loan' IdSequence counters past the IDs already stored, so
+allocation can take the counter alone instead of also reading the highest ID on
+every shard. From here on, whatever writes rows with IDs of its own raises them.
+
+Each database raises the counters on 'default' for its own rows as it is migrated,
+so 'default' must be migrated before the shards (as the entrypoint does).
+"""
+from django.db import migrations
+from django.db.models import Max
+
+
+def raise_id_counters(apps, schema_editor):
+    Customer = apps.get_model('core', 'Customer')
+    Loan = apps.get_model('core', 'Loan')
+    IdSequence = apps.get_model('core', 'IdSequence')
+    alias = schema_editor.connection.alias
+    for name, model, field in (('customer', Customer, 'customer_id'), ('loan', Loan, 'loan_id')):
+        last_id = model.objects.using(alias).aggregate(last_id=Max(field))['last_id']
+        if last_id is not None:
+            IdSequence.objects.using('default').filter(name=name, last_value__lt=last_id).update(last_value=last_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_ingestionrun_offsets'),
+    ]
+
+    operations = [
+        migrations.RunPython(raise_id_counters, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,18 @@
 from django.db import models
+from django.db.models import ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Greatest
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 import math
 
 
+# SQL equivalent of Loan.outstanding_amount for ACTIVE loans: remaining EMIs * monthly repayment.
+OUTSTANDING_AMOUNT = ExpressionWrapper(
+    Greatest(F('tenure') - F('emis_paid_on_time'), Value(0)) * F('monthly_repayment'),
+    output_field=models.DecimalField(max_digits=16, decimal_places=2)
+)
+
+
 class Customer(models.Model):
     customer_id = models.IntegerField(primary_key=True)
     first_name = models.CharField(max_length=100)
@@ -43,8 +52,8 @@ class Customer(models.Model):
         """
         Calculate and update the customer's current debt based on active loans.
         """
-        total_debt = sum(loan.outstanding_amount for loan in self.loans.filter(status='ACTIVE'))
-        self.current_debt = total_debt
+        total_debt = self.loans.filter(status='ACTIVE').aggregate(total=Sum(OUTSTANDING_AMOUNT))['total']
+        self.current_debt = total_debt or 0
         self.save(update_fields=['current_debt', 'updated_at'])
 
     def save(self, *args, **kwargs):
@@ -99,6 +108,12 @@ class Loan(models.Model):
             models.Index(fields=['start_date', 'end_date']),
             models.Index(fields=['loan_id']),
         ]
+        # On PostgreSQL the table is partitioned by start_date (migration 0004), which makes
+        # the primary key (loan_id, start_date). loan_id itself stays unique across partitions
+        # through the loan_ids table that migration 0006 checks every insert against.
+        constraints = [
+            models.UniqueConstraint(fields=['loan_id', 'start_date'], name='loans_pkey'),
+        ]
 
     def __str__(self):
         return f"Loan {self.loan_id} - {self.customer.full_name} - ₹{self.loan_amount}"
@@ -167,3 +182,88 @@ class CreditScore(models.Model):
 
     def __str__(self):
         return f"{self.customer.full_name} - Credit Score: {self.score}"
+
+
+class IngestionRun(models.Model):
+    """
+    Progress of one ingest_data run. The checkpoint (stage, rows done and byte offset
+    reached in that stage's file, and batches done) is saved in the same transaction
+    as each batch, so a restarted run seeks straight past the last committed batch.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
+    STAGE_CHOICES = [
+        ('customers', 'Customers'),
+        ('loans', 'Loans'),
+    ]
+
+    task_id = models.CharField(max_length=255, blank=True, db_index=True)
+    customer_file = models.CharField(max_length=255)
+    loan_file = models.CharField(max_length=255)
+    batch_size = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    stage = models.CharField(max_length=10, choices=STAGE_CHOICES, default='customers')
+    customer_rows_total = models.PositiveIntegerField(null=True, blank=True)
+    loan_rows_total = models.PositiveIntegerField(null=True, blank=True)
+    customer_rows_done = models.PositiveIntegerField(default=0)
+    loan_rows_done = models.PositiveIntegerField(default=0)
+    # Byte offsets just after the last committed row of each file; 0 before the first batch.
+    customer_offset = models.BigIntegerField(default=0)
+    loan_offset = models.BigIntegerField(default=0)
+    batches_done = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'ingestion_runs'
+
+    def __str__(self):
+        return f"Ingestion run {self.pk} ({self.status})"
+
+    @property
+    def rows_done(self):
+        return self.customer_rows_done + self.loan_rows_done
+
+    @property
+    def rows_total(self):
+        """Rows in both files, or None until both have been counted."""
+        if self.customer_rows_total is None or self.loan_rows_total is None:
+            return None
+        return self.customer_rows_total + self.loan_rows_total
+
+
+class IdSequence(models.Model):
+    """
+    The last customer or loan ID handed out, one row per name. It lives on 'default'
+    only, so every shard allocates from the same counter (see core.sharding.allocate_ids).
+    Rows written with IDs of their own raise it (core.sharding.raise_id_floor).
+    """
+    name = models.CharField(max_length=20, primary_key=True)
+    last_value = models.BigIntegerField(default=0)
+
+    class Meta:
+        db_table = 'id_sequences'
+
+    def __str__(self):
+        return f"{self.name}: {self.last_value}"
+
+
+class CustomerPhone(models.Model):
+    """
+    The phone number of every customer on any shard. It lives on 'default' only, so
+    its primary key keeps phone numbers unique across shards.
+    """
+    phone_number = models.CharField(max_length=15, primary_key=True)
+    customer_id = models.IntegerField(db_index=True)
+
+    class Meta:
+        db_table = 'customer_phones'
+
+    def __str__(self):
+        return f"{self.phone_number}: {self.customer_id}"
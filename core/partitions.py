@@ -0,0 +1,145 @@
+"""
+Maintenance of the yearly range partitions of the `loans` table (PostgreSQL only).
+
+Migration 0004 turns `loans` into a table partitioned by `start_date`, with one
+partition per calendar year (`loans_y2024`) and a `loans_default` partition for
+anything outside them. These helpers create partitions ahead of time and detach
+old, fully COMPLETED years. They work on one database; with customer shards the
+callers run them on each shard.
+"""
+from datetime import date
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .snapshots import publish_customer_change
+
+PARENT_TABLE = 'loans'
+DEFAULT_PARTITION = 'loans_default'
+# Every loan_id in `loans`, kept by a trigger so IDs are unique across partitions (migration 0006).
+LOAN_ID_TABLE = 'loan_ids'
+
+
+class PartitionError(Exception):
+    pass
+
+
+def partition_name(year):
+    return f'{PARENT_TABLE}_y{year}'
+
+
+def archive_name(year):
+    return f'{PARENT_TABLE}_archive_y{year}'
+
+
+def _check_postgresql(connection):
+    if connection.vendor != 'postgresql':
+        raise PartitionError('Loan partitioning is only available on PostgreSQL.')
+
+
+def list_loan_partitions(using='default'):
+    """
+    Return [(partition name, bound expression)] for the partitions attached to `loans`.
+    """
+    connection = connections[using]
+    _check_postgresql(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s
+            ORDER BY child.relname
+            """,
+            [PARENT_TABLE],
+        )
+        return cursor.fetchall()
+
+
+def create_loan_partition(year, using='default'):
+    """
+    Create the partition for `year` if it does not exist yet. Rows for that year
+    that already landed in the default partition are moved into it.
+    Returns True if a partition was created.
+    """
+    connection = connections[using]
+    _check_postgresql(connection)
+    name = partition_name(year)
+    if name in {partition for partition, _ in list_loan_partitions(using)}:
+        return False
+
+    lower, upper = date(year, 1, 1), date(year + 1, 1, 1)
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        # A new range partition cannot be attached while the default partition holds
+        # rows in that range, so take the default out while the rows are moved.
+        cursor.execute(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}')
+        cursor.execute(
+            f'CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES FROM (%s) TO (%s)',
+            [lower, upper],
+        )
+        # The detached partition has no loan_id trigger, so release the moved IDs by hand
+        # before inserting registers them again.
+        cursor.execute(
+            f'DELETE FROM {LOAN_ID_TABLE} WHERE loan_id IN '
+            f'(SELECT loan_id FROM {DEFAULT_PARTITION} WHERE start_date >= %s AND start_date < %s)',
+            [lower, upper],
+        )
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE start_date >= %s AND start_date < %s RETURNING *) '
+            f'INSERT INTO {PARENT_TABLE} SELECT * FROM moved',
+            [lower, upper],
+        )
+        cursor.execute(f'ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT')
+    return True
+
+
+def ensure_loan_partitions(years_ahead=None, using='default'):
+    """
+    Make sure partitions exist for the current year and `years_ahead` years after it
+    (settings.LOAN_PARTITIONS_AHEAD by default). Returns the names of created partitions.
+    """
+    if years_ahead is None:
+        years_ahead = settings.LOAN_PARTITIONS_AHEAD
+    current_year = timezone.now().year
+    return [
+        partition_name(year)
+        for year in range(current_year, current_year + years_ahead + 1)
+        if create_loan_partition(year, using)
+    ]
+
+
+def check_archivable(year, using='default'):
+    """Raise PartitionError unless the partition for `year` exists and all its loans are COMPLETED."""
+    connection = connections[using]
+    _check_postgresql(connection)
+    name = partition_name(year)
+    if name not in {partition for partition, _ in list_loan_partitions(using)}:
+        raise PartitionError(f'Partition {name} does not exist.')
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {name} WHERE status <> 'COMPLETED')")
+        if cursor.fetchone()[0]:
+            raise PartitionError(f'Partition {name} still has loans that are not COMPLETED.')
+
+
+def archive_loan_partition(year, drop=False, using='default'):
+    """
+    Detach the partition for `year` from `loans` and rename it to loans_archive_y<year>,
+    or drop it entirely with `drop=True`. Only years whose loans are all COMPLETED can be
+    archived. Archived loans no longer count towards credit scores or appear in the API;
+    their IDs stay reserved in loan_ids.
+    """
+    connection = connections[using]
+    name = partition_name(year)
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        check_archivable(year, using)
+        cursor.execute(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}')
+        # Archived loans no longer count towards credit scores.
+        publish_customer_change(using=using)
+        if drop:
+            cursor.execute(f'DROP TABLE {name}')
+            return None
+        cursor.execute(f'ALTER TABLE {name} RENAME TO {archive_name(year)}')
+    return archive_name(year)
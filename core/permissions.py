@@ -0,0 +1,27 @@
+import hmac
+
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+
+def export_api_key(request):
+    """The X-Api-Key header if it is one of `settings.EXPORT_API_KEYS`, else None."""
+    api_key = request.META.get('HTTP_X_API_KEY')
+    if not api_key:
+        return None
+    if any(hmac.compare_digest(api_key.encode(), key.encode()) for key in settings.EXPORT_API_KEYS):
+        return api_key
+    return None
+
+
+class IsStaffOrExportApiKey(BasePermission):
+    """
+    Allows staff users, and clients sending one of `settings.EXPORT_API_KEYS` in the
+    X-Api-Key header.
+    """
+    message = 'Exporting loans needs a staff user or a valid X-Api-Key header.'
+
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        return export_api_key(request) is not None
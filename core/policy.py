@@ -0,0 +1,200 @@
+"""
+The credit policy behind check-eligibility and create-loan, and a vectorized
+version of it for evaluating many loan requests against candidate policies.
+"""
+from typing import NamedTuple
+
+import numpy as np
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .datagen import monthly_emi
+from .models import Customer
+from .sharding import shard_aliases
+
+
+class CreditPolicy(NamedTuple):
+    """
+    Scores above `high_slab` keep the requested rate, scores in (mid_slab, high_slab]
+    pay at least `mid_min_rate`, scores in (low_slab, mid_slab] at least `low_min_rate`,
+    and scores up to `low_slab` are rejected. All current EMIs plus the new one must
+    not exceed `emi_cap` times the monthly salary.
+    """
+    high_slab: float = 50
+    mid_slab: float = 30
+    low_slab: float = 10
+    mid_min_rate: float = 12.0
+    low_min_rate: float = 16.0
+    emi_cap: float = 0.5
+
+    def is_valid(self):
+        return self.high_slab >= self.mid_slab >= self.low_slab and 0 < self.emi_cap
+
+
+DEFAULT_POLICY = CreditPolicy()
+
+
+def credit_scores(approved_limit, total_emis_paid_on_time, total_tenure, num_loans, current_year_loans, total_loan_volume):
+    """Vectorized calculate_credit_score over arrays of per-customer loan summaries."""
+    # Limits are loaded as int32; doubling one above 2**30 would wrap around.
+    approved_limit = np.asarray(approved_limit, dtype=np.int64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payment_ratio = np.where(total_tenure > 0, total_emis_paid_on_time / total_tenure, 1.0)
+    score = np.floor(payment_ratio * 30)
+    score += np.minimum(num_loans * 5, 20)
+    score += np.maximum(15 - current_year_loans * 5, 0)
+    score += np.select(
+        [total_loan_volume > approved_limit * 2, total_loan_volume > approved_limit],
+        [0, 15],
+        35,
+    )
+    return np.clip(score, 0, 100).astype(np.int16)
+
+
+def _columns(rows, dtypes):
+    """Turn a list of row tuples into one numpy array per column."""
+    return [np.array(column, dtype=dtype) for column, dtype in zip(zip(*rows), dtypes)]
+
+
+def load_customer_snapshots(using=None, chunk_size=100000):
+    """
+    Read every customer with the loan summary the eligibility rules need, in one
+    grouped query per shard (or only the `using` database) streamed in chunks, into
+    compact numpy columns ordered by customer_id: customer_id, monthly_salary,
+    approved_limit, current_debt, total_current_emi and credit_score.
+    """
+    if using is None:
+        shards = [load_customer_snapshots(alias, chunk_size) for alias in shard_aliases()]
+        if len(shards) == 1:
+            return shards[0]
+        order = np.argsort(np.concatenate([shard['customer_id'] for shard in shards]), kind='stable')
+        return {name: np.concatenate([shard[name] for shard in shards])[order] for name in shards[0]}
+
+    decimal = DecimalField(max_digits=16, decimal_places=2)
+    rows = (
+        Customer.objects.using(using)
+        .order_by('customer_id')
+        .values_list('customer_id', 'monthly_salary', 'approved_limit', 'current_debt')
+        .annotate(
+            total_emis_paid_on_time=Coalesce(Sum('loans__emis_paid_on_time'), 0),
+            total_tenure=Coalesce(Sum('loans__tenure'), 0),
+            num_loans=Count('loans'),
+            current_year_loans=Count('loans', filter=Q(loans__start_date__year=timezone.now().year)),
+            total_loan_volume=Coalesce(Sum('loans__loan_amount'), Value(0), output_field=decimal),
+            total_current_emi=Coalesce(
+                Sum('loans__monthly_repayment', filter=Q(loans__status='ACTIVE')), Value(0), output_field=decimal
+            ),
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    dtypes = [np.int64, np.int32, np.int32, np.int32, np.int32, np.int32, np.int32, np.int32, np.float64, np.float64]
+    chunks, chunk = [], []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            chunks.append(_columns(chunk, dtypes))
+            chunk = []
+    if chunk:
+        chunks.append(_columns(chunk, dtypes))
+    (
+        customer_id, monthly_salary, approved_limit, current_debt, total_emis_paid_on_time,
+        total_tenure, num_loans, current_year_loans, total_loan_volume, total_current_emi,
+    ) = [
+        np.concatenate([columns[index] for columns in chunks]) if chunks else np.array([], dtype=dtype)
+        for index, dtype in enumerate(dtypes)
+    ]
+
+    return {
+        'customer_id': customer_id,
+        'monthly_salary': monthly_salary,
+        'approved_limit': approved_limit,
+        'current_debt': current_debt,
+        'total_current_emi': total_current_emi,
+        'credit_score': credit_scores(
+            approved_limit, total_emis_paid_on_time, total_tenure, num_loans, current_year_loans, total_loan_volume
+        ),
+    }
+
+
+def evaluate_requests(policy, credit_score, monthly_salary, approved_limit, current_debt, total_current_emi,
+                      loan_amount, interest_rate, tenure):
+    """
+    Apply `policy` to loan requests given as aligned arrays, one element per request.
+    Returns (approved, corrected interest rate, monthly installment) arrays; the
+    installments are not rounded, so the EMI cap is checked on the exact amount.
+    Customers whose current debt exceeds their approved limit are rejected.
+    """
+    rate = np.where(
+        (credit_score > policy.mid_slab) & (credit_score <= policy.high_slab),
+        np.maximum(interest_rate, policy.mid_min_rate),
+        interest_rate,
+    )
+    rate = np.where(
+        (credit_score > policy.low_slab) & (credit_score <= policy.mid_slab),
+        np.maximum(interest_rate, policy.low_min_rate),
+        rate,
+    )
+    emi = monthly_emi(loan_amount, rate, tenure, decimals=None)
+    approved = (
+        (credit_score > policy.low_slab)
+        & (current_debt <= approved_limit)
+        & (total_current_emi + emi <= monthly_salary * policy.emi_cap)
+    )
+    return approved, rate, emi
+
+
+def evaluate_request(policy, snapshot, loan_amount, interest_rate, tenure):
+    """
+    The rules for a single request against a customer snapshot, as used by
+    check-eligibility and create-loan: (approved, corrected interest rate, monthly
+    installment) as Python scalars. /offers/ applies the same evaluate_requests to a
+    whole grid, so all three endpoints agree on every request.
+    """
+    approved, rate, emi = evaluate_requests(
+        policy,
+        snapshot.credit_score,
+        snapshot.monthly_salary,
+        snapshot.approved_limit,
+        snapshot.current_debt,
+        float(snapshot.total_current_emi),
+        float(loan_amount),
+        float(interest_rate),
+        tenure,
+    )
+    return bool(approved), float(rate), float(emi)
+
+
+# Tenures (months) offered by /offers/ when the request does not list any.
+DEFAULT_OFFER_TENURES = (6, 12, 18, 24, 36, 48, 60)
+
+
+def offer_amounts(min_amount, max_amount, steps):
+    """
+    Up to `steps` loan amounts spread evenly over [min_amount, max_amount], rounded to
+    the thousand but never outside the range.
+    """
+    if max_amount < min_amount:
+        return np.array([], dtype=np.float64)
+    amounts = np.round(np.linspace(min_amount, max_amount, steps), -3)
+    return np.unique(np.clip(amounts, min_amount, max_amount))
+
+
+def evaluate_offers(policy, snapshot, interest_rate, amounts, tenures):
+    """
+    Evaluate every combination of `amounts` and `tenures` for one customer snapshot at
+    once. Returns (approved, corrected interest rate, monthly installment), with
+    `approved` and the installments shaped (len(amounts), len(tenures)).
+    """
+    approved, rate, emi = evaluate_requests(
+        policy,
+        snapshot.credit_score,
+        snapshot.monthly_salary,
+        snapshot.approved_limit,
+        snapshot.current_debt,
+        float(snapshot.total_current_emi),
+        np.asarray(amounts, dtype=np.float64)[:, None],
+        interest_rate,
+        np.asarray(tenures)[None, :],
+    )
+    return np.broadcast_to(approved, emi.shape), float(rate), emi
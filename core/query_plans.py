@@ -0,0 +1,139 @@
+"""
+PostgreSQL plan and index inspection used by the advise_indexes command.
+"""
+import json
+import statistics
+
+from django.db import connections
+
+PLAN_TABLES = ('customers', 'loans')
+
+
+def explain(sql, using='default', repeat=3):
+    """
+    Run EXPLAIN (ANALYZE, BUFFERS) on `sql` `repeat` times. Returns the last plan and the
+    median execution time in milliseconds. Run it inside a transaction that is rolled
+    back if `sql` writes, since ANALYZE executes the statement.
+    """
+    timings = []
+    with connections[using].cursor() as cursor:
+        for _ in range(repeat):
+            cursor.execute('EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + sql)
+            result = cursor.fetchone()[0]
+            plan = json.loads(result) if isinstance(result, str) else result
+            timings.append(plan[0]['Execution Time'])
+    return plan[0]['Plan'], statistics.median(timings)
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def parent_table(relation):
+    """Map a partition such as loans_y2024 back to the table it belongs to."""
+    for table in PLAN_TABLES:
+        if relation == table or relation.startswith(table + '_'):
+            return table
+    return relation
+
+
+def sequential_scans(plan, min_rows):
+    """
+    Sequential scans of the application tables that read at least `min_rows` rows,
+    as [(table, rows read)]. Smaller scans are usually cheaper than an index lookup.
+    """
+    scans = {}
+    for node in plan_nodes(plan):
+        if node['Node Type'] != 'Seq Scan':
+            continue
+        table = parent_table(node['Relation Name'])
+        if table not in PLAN_TABLES:
+            continue
+        rows = (node.get('Actual Rows', 0) + node.get('Rows Removed by Filter', 0)) * node.get('Actual Loops', 1)
+        scans[table] = scans.get(table, 0) + rows
+    return [(table, rows) for table, rows in scans.items() if rows >= min_rows]
+
+
+def buffer_usage(plan):
+    """Shared buffers touched by the whole plan; unlike timings these barely vary between runs."""
+    return {
+        'shared_hit': plan.get('Shared Hit Blocks', 0),
+        'shared_read': plan.get('Shared Read Blocks', 0),
+    }
+
+
+def table_indexes(using='default'):
+    """
+    Indexes on the application tables, as dicts with name, table, columns, included
+    columns, operator classes, whether they are unique or primary, whether they back
+    a constraint, whether they are partial, and their size in bytes (summed over
+    partitions).
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT
+                i.relname,
+                t.relname,
+                ARRAY(
+                    SELECT a.attname FROM unnest(ix.indkey[:ix.indnkeyatts - 1]) WITH ORDINALITY k(attnum, n)
+                    JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum ORDER BY k.n
+                ),
+                ARRAY(
+                    SELECT a.attname FROM unnest(ix.indkey[ix.indnkeyatts:]) WITH ORDINALITY k(attnum, n)
+                    JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum ORDER BY k.n
+                ),
+                ARRAY(
+                    SELECT opc.opcname FROM unnest(ix.indclass[:ix.indnkeyatts - 1]) WITH ORDINALITY k(opcoid, n)
+                    JOIN pg_opclass opc ON opc.oid = k.opcoid ORDER BY k.n
+                ),
+                ix.indisunique,
+                ix.indisprimary,
+                EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.oid),
+                ix.indpred IS NOT NULL OR ix.indexprs IS NOT NULL,
+                (COALESCE((
+                    SELECT SUM(pg_relation_size(inh.inhrelid)) FROM pg_inherits inh WHERE inh.inhparent = i.oid
+                ), 0) + pg_relation_size(i.oid))::bigint
+            FROM pg_index ix
+            JOIN pg_class i ON i.oid = ix.indexrelid
+            JOIN pg_class t ON t.oid = ix.indrelid
+            WHERE t.relname = ANY(%s)
+            ORDER BY t.relname, i.relname
+            """,
+            [list(PLAN_TABLES)],
+        )
+        return [
+            {
+                'name': name, 'table': table, 'columns': list(columns), 'include': list(include),
+                'opclasses': list(opclasses), 'unique': unique, 'primary': primary, 'constraint': constraint,
+                'partial': partial, 'size': size,
+            }
+            for name, table, columns, include, opclasses, unique, primary, constraint, partial, size in cursor.fetchall()
+        ]
+
+
+def redundant_indexes(indexes):
+    """
+    Plain indexes whose columns are a leading prefix of another index on the same
+    table (including primary keys and unique constraints), as [(index, covered by)].
+    Operator classes must match too, so e.g. a varchar_pattern_ops index for LIKE
+    lookups is not covered by a plain one.
+    """
+    redundant = []
+    for index in indexes:
+        if index['constraint'] or index['partial'] or index['include']:
+            continue
+        for other in indexes:
+            if other is index or other['table'] != index['table'] or other['partial']:
+                continue
+            size = len(index['columns'])
+            if other['columns'][:size] != index['columns'] or other['opclasses'][:size] != index['opclasses']:
+                continue
+            # Of two identical plain indexes keep one, preferring the one backing a constraint.
+            if other['columns'] == index['columns'] and not other['constraint'] and other['name'] > index['name']:
+                continue
+            redundant.append((index, other))
+            break
+    return redundant
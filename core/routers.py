@@ -0,0 +1,34 @@
+from .sharding import SHARDED_MODELS, shard_for_customer
+
+
+class CustomerShardRouter:
+    """
+    Sends customers, their loans and credit scores to the shard of their customer_id
+    (see core.sharding) and every other model to 'default'.
+
+    Only queries made through an instance carry a customer_id (saving a model, or
+    customer.loans), so code that queries by customer_id picks the shard itself with
+    QuerySet.using(shard_for_customer(...)). Anything else falls through to 'default'.
+    """
+
+    def _sharded(self, model):
+        return model._meta.app_label == 'core' and model._meta.model_name in SHARDED_MODELS
+
+    def _db_for_instance(self, model, instance=None, **hints):
+        if not self._sharded(model) or instance is None:
+            return None
+        if instance._state.db:
+            return instance._state.db
+        customer_id = getattr(instance, 'customer_id', None)
+        if customer_id is None:
+            return None
+        return shard_for_customer(customer_id)
+
+    db_for_read = _db_for_instance
+    db_for_write = _db_for_instance
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Customer tables exist on every database, so any of them can take a range of buckets.
+        if db == 'default':
+            return True
+        return app_label == 'core' and (model_name is None or model_name in SHARDED_MODELS)
@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from .export import EXPORT_FORMATS
+from .policy import DEFAULT_OFFER_TENURES
 from .models import Customer, Loan
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -80,3 +82,48 @@ class ViewLoansResponseSerializer(serializers.ModelSerializer):
     class Meta:
         model = Loan
         fields = ['loan_id', 'loan_amount', 'interest_rate', 'tenure', 'monthly_repayment']
+
+
+class ExportLoansRequestSerializer(serializers.Serializer):
+    # Not `format`, which REST framework reserves for choosing a renderer.
+    file_format = serializers.ChoiceField(choices=EXPORT_FORMATS, default='csv')
+    status = serializers.ListField(
+        child=serializers.ChoiceField(choices=Loan.LOAN_STATUS_CHOICES), required=False
+    )
+    start_date_from = serializers.DateField(required=False)
+    start_date_to = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if data.get('start_date_from') and data.get('start_date_to') and data['start_date_from'] > data['start_date_to']:
+            raise serializers.ValidationError('start_date_from must not be after start_date_to.')
+        return data
+
+
+class OffersRequestSerializer(serializers.Serializer):
+    interest_rate = serializers.FloatField(min_value=0, max_value=50)
+    tenure = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=360), max_length=24, required=False,
+        default=list(DEFAULT_OFFER_TENURES),
+    )
+    min_amount = serializers.IntegerField(min_value=1000, default=10000)
+    # Defaults to the customer's approved limit.
+    max_amount = serializers.IntegerField(min_value=1000, required=False)
+    amount_steps = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+    def validate(self, data):
+        if data.get('max_amount') is not None and data['max_amount'] < data['min_amount']:
+            raise serializers.ValidationError('max_amount must not be below min_amount.')
+        return data
+
+
+class OfferSerializer(serializers.Serializer):
+    loan_amount = serializers.FloatField()
+    tenure = serializers.IntegerField()
+    monthly_installment = serializers.FloatField()
+
+
+class OffersResponseSerializer(serializers.Serializer):
+    customer_id = serializers.IntegerField()
+    interest_rate = serializers.FloatField()
+    corrected_interest_rate = serializers.FloatField(allow_null=True)
+    offers = OfferSerializer(many=True)
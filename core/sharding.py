@@ -0,0 +1,222 @@
+"""
+Customer sharding. A customer and all of their loans live on one database alias,
+chosen by hashing the customer_id into one of BUCKETS buckets; settings.CUSTOMER_SHARDS
+gives each alias a [first, last) range of buckets. The ranges only change by hand:
+move_customer_buckets moves a range's customers, loans and credit scores to another
+alias, and CUSTOMER_SHARDS is then edited to match. No other customer is rehashed.
+
+New customer IDs come from one counter on 'default' (allocate_ids), and phone numbers
+are kept unique across shards by the CustomerPhone registry, also on 'default'.
+Whatever writes rows with IDs of its own (ingest_data, generate_data,
+move_customer_buckets) raises the counters past them with raise_id_floor, so
+allocating never has to look at the shards.
+
+Loan IDs allocated by create-loan carry their shard: loan_id % len(CUSTOMER_SHARDS)
+is the position of the shard in CUSTOMER_SHARDS. They come from one counter on
+'default' (allocate_ids), so they stay unique across shards. Loans ingested from
+CSV keep their own IDs, so looking a loan up by ID tries its residue shard first
+and then the others.
+"""
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+
+from .models import CreditScore, Customer, CustomerPhone, IdSequence, Loan
+
+# Fixed for the lifetime of the data: changing it would move almost every customer.
+BUCKETS = 1024
+
+# Models stored on the shard of their customer; everything else lives on 'default'.
+SHARDED_MODELS = {'customer', 'loan', 'creditscore'}
+
+
+@lru_cache(maxsize=None)
+def _bucket_owners(shards):
+    owners = [None] * BUCKETS
+    for alias, (first, last) in shards:
+        for bucket in range(first, last):
+            if owners[bucket] is not None:
+                raise ImproperlyConfigured(f'CUSTOMER_SHARDS assigns bucket {bucket} to both {owners[bucket]} and {alias}.')
+            owners[bucket] = alias
+    if None in owners:
+        raise ImproperlyConfigured(f'CUSTOMER_SHARDS leaves bucket {owners.index(None)} without a database.')
+    return owners
+
+
+def customer_bucket(customer_id):
+    """Multiplicative (Fibonacci) hash, so consecutive IDs spread across buckets."""
+    return ((int(customer_id) * 2654435761) & 0xFFFFFFFF) * BUCKETS >> 32
+
+
+def shard_aliases():
+    """Database aliases holding customers, in CUSTOMER_SHARDS order."""
+    return list(settings.CUSTOMER_SHARDS)
+
+
+def shard_for_customer(customer_id):
+    owners = _bucket_owners(tuple((alias, tuple(bounds)) for alias, bounds in settings.CUSTOMER_SHARDS.items()))
+    return owners[customer_bucket(customer_id)]
+
+
+def group_by_shard(items, customer_id=lambda item: item.customer_id):
+    """Split `items` into {alias: [items]} by the shard of each item's customer."""
+    groups = {}
+    for item in items:
+        groups.setdefault(shard_for_customer(customer_id(item)), []).append(item)
+    return groups
+
+
+@contextmanager
+def atomic_on_shards(aliases=None):
+    """
+    One transaction per shard (all of them by default), committed one after another, in
+    reverse order, on exit. Not atomic across shards, so writes made under it must be
+    safe to repeat.
+    """
+    with ExitStack() as stack:
+        for alias in aliases or shard_aliases():
+            stack.enter_context(transaction.atomic(using=alias, savepoint=False))
+        yield
+
+
+def _copy_rows(model, customer_ids, source, target):
+    """
+    Insert the rows of `model` for `customer_ids` from `source` into `target` as they
+    are, timestamps included, and return the highest primary key copied (None if none).
+    """
+    connection = connections[target]
+    fields = model._meta.concrete_fields
+    rows = [
+        [field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields]
+        for obj in model.objects.using(source).filter(customer_id__in=customer_ids)
+    ]
+    if not rows:
+        return None
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {quote(model._meta.db_table)} ({", ".join(quote(field.column) for field in fields)}) '
+            f'VALUES ({", ".join(["%s"] * len(fields))})',
+            rows,
+        )
+    return max(row[fields.index(model._meta.pk)] for row in rows)
+
+
+def move_customer_buckets(first, last, target, batch_size=1000):
+    """
+    Move the customers in buckets [first, last), with their loans and credit scores,
+    from whichever databases hold them to `target`, and return how many moved.
+
+    Each batch is copied in one transaction on `target` and then deleted from its
+    source in another, so a customer is never lost, and rerunning after a failure
+    copies an interrupted batch again. Requests for these customers still go to the
+    old shard until CUSTOMER_SHARDS gives the range to `target`, so writes to them
+    should be stopped while they move.
+    """
+    moved = 0
+    for alias in settings.DATABASES:
+        if alias == target:
+            continue
+        customer_ids = [
+            customer_id
+            for customer_id in Customer.objects.using(alias).values_list('customer_id', flat=True).iterator()
+            if first <= customer_bucket(customer_id) < last
+        ]
+        for start in range(0, len(customer_ids), batch_size):
+            batch = customer_ids[start:start + batch_size]
+            with transaction.atomic(using=target):
+                for model in (Loan, CreditScore, Customer):
+                    model.objects.using(target).filter(customer_id__in=batch).delete()
+                last_ids = {model: _copy_rows(model, batch, alias, target) for model in (Customer, CreditScore, Loan)}
+            for name, model in (('customer', Customer), ('loan', Loan)):
+                if last_ids[model] is not None:
+                    raise_id_floor(name, last_ids[model])
+            with transaction.atomic(using=alias):
+                for model in (Loan, CreditScore, Customer):
+                    model.objects.using(alias).filter(customer_id__in=batch).delete()
+            moved += len(batch)
+    return moved
+
+
+def next_customer_id(count=1):
+    """The first of `count` consecutive new customer IDs, from the 'customer' counter."""
+    return allocate_ids('customer', count=count)
+
+
+def register_customer_phones(customers, batch_size=5000):
+    """
+    Record the phone numbers of `customers` in the CustomerPhone registry on 'default',
+    replacing any numbers they had before. A number registered to another customer
+    moves to the one given here, as the customer rows themselves are upserted.
+    """
+    registry = CustomerPhone.objects.using('default')
+    for start in range(0, len(customers), batch_size):
+        batch = customers[start:start + batch_size]
+        registry.filter(customer_id__in=[customer.customer_id for customer in batch]).delete()
+        # A number repeated in the batch goes to its last customer; one upsert cannot write a row twice.
+        phones = {customer.phone_number: customer.customer_id for customer in batch}
+        registry.bulk_create(
+            [CustomerPhone(phone_number=phone_number, customer_id=customer_id) for phone_number, customer_id in phones.items()],
+            update_conflicts=True,
+            unique_fields=['phone_number'],
+            update_fields=['customer_id'],
+        )
+
+
+def allocate_ids(name, floor=0, count=1, residue=0, step=1):
+    """
+    Reserve `count` IDs from the IdSequence counter `name` and return the first; the
+    others follow it `step` apart. The first is the lowest ID above both the last one
+    handed out and `floor` with ID % step == residue. It takes a single UPDATE on
+    'default', so concurrent callers on any shard never get the same IDs.
+    """
+    base = 'CASE WHEN last_value < %s THEN %s ELSE last_value END'
+    while True:
+        with connections['default'].cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {IdSequence._meta.db_table} '
+                f'SET last_value = {base} + 1 + ((%s - ({base}) - 1) %% %s + %s) %% %s + %s '
+                f'WHERE name = %s RETURNING last_value',
+                [floor, floor, residue, floor, floor, step, step, step, (count - 1) * step, name],
+            )
+            row = cursor.fetchone()
+        if row is not None:
+            return row[0] - (count - 1) * step
+        # Migrations create the counters; this only runs if the row was deleted since.
+        IdSequence.objects.using('default').get_or_create(name=name)
+
+
+def raise_id_floor(name, last_id):
+    """
+    Make sure the IdSequence counter `name` never hands out `last_id` or any ID below
+    it, after rows were written with IDs of their own. One UPDATE on 'default'.
+    """
+    while True:
+        with connections['default'].cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {IdSequence._meta.db_table} '
+                f'SET last_value = CASE WHEN last_value < %s THEN %s ELSE last_value END WHERE name = %s',
+                [last_id, last_id, name],
+            )
+            if cursor.rowcount:
+                return
+        IdSequence.objects.using('default').get_or_create(name=name)
+
+
+def next_loan_id(using, count=1):
+    """
+    The first of `count` new loan IDs for shard `using`, from the 'loan' counter and
+    spaced len(CUSTOMER_SHARDS) apart so that each maps back to that shard.
+    """
+    aliases = shard_aliases()
+    return allocate_ids('loan', count=count, residue=aliases.index(using), step=len(aliases))
+
+
+def shards_for_loan(loan_id):
+    """Every shard alias, starting with the one create-loan would have put `loan_id` on."""
+    aliases = shard_aliases()
+    first = loan_id % len(aliases)
+    return aliases[first:] + aliases[:first]
@@ -0,0 +1,315 @@
+"""
+In-memory snapshots of what the eligibility rules need per customer: salary,
+approved limit, current debt, credit score and the EMI sum of ACTIVE loans.
+
+The store holds numpy columns indexed by customer_id, loaded in bulk when a web
+worker starts. Writers publish the IDs of changed customers on a Redis channel
+after their transaction commits; each worker listens on it and marks those rows
+invalid. An invalid, missing or expired row is read from the database instead
+and written back, so a lost notification delays a change by at most
+CUSTOMER_SNAPSHOT_MAX_AGE seconds.
+"""
+import logging
+import os
+import threading
+import time
+from decimal import Decimal
+from typing import NamedTuple
+
+import numpy as np
+import redis
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+
+from .models import Customer
+from .policy import load_customer_snapshots
+from .redis_client import get_redis
+from .sharding import shard_for_customer
+from .utils import calculate_credit_score, get_loan_summary
+
+logger = logging.getLogger(__name__)
+
+# Published instead of a customer ID when many customers changed at once, e.g. after ingestion.
+ALL_CUSTOMERS = '*'
+
+
+class CustomerSnapshot(NamedTuple):
+    customer_id: int
+    monthly_salary: int
+    approved_limit: int
+    current_debt: int
+    credit_score: int
+    total_current_emi: Decimal
+
+
+def read_customer_snapshot(customer_id):
+    """Build a snapshot from the database, or return None if the customer does not exist."""
+    try:
+        customer = Customer.objects.using(shard_for_customer(customer_id)).get(pk=customer_id)
+    except Customer.DoesNotExist:
+        return None
+    return customer_snapshot(customer)
+
+
+def customer_snapshot(customer):
+    """Snapshot of a Customer already fetched, with one query for its loan summary."""
+    loan_summary = get_loan_summary(customer)
+    return CustomerSnapshot(
+        customer_id=customer.customer_id,
+        monthly_salary=customer.monthly_salary,
+        approved_limit=customer.approved_limit,
+        current_debt=customer.current_debt,
+        credit_score=calculate_credit_score(customer, loan_summary),
+        total_current_emi=Decimal(loan_summary['total_current_emi']),
+    )
+
+
+def publish_customer_change(customer_id=ALL_CUSTOMERS, using=None):
+    """
+    Tell every worker's snapshot store that a customer changed (or all of them, by
+    default) once the current transaction on `using` commits. A failed publish is
+    only logged.
+    """
+    if not settings.CUSTOMER_SNAPSHOTS_ENABLED:
+        return
+
+    def publish():
+        try:
+            get_redis().publish(settings.CUSTOMER_SNAPSHOT_CHANNEL, str(customer_id))
+        except redis.RedisError:
+            logger.warning('Could not publish snapshot change for customer %s', customer_id, exc_info=True)
+
+    transaction.on_commit(publish, using=using)
+
+
+class SnapshotStore:
+    """
+    Customer snapshots held as numpy columns. Row positions come from a dense
+    customer_id -> row array; customers registered after the load go in a dict.
+    """
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._columns = None
+        self._extra = {}  # customer_id -> (snapshot, loaded_at, generation)
+        self._reload_requested = threading.Event()
+        self._reloading = False
+        self._invalidated_during_reload = set()
+        self._listener_pid = None
+
+    # Loading
+
+    def load(self):
+        """Read every customer from every shard and replace the current columns."""
+        snapshots = load_customer_snapshots()
+        customer_id = snapshots['customer_id']
+        position = np.full(int(customer_id.max()) + 1 if len(customer_id) else 0, -1, dtype=np.int32)
+        position[customer_id] = np.arange(len(customer_id), dtype=np.int32)
+        columns = {
+            'position': position,
+            'monthly_salary': snapshots['monthly_salary'],
+            'approved_limit': snapshots['approved_limit'],
+            'current_debt': snapshots['current_debt'],
+            'credit_score': snapshots['credit_score'],
+            # Whole paise, so the EMI sum converts back to the exact Decimal the database holds.
+            'total_current_emi_paise': np.round(snapshots['total_current_emi'] * 100).astype(np.int64),
+            'valid': np.ones(len(customer_id), dtype=bool),
+            'loaded_at': np.full(len(customer_id), time.monotonic()),
+            'generation': np.zeros(len(customer_id), dtype=np.int64),
+        }
+        with self._lock:
+            self._columns = columns
+            self._extra = {}
+            # Changes notified while the columns were being read may not be in them.
+            for changed in self._invalidated_during_reload:
+                if changed == ALL_CUSTOMERS:
+                    columns['valid'][:] = False
+                else:
+                    self._invalidate_locked(changed)
+            self._invalidated_during_reload = set()
+        return len(customer_id)
+
+    def __len__(self):
+        columns = self._columns
+        return (len(columns['valid']) if columns else 0) + len(self._extra)
+
+    # Lookups
+
+    def get(self, customer_id):
+        """
+        The customer's snapshot, from memory when the row is valid and younger than
+        max_age, otherwise from the database. None if the customer does not exist.
+        """
+        now = time.monotonic()
+        with self._lock:
+            row = self._row(customer_id)
+            if row is not None:
+                columns = self._columns
+                if columns['valid'][row] and now - columns['loaded_at'][row] < self.max_age:
+                    return CustomerSnapshot(
+                        customer_id,
+                        int(columns['monthly_salary'][row]),
+                        int(columns['approved_limit'][row]),
+                        int(columns['current_debt'][row]),
+                        int(columns['credit_score'][row]),
+                        Decimal(int(columns['total_current_emi_paise'][row])).scaleb(-2),
+                    )
+                generation = columns['generation'][row]
+            else:
+                extra = self._extra.get(customer_id)
+                if extra and now - extra[1] < self.max_age:
+                    return extra[0]
+                generation = extra[2] if extra else 0
+
+        snapshot = read_customer_snapshot(customer_id)
+        if snapshot is not None:
+            self._put(snapshot, now, generation)
+        return snapshot
+
+    def _row(self, customer_id):
+        columns = self._columns
+        if columns is None or not 0 <= customer_id < len(columns['position']):
+            return None
+        row = columns['position'][customer_id]
+        return row if row >= 0 else None
+
+    def _put(self, snapshot, loaded_at, generation):
+        """Store a snapshot read from the database unless the customer changed while it was read."""
+        with self._lock:
+            row = self._row(snapshot.customer_id)
+            if row is None:
+                extra = self._extra.get(snapshot.customer_id)
+                if (extra[2] if extra else 0) == generation:
+                    self._extra[snapshot.customer_id] = (snapshot, loaded_at, generation)
+                return
+            columns = self._columns
+            if columns['generation'][row] != generation:
+                return
+            columns['monthly_salary'][row] = snapshot.monthly_salary
+            columns['approved_limit'][row] = snapshot.approved_limit
+            columns['current_debt'][row] = snapshot.current_debt
+            columns['credit_score'][row] = snapshot.credit_score
+            columns['total_current_emi_paise'][row] = int(snapshot.total_current_emi * 100)
+            columns['loaded_at'][row] = loaded_at
+            columns['valid'][row] = True
+
+    # Invalidation
+
+    def invalidate(self, customer_id):
+        with self._lock:
+            self._invalidate_locked(customer_id)
+            if self._reloading:
+                self._invalidated_during_reload.add(customer_id)
+
+    def _invalidate_locked(self, customer_id):
+        row = self._row(customer_id)
+        if row is not None:
+            self._columns['valid'][row] = False
+            self._columns['generation'][row] += 1
+        else:
+            extra = self._extra.get(customer_id)
+            # An expired entry still carries the generation, so a read in flight is not stored.
+            self._extra[customer_id] = (extra[0] if extra else None, float('-inf'), (extra[2] if extra else 0) + 1)
+
+    def invalidate_all(self):
+        """Mark every row invalid and reload the store in the background."""
+        with self._lock:
+            if self._columns is not None:
+                self._columns['valid'][:] = False
+                self._columns['generation'] += 1
+            self._extra = {
+                customer_id: (snapshot, float('-inf'), generation + 1)
+                for customer_id, (snapshot, _, generation) in self._extra.items()
+            }
+            if self._reloading:
+                self._invalidated_during_reload.add(ALL_CUSTOMERS)
+        self._reload_requested.set()
+
+    # Background threads
+
+    def start_listener(self):
+        """
+        Start the threads that apply change notifications and reload the store. Threads
+        do not survive a fork, so this is a no-op only within the process that started them.
+        """
+        if self._listener_pid == os.getpid():
+            return
+        self._listener_pid = os.getpid()
+        threading.Thread(target=self._listen, name='snapshot-listener', daemon=True).start()
+        threading.Thread(target=self._reload_loop, name='snapshot-reloader', daemon=True).start()
+
+    def _listen(self):
+        connected_before = False
+        while True:
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(settings.CUSTOMER_SNAPSHOT_CHANNEL)
+                if connected_before:
+                    # Notifications may have been missed while disconnected.
+                    self.invalidate_all()
+                connected_before = True
+                for message in pubsub.listen():
+                    self.handle_message(message['data'])
+            except redis.RedisError:
+                logger.warning('Snapshot change listener lost its Redis connection; retrying', exc_info=True)
+                time.sleep(1)
+
+    def handle_message(self, data):
+        data = data.decode() if isinstance(data, bytes) else str(data)
+        if data == ALL_CUSTOMERS:
+            self.invalidate_all()
+        elif data.isdigit():
+            self.invalidate(int(data))
+
+    def _reload_loop(self):
+        while True:
+            self._reload_requested.wait()
+            self._reload_requested.clear()
+            with self._lock:
+                self._reloading = True
+            try:
+                close_old_connections()
+                self.load()
+            except Exception:
+                logger.exception('Reloading customer snapshots failed')
+                with self._lock:
+                    self._reloading = False
+                time.sleep(1)
+                self._reload_requested.set()
+            else:
+                with self._lock:
+                    self._reloading = False
+            finally:
+                connections.close_all()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_snapshot_store(start_listener=True):
+    """
+    The process-wide store, loaded on first use, with its listener running in this
+    process unless `start_listener` is False (before a fork: threads would not be
+    copied). Returns None when CUSTOMER_SNAPSHOTS_ENABLED is off.
+    """
+    global _store
+    if not settings.CUSTOMER_SNAPSHOTS_ENABLED:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = SnapshotStore(settings.CUSTOMER_SNAPSHOT_MAX_AGE)
+                store.load()
+                _store = store
+    if start_listener:
+        _store.start_listener()
+    return _store
+
+
+def get_customer_snapshot(customer_id):
+    """The customer's snapshot from the store when it is enabled, otherwise from the database."""
+    store = get_snapshot_store()
+    if store is None:
+        return read_customer_snapshot(customer_id)
+    return store.get(customer_id)
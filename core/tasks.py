@@ -1,76 +1,355 @@
+import io
+import time
+
 from celery import shared_task
-import pandas as pd
-from .models import Customer, Loan
-from django.utils.dateparse import parse_date
-from datetime import datetime
+from .models import Customer, IngestionRun, Loan, OUTSTANDING_AMOUNT
+from .partitions import ensure_loan_partitions
+from .sharding import atomic_on_shards, group_by_shard, raise_id_floor, register_customer_phones, shard_aliases
+from .snapshots import publish_customer_change
+from django.db import transaction
+from django.db.models import OuterRef, PositiveIntegerField, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
-@shared_task
-def ingest_data():
+# Rows read from each CSV and written per round of bulk queries.
+INGEST_BATCH_SIZE = 5000
+
+# pandas is imported inside the functions that parse CSVs: Celery's task autodiscovery
+# imports this module in every process, including web workers that never ingest.
+
+
+def ingest_customer_batch(customer_df):
+    """
+    Upserts one chunk of customer_data.csv with a single INSERT ... ON CONFLICT per shard,
+    and their phone numbers in the registry on 'default'. New customer IDs are then
+    allocated above the chunk's.
+    """
+    # A repeated ID keeps its last row, as successive update_or_create calls would.
+    customers = [
+        Customer(
+            customer_id=int(row['Customer ID']),
+            first_name=row['First Name'],
+            last_name=row['Last Name'],
+            age=int(row['Age']),
+            phone_number=str(row['Phone Number']),
+            monthly_salary=int(row['Monthly Salary']),
+            approved_limit=int(row['Approved Limit']),
+        )
+        for _, row in customer_df[customer_df['Customer ID'].notna()].drop_duplicates('Customer ID', keep='last').iterrows()
+    ]
+    if customers:
+        raise_id_floor('customer', max(customer.customer_id for customer in customers))
+    register_customer_phones(customers)
+    for alias, shard_customers in group_by_shard(customers).items():
+        Customer.objects.using(alias).bulk_create(
+            shard_customers,
+            update_conflicts=True,
+            unique_fields=['customer_id'],
+            update_fields=['first_name', 'last_name', 'age', 'phone_number', 'monthly_salary', 'approved_limit', 'updated_at'],
+        )
+
+
+def ingest_loan_batch(loan_df, first_row_number):
+    """
+    Replaces the loans in one chunk of loan_data.csv using a constant number of queries
+    per shard. `first_row_number` is the position of the chunk's first row in the file,
+    counting the header as row 1, for log messages.
+    """
+    import pandas as pd
+
+    start_dates = pd.to_datetime(loan_df['Date of Approval'], format='%d-%m-%Y', errors='coerce')
+    end_dates = pd.to_datetime(loan_df['End Date'], format='%d-%m-%Y', errors='coerce')
+    customer_ids = loan_df['Customer ID'].dropna().astype(int).unique().tolist()
+    existing_customers = set()
+    for alias, shard_customer_ids in group_by_shard(customer_ids, customer_id=int).items():
+        existing_customers.update(
+            Customer.objects.using(alias).filter(customer_id__in=shard_customer_ids).values_list('customer_id', flat=True)
+        )
+
+    loans = {}
+    for offset, (index, row) in enumerate(loan_df.iterrows()):
+        row_number = first_row_number + offset
+        # Skip row if essential IDs or dates are missing
+        if not (pd.notna(row['Customer ID']) and pd.notna(row['Loan ID']) and pd.notna(row['Date of Approval']) and pd.notna(row['End Date'])):
+            # Add logging for missing data
+            print(f"Skipping row {row_number}: Missing required data (CustomerID, LoanID, or Dates).")
+            continue
+        if pd.isna(start_dates[index]) or pd.isna(end_dates[index]):
+            # Add logging for parse failure
+            print(f"Skipping row {row_number}: Date parsing failed.")
+            continue
+        if int(row['Customer ID']) not in existing_customers:
+            # Log or handle cases where a customer for a loan doesn't exist
+            print(f"Skipping row {row_number}: Non-existent customer ID: {int(row['Customer ID'])}")
+            continue
+
+        loans[int(row['Loan ID'])] = Loan(
+            loan_id=int(row['Loan ID']),
+            customer_id=int(row['Customer ID']),
+            loan_amount=row['Loan Amount'],
+            tenure=int(row['Tenure']),
+            interest_rate=row['Interest Rate'],
+            monthly_repayment=row['Monthly payment'],
+            emis_paid_on_time=int(row['EMIs paid on Time']),
+            start_date=start_dates[index].date(),
+            end_date=end_dates[index].date(),
+            status='COMPLETED' if row['EMIs paid on Time'] == row['Tenure'] else 'ACTIVE',
+        )
+
+    # Loans keep their IDs from the file, so create-loan must allocate above them.
+    if loans:
+        raise_id_floor('loan', max(loans))
+
+    # Re-ingested loans are replaced rather than updated in place, so the batch costs
+    # one DELETE and one INSERT per shard whatever its size. The DELETE runs on every
+    # shard in case a loan ID now belongs to a customer on another one.
+    # Inside the caller's transactions no savepoint is needed: a failure rolls back the whole batch.
+    shard_loans = group_by_shard(loans.values())
+    with atomic_on_shards():
+        for alias in shard_aliases():
+            Loan.objects.using(alias).filter(loan_id__in=list(loans)).delete()
+            if alias in shard_loans:
+                Loan.objects.using(alias).bulk_create(shard_loans[alias])
+
+
+def update_all_current_debt():
+    """
+    Recomputes current_debt for every customer in one UPDATE per shard, like
+    Customer.update_current_debt.
+    """
+    active_debt = (
+        Loan.objects.filter(customer=OuterRef('pk'), status='ACTIVE')
+        .values('customer')
+        .annotate(total=Sum(OUTSTANDING_AMOUNT))
+        .values('total')
+    )
+    for alias in shard_aliases():
+        Customer.objects.using(alias).update(
+            current_debt=Coalesce(Subquery(active_debt), Value(0), output_field=PositiveIntegerField()),
+            updated_at=timezone.now(),
+        )
+
+
+def count_csv_rows(path):
+    """
+    Data rows in a CSV file (lines after the header), counted without parsing it. Only
+    used for progress, so quoted fields spanning lines may make it overestimate.
+    """
+    lines, last = 0, b'\n'
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    return max(lines + (last != b'\n') - 1, 0)
+
+
+class CheckpointMismatch(Exception):
+    """A run's checkpoint does not fit its CSV file, which has changed since the run started."""
+
+
+def csv_records(f):
+    """
+    Yield (record, offset after it) for each non-blank record of a CSV file opened in
+    binary mode, from its current position. A record ends at the first newline outside
+    a quoted field, so names spanning several lines stay in one record.
+    """
+    record = b''
+    for line in iter(f.readline, b''):
+        record += line
+        if record.count(b'"') % 2:
+            continue  # inside a quoted field
+        if record.strip():
+            yield record, f.tell()
+        record = b''
+    if record.strip():
+        yield record, f.tell()
+
+
+def read_csv_from(path, offset, rows_done, batch_size):
+    """
+    Read a CSV in chunks of `batch_size` rows, yielding (DataFrame, byte offset after
+    the chunk). A resumed run passes the offset and row count of its checkpoint and the
+    file is read from there, so earlier rows are neither read nor parsed again. The row
+    count only checks that the checkpoint fits the file.
+    """
+    import pandas as pd
+
+    f = open(path, 'rb')
+    header, header_end = next(csv_records(f), (b'', f.tell()))
+    if offset == 0:
+        if rows_done:
+            f.close()
+            raise CheckpointMismatch(f'{path}: {rows_done} rows are done but no byte offset was saved.')
+        offset = header_end
+    else:
+        f.seek(offset - 1)
+        if not rows_done or offset < header_end or f.read(1) != b'\n':
+            f.close()
+            raise CheckpointMismatch(f'{path}: byte {offset} is not the end of row {rows_done}.')
+    f.seek(offset)
+
+    def parse(records):
+        return pd.read_csv(io.BytesIO(header + b''.join(records)))
+
+    def chunks():
+        with f:
+            records = []
+            for record, end in csv_records(f):
+                records.append(record)
+                if len(records) == batch_size:
+                    yield parse(records), end
+                    records = []
+            if records:
+                yield parse(records), end
+
+    return chunks()
+
+
+def get_ingestion_run(task_id, run_id, customer_file, loan_file, batch_size):
+    """
+    The run to work on: `run_id` when resuming, otherwise the run of this task (the
+    message is redelivered with the same ID if a worker dies mid-run) or a new one.
+    """
+    if run_id is not None:
+        return IngestionRun.objects.get(pk=run_id)
+    if task_id:
+        run = IngestionRun.objects.filter(task_id=task_id).first()
+        if run:
+            return run
+    return IngestionRun.objects.create(
+        task_id=task_id or '', customer_file=customer_file, loan_file=loan_file, batch_size=batch_size,
+    )
+
+
+class ProgressReporter:
+    """
+    Publishes an ingestion run's progress as the PROGRESS state of its Celery task,
+    with the rate and ETA measured since this attempt started.
+    """
+
+    def __init__(self, task, run):
+        self.task = task
+        self.run = run
+        self.started = time.monotonic()
+        self.rows_at_start = run.rows_done
+
+    def report(self):
+        if not self.task.request.id:
+            return  # called directly rather than by a worker
+        run = self.run
+        elapsed = time.monotonic() - self.started
+        rate = (run.rows_done - self.rows_at_start) / elapsed if elapsed > 0 else 0.0
+        rows_total = run.rows_total
+        eta = (rows_total - run.rows_done) / rate if rows_total is not None and rate > 0 else None
+        self.task.update_state(state='PROGRESS', meta={
+            'run_id': run.pk,
+            'stage': run.stage,
+            'rows_done': run.rows_done,
+            'rows_total': rows_total,
+            'batches_done': run.batches_done,
+            'rows_per_second': round(rate, 1),
+            'eta_seconds': round(eta) if eta is not None else None,
+        })
+
+
+def fail_ingestion_run(run, message):
+    # Drop any checkpoint changes of a batch that did not commit.
+    run.refresh_from_db()
+    run.status = 'FAILED'
+    run.error = message
+    run.save(update_fields=['status', 'error', 'updated_at'])
+    return message
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def ingest_data(self, customer_file='customer_data.csv', loan_file='loan_data.csv', batch_size=INGEST_BATCH_SIZE, run_id=None):
     """
     Celery task to ingest customer and loan data from CSV files.
+
+    Each batch commits together with its IngestionRun checkpoint. Pass `run_id` to
+    resume a run after its last committed batch; the files must not have changed.
+    Resuming seeks to the byte offset saved with the checkpoint.
+    With several shards the checkpoint, on 'default', commits after the shards' part
+    of the batch, so a crash in between repeats the (idempotent) batch on resume.
     """
-    # Ingest Customer Data
+    run = get_ingestion_run(self.request.id, run_id, customer_file, loan_file, batch_size)
+    if run.status == 'COMPLETED':
+        return f"Ingestion run {run.pk} already completed."
+
+    run.status = 'RUNNING'
+    run.task_id = self.request.id or run.task_id
+    run.error = ''
+    for field, path in (('customer_rows_total', run.customer_file), ('loan_rows_total', run.loan_file)):
+        if getattr(run, field) is None:
+            try:
+                setattr(run, field, count_csv_rows(path))
+            except FileNotFoundError:
+                pass  # reported by the stage that reads it
+    run.save(update_fields=['status', 'task_id', 'error', 'customer_rows_total', 'loan_rows_total', 'updated_at'])
+    progress = ProgressReporter(self, run)
+
     try:
-        customer_df = pd.read_csv('customer_data.csv')
-        for _, row in customer_df.iterrows():
-            if pd.notna(row['Customer ID']):
-                Customer.objects.update_or_create(
-                    customer_id=int(row['Customer ID']),
-                    defaults={
-                        'first_name': row['First Name'],
-                        'last_name': row['Last Name'],
-                        'age': row['Age'],
-                        'phone_number': row['Phone Number'],
-                        'monthly_salary': row['Monthly Salary'],
-                        'approved_limit': row['Approved Limit'],
-                    }
+        # Ingest Customer Data
+        if run.stage == 'customers':
+            try:
+                customer_chunks = read_csv_from(
+                    run.customer_file, run.customer_offset, run.customer_rows_done, run.batch_size
                 )
-    except FileNotFoundError:
-        return "customer_data.csv not found."
+            except FileNotFoundError:
+                return fail_ingestion_run(run, "customer_data.csv not found.")
+            except CheckpointMismatch as e:
+                return fail_ingestion_run(run, str(e))
+            for customer_df, offset in customer_chunks:
+                with transaction.atomic(), atomic_on_shards():
+                    ingest_customer_batch(customer_df)
+                    run.customer_rows_done += len(customer_df)
+                    run.customer_offset = offset
+                    run.batches_done += 1
+                    run.save(update_fields=['customer_rows_done', 'customer_offset', 'batches_done', 'updated_at'])
+                progress.report()
+            run.stage = 'loans'
+            run.save(update_fields=['stage', 'updated_at'])
 
-    # Ingest Loan Data
-    try:
-        loan_df = pd.read_csv('loan_data.csv')
-        for index, row in loan_df.iterrows():
-            # Skip row if essential IDs or dates are missing
-            if pd.notna(row['Customer ID']) and pd.notna(row['Loan ID']) and pd.notna(row['Date of Approval']) and pd.notna(row['End Date']):
-                try:
-                    start_date = datetime.strptime(str(row['Date of Approval']), '%d-%m-%Y').date()
-                    end_date = datetime.strptime(str(row['End Date']), '%d-%m-%Y').date()
-                except (ValueError, TypeError):
-                    # Add logging for parse failure
-                    print(f"Skipping row {index+2}: Date parsing failed.")
-                    continue
-
-                try:
-                    customer = Customer.objects.get(customer_id=int(row['Customer ID']))
-                    Loan.objects.update_or_create(
-                        loan_id=int(row['Loan ID']),
-                        defaults={
-                            'customer': customer,
-                            'loan_amount': row['Loan Amount'],
-                            'tenure': row['Tenure'],
-                            'interest_rate': row['Interest Rate'],
-                            'monthly_repayment': row['Monthly payment'],
-                            'emis_paid_on_time': row['EMIs paid on Time'],
-                            'start_date': start_date,
-                            'end_date': end_date,
-                            'status': 'COMPLETED' if row['EMIs paid on Time'] == row['Tenure'] else 'ACTIVE'
-                        }
-                    )
-                except Customer.DoesNotExist:
-                    # Log or handle cases where a customer for a loan doesn't exist
-                    print(f"Skipping row {index+2}: Non-existent customer ID: {int(row['Customer ID'])}")
-                    pass
-            else:
-                # Add logging for missing data
-                print(f"Skipping row {index+2}: Missing required data (CustomerID, LoanID, or Dates).")
-
-    except FileNotFoundError:
-        return "loan_data.csv not found."
-
-    # Update current_debt for all customers
-    for customer in Customer.objects.all():
-        customer.update_current_debt()
+        # Ingest Loan Data
+        try:
+            loan_chunks = read_csv_from(run.loan_file, run.loan_offset, run.loan_rows_done, run.batch_size)
+        except FileNotFoundError:
+            return fail_ingestion_run(run, "loan_data.csv not found.")
+        except CheckpointMismatch as e:
+            return fail_ingestion_run(run, str(e))
+        for loan_df, offset in loan_chunks:
+            with transaction.atomic(), atomic_on_shards():
+                # Row number of the chunk's first row, counting the header as row 1
+                ingest_loan_batch(loan_df, run.loan_rows_done + 2)
+                run.loan_rows_done += len(loan_df)
+                run.loan_offset = offset
+                run.batches_done += 1
+                run.save(update_fields=['loan_rows_done', 'loan_offset', 'batches_done', 'updated_at'])
+            progress.report()
+
+        # Update current_debt for all customers
+        with transaction.atomic(), atomic_on_shards():
+            update_all_current_debt()
+            publish_customer_change()
+            run.status = 'COMPLETED'
+            run.finished_at = timezone.now()
+            run.save(update_fields=['status', 'finished_at', 'updated_at'])
+    except Exception as e:
+        fail_ingestion_run(run, repr(e))
+        raise
 
     return "Data ingestion completed successfully."
+
+
+@shared_task
+def create_loan_partitions():
+    """
+    Periodic task that creates loan partitions for the coming years on every shard
+    (see core.partitions).
+    """
+    created = [
+        f'{alias}.{name}' if len(shard_aliases()) > 1 else name
+        for alias in shard_aliases()
+        for name in ensure_loan_partitions(using=alias)
+    ]
+    return f"Created partitions: {', '.join(created) or 'none needed'}."
@@ -0,0 +1,26 @@
+"""
+Test data shared by the test modules.
+"""
+from core.models import Customer
+from core.sharding import raise_id_floor, shard_for_customer
+
+
+def make_customer(customer_id=1, using=None, **fields):
+    """
+    Create a customer on the shard that owns `customer_id` (or on `using`). Fields not
+    given get defaults: a 100000 salary, its 3600000 approved limit and a phone number
+    derived from the ID, as generate_data makes them. Registration then allocates
+    customer IDs above it.
+    """
+    values = {
+        'first_name': 'Test',
+        'last_name': f'Customer {customer_id}',
+        'age': 30,
+        'phone_number': f'9{customer_id:09d}',
+        'monthly_salary': 100000,
+        'approved_limit': 3600000,
+        **fields,
+    }
+    customer = Customer.objects.using(using or shard_for_customer(customer_id)).create(customer_id=customer_id, **values)
+    raise_id_floor('customer', customer_id)
+    return customer
@@ -0,0 +1,59 @@
+"""
+advise_indexes replays API requests against the live database, so nothing it does may stick.
+PostgreSQL only, like the command.
+"""
+from datetime import date, timedelta
+from io import StringIO
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+
+from core.models import Customer, CustomerPhone, Loan
+from core.sharding import raise_id_floor, shard_for_customer
+from core.tests.fixtures import make_customer
+
+
+# Spread customers over every test database, so the replay has a shard besides 'default' to leave untouched.
+SHARDS = {
+    alias: (1024 * index // len(settings.DATABASES), 1024 * (index + 1) // len(settings.DATABASES))
+    for index, alias in enumerate(settings.DATABASES)
+}
+
+
+@skipUnless(connection.vendor == 'postgresql', 'advise_indexes needs PostgreSQL')
+@override_settings(GROUP_COMMIT_ENABLED=True, CUSTOMER_SHARDS=SHARDS)
+class AdviseIndexesTests(TransactionTestCase):
+    databases = '__all__'
+
+    def counts(self):
+        return {
+            alias: (Customer.objects.using(alias).count(), Loan.objects.using(alias).count())
+            for alias in settings.DATABASES
+        }
+
+    def test_replayed_writes_are_rolled_back_on_every_database(self):
+        for customer_id in range(1, 5):
+            customer = make_customer(customer_id)
+            Loan.objects.using(customer._state.db).create(
+                loan_id=customer_id, customer=customer, loan_amount=1000, tenure=12, interest_rate=12,
+                monthly_repayment=88.85, start_date=date.today(), end_date=date.today() + timedelta(days=360),
+            )
+        raise_id_floor('loan', 4)
+        before = self.counts()
+        phones = CustomerPhone.objects.count()
+
+        # Queries are captured on the customer's shard, whichever it is.
+        customer_id = max(range(1, 5), key=lambda customer_id: shard_for_customer(customer_id) != 'default')
+        stdout = StringIO()
+        call_command('advise_indexes', customer_id=customer_id, repeat=1, stdout=stdout)
+        self.assertIn(
+            f'Replaying queries for customer {customer_id} and loan {customer_id} on {shard_for_customer(customer_id)}',
+            stdout.getvalue(),
+        )
+        self.assertEqual(self.counts(), before)
+        self.assertEqual(CustomerPhone.objects.count(), phones)
+        # create-loan's debt update was rolled back too.
+        self.assertEqual(Customer.objects.using(shard_for_customer(customer_id)).get(pk=customer_id).current_debt, 0)
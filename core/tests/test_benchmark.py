@@ -0,0 +1,69 @@
+"""
+The pieces of benchmark_api that run without a server: the traffic mix, ID sampling
+and the comparison against a baseline.
+"""
+import random
+
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase
+
+from core.management.commands.benchmark_api import compare, parse_mix, sample_ids
+from core.models import Customer
+from core.tests.fixtures import make_customer
+
+
+class ParseMixTests(SimpleTestCase):
+
+    def test_weights_default_to_one(self):
+        self.assertEqual(
+            parse_mix('check-eligibility=5, view-loans,offers=0.5'),
+            {'check-eligibility': 5.0, 'view-loans': 1.0, 'offers': 0.5},
+        )
+
+    def test_invalid_mixes_are_rejected(self):
+        for mix in ('view-loan=1,unknown=2', 'view-loan=fast', 'view-loan=-1', 'view-loan=nan', 'view-loan=0,offers=0', ''):
+            with self.subTest(mix=mix), self.assertRaises(CommandError):
+                parse_mix(mix)
+
+
+def results(p95_ms=100.0, rps=50.0, queries_per_request=2.0):
+    return {'routes': {'view-loans': {
+        'p50_ms': 50.0, 'p95_ms': p95_ms, 'p99_ms': 200.0, 'rps': rps, 'queries_per_request': queries_per_request,
+    }}}
+
+
+class CompareTests(SimpleTestCase):
+
+    def test_drift_within_tolerance_is_not_a_regression(self):
+        self.assertEqual(compare(results(p95_ms=109.0, rps=46.0), results(), tolerance=0.1), [])
+
+    def test_slower_latency_and_lower_throughput_are_regressions(self):
+        self.assertEqual(
+            compare(results(p95_ms=111.0, rps=44.0), results(), tolerance=0.1),
+            ['view-loans: p95_ms 100.0 -> 111.0', 'view-loans: rps 50.0 -> 44.0'],
+        )
+
+    def test_any_extra_query_is_a_regression(self):
+        self.assertEqual(
+            compare(results(queries_per_request=2.1), results(), tolerance=0.5),
+            ['view-loans: queries_per_request 2.0 -> 2.1'],
+        )
+        # Unless either run was made without query counts.
+        self.assertEqual(compare(results(queries_per_request=3.0), results(queries_per_request=None), tolerance=0.1), [])
+
+    def test_routes_missing_from_the_baseline_are_skipped(self):
+        self.assertEqual(compare(results(p95_ms=1000.0), {'routes': {}}, tolerance=0.1), [])
+
+
+class SampleIdsTests(TestCase):
+
+    def test_samples_only_existing_ids(self):
+        customer_ids = list(range(1, 200, 3))
+        for customer_id in customer_ids:
+            make_customer(customer_id)
+        sample = sample_ids(Customer.objects.all(), 'customer_id', 20, random.Random(1))
+        self.assertEqual(len(sample), 20)
+        self.assertLessEqual(set(sample), set(customer_ids))
+        # Asking for more than exist returns them all.
+        self.assertEqual(sample_ids(Customer.objects.all(), 'customer_id', 1000, random.Random(1)), customer_ids)
+        self.assertEqual(sample_ids(Customer.objects.none(), 'customer_id', 10, random.Random(1)), [])
@@ -0,0 +1,66 @@
+"""
+Access to the loan export endpoint, which exposes customer names, phone numbers and salaries.
+"""
+import io
+import json
+from datetime import date
+
+import pyarrow.parquet as pq
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from core.models import Loan
+from core.tests.fixtures import make_customer
+
+
+@override_settings(EXPORT_API_KEYS=['export-key'])
+class ExportLoansPermissionTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        customer = make_customer()
+        Loan.objects.create(
+            loan_id=1, customer=customer, loan_amount=1000, tenure=12, interest_rate=12,
+            monthly_repayment=88.85, start_date=date(2024, 1, 1), end_date=date(2024, 12, 26),
+        )
+
+    def export(self, file_format='csv'):
+        return self.client.get('/api/export-loans/', {'file_format': file_format})
+
+    def test_anonymous_request_is_rejected(self):
+        response = self.export()
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(response.streaming)
+
+    def test_wrong_api_key_is_rejected(self):
+        self.client.credentials(HTTP_X_API_KEY='guessed-key')
+        self.assertEqual(self.export().status_code, 403)
+
+    def test_non_staff_user_is_rejected(self):
+        self.client.force_authenticate(User.objects.create_user('customer', password='x'))
+        self.assertEqual(self.export().status_code, 403)
+
+    def test_api_key_gets_the_streamed_csv(self):
+        self.client.credentials(HTTP_X_API_KEY='export-key')
+        response = self.export()
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('phone_number', lines[0])
+        self.assertIn('9000000001', lines[1])
+
+    def test_staff_user_gets_the_streamed_ndjson(self):
+        self.client.force_authenticate(User.objects.create_user('analyst', password='x', is_staff=True))
+        response = self.export('ndjson')
+        self.assertEqual(response.status_code, 200)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['loan_id'] for row in rows], [1])
+
+    def test_parquet_export_is_served(self):
+        self.client.credentials(HTTP_X_API_KEY='export-key')
+        response = self.export('parquet')
+        self.assertEqual(response.status_code, 200)
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.column('loan_id').to_pylist(), [1])
+        self.assertEqual(table.column('phone_number').to_pylist(), ['9000000001'])
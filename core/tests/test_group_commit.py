@@ -0,0 +1,66 @@
+"""
+Failure handling in group commit for create-loan.
+"""
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import date, timedelta
+from unittest import mock
+
+from django.db import IntegrityError
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from core.group_commit import GroupCommitter, PendingLoan
+from core.models import Loan
+from core.tests.fixtures import make_customer
+
+
+class GroupCommitFailureTests(TestCase):
+
+    def setUp(self):
+        self.customer = make_customer()
+
+    def pending_loan(self, tenure=12):
+        return PendingLoan(
+            Loan(
+                customer=self.customer, loan_amount=1000, tenure=tenure, interest_rate=12, monthly_repayment=88.85,
+                start_date=date.today(), end_date=date.today() + timedelta(days=360),
+            ),
+            1000,
+            Future(),
+        )
+
+    def test_a_loan_failing_a_constraint_does_not_fail_its_batch(self):
+        batch = [self.pending_loan() for _ in range(5)]
+        # A negative tenure fails the column's CHECK constraint.
+        batch[3] = self.pending_loan(tenure=-1)
+        with self.assertLogs('core.group_commit', 'ERROR'):
+            GroupCommitter(window=0, max_batch=100).commit(batch)
+
+        with self.assertRaises(IntegrityError):
+            batch[3].future.result()
+        saved = [pending.future.result() for index, pending in enumerate(batch) if index != 3]
+        self.assertEqual(
+            sorted(Loan.objects.values_list('loan_id', flat=True)),
+            sorted(loan.loan_id for loan in saved),
+        )
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.current_debt, 4000)
+
+    @override_settings(GROUP_COMMIT_ENABLED=True, GROUP_COMMIT_TIMEOUT=0.01)
+    def test_request_waits_for_a_slow_batch_instead_of_failing(self):
+        def commit_slowly(pending_loan, debt_increment):
+            future = mock.Mock(spec=Future)
+            # Not done within GROUP_COMMIT_TIMEOUT, then committed.
+            pending_loan.loan_id = 42
+            future.result.side_effect = [FutureTimeoutError(), pending_loan]
+            return future
+
+        committer = GroupCommitter(window=0, max_batch=100)
+        with mock.patch('core.views.get_group_committer', return_value=committer), \
+                mock.patch.object(committer, 'submit', side_effect=commit_slowly), \
+                self.assertLogs('core.group_commit', 'WARNING'):
+            response = APIClient().post('/api/create-loan/', {
+                'customer_id': 1, 'loan_amount': 100000, 'interest_rate': 12, 'tenure': 12,
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['loan_id'], 42)
@@ -0,0 +1,84 @@
+"""
+Idempotency-Key handling on create-loan, against an in-memory Redis (fakeredis).
+"""
+import json
+from unittest import mock
+
+import fakeredis
+import redis
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from core.idempotency import DONE, request_fingerprint
+from core.models import Loan
+from core.tests.fixtures import make_customer
+
+KEY = 'idempotency:create-loan::retry-1'
+
+
+class IdempotencyKeyTests(TestCase):
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch('core.idempotency.get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        make_customer()
+        self.request = {'customer_id': 1, 'loan_amount': 100000, 'interest_rate': 12, 'tenure': 12}
+
+    def create_loan(self, request=None):
+        return self.client.post(
+            '/api/create-loan/', request or self.request, format='json', HTTP_IDEMPOTENCY_KEY='retry-1'
+        )
+
+    def test_completed_key_replays_the_stored_response(self):
+        first = self.create_loan()
+        self.assertEqual(first.status_code, 201)
+        repeat = self.create_loan()
+        self.assertEqual(repeat.status_code, 201)
+        self.assertEqual(repeat.data, first.data)
+        self.assertEqual(repeat['Idempotent-Replayed'], 'true')
+        self.assertEqual(Loan.objects.count(), 1)
+
+    def test_key_reused_with_a_different_body_is_rejected(self):
+        self.create_loan()
+        response = self.create_loan({**self.request, 'loan_amount': 200000})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Loan.objects.count(), 1)
+
+    def test_duplicate_waits_for_the_in_flight_result(self):
+        # The first request holds the key; it finishes while the duplicate polls.
+        fingerprint = request_fingerprint(self.request)
+        self.redis.set(KEY, json.dumps({'state': 'in_flight', 'fingerprint': fingerprint}))
+        stored = {'state': DONE, 'fingerprint': fingerprint, 'status': 201, 'data': {'loan_id': 7}}
+
+        def first_request_finishes(seconds):
+            self.redis.set(KEY, json.dumps(stored))
+
+        with mock.patch('core.idempotency.time.sleep', side_effect=first_request_finishes) as sleep:
+            response = self.create_loan()
+        sleep.assert_called_once()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'loan_id': 7})
+        self.assertEqual(Loan.objects.count(), 0)
+
+    def test_redis_failure_after_the_loan_is_created_does_not_create_another(self):
+        real_set = self.redis.set
+
+        def fail_to_store(key, value, **kwargs):
+            if kwargs.get('nx'):
+                return real_set(key, value, **kwargs)
+            raise redis.ConnectionError('Redis went away')
+
+        with mock.patch.object(self.redis, 'set', side_effect=fail_to_store), self.assertLogs('core.idempotency', 'ERROR'):
+            response = self.create_loan()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Loan.objects.count(), 1)
+
+    def test_redis_down_before_the_key_is_claimed_handles_the_request(self):
+        with mock.patch.object(self.redis, 'set', side_effect=redis.ConnectionError('Redis is down')), \
+                self.assertLogs('core.idempotency', 'WARNING'):
+            response = self.create_loan()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Loan.objects.count(), 1)
@@ -0,0 +1,144 @@
+"""
+Checkpointing and resumption of ingest_data.
+"""
+import os
+import tempfile
+from datetime import date
+from unittest import mock
+
+import pandas as pd
+from django.test import TestCase
+
+from core import tasks
+from core.datagen import CSV_DATE_FORMAT, CUSTOMER_COLUMNS, LOAN_COLUMNS, generate
+from core.models import Customer, IngestionRun, Loan
+
+
+class ResumableIngestionTests(TestCase):
+    BATCH_SIZE = 20
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        customers, loans = next(generate(seed=11, num_customers=30, loans_per_customer=3, chunk_size=30, today=date(2024, 6, 30)))
+        for column in ('Date of Approval', 'End Date'):
+            loans[column] = loans[column].dt.strftime(CSV_DATE_FORMAT)
+        self.customer_file = os.path.join(directory.name, 'customer_data.csv')
+        self.loan_file = os.path.join(directory.name, 'loan_data.csv')
+        customers[CUSTOMER_COLUMNS].to_csv(self.customer_file, index=False)
+        loans[LOAN_COLUMNS].to_csv(self.loan_file, index=False)
+        self.num_customers, self.num_loans = len(customers), len(loans)
+
+    def test_resume_after_failure_skips_committed_batches(self):
+        real_ingest_loan_batch = tasks.ingest_loan_batch
+        calls = []
+
+        def failing_after_two_batches(loan_df, first_row_number):
+            calls.append(first_row_number)
+            if len(calls) == 3:
+                raise RuntimeError('worker lost')
+            real_ingest_loan_batch(loan_df, first_row_number)
+
+        with mock.patch.object(tasks, 'ingest_loan_batch', failing_after_two_batches):
+            with self.assertRaises(RuntimeError):
+                tasks.ingest_data(self.customer_file, self.loan_file, batch_size=self.BATCH_SIZE)
+
+        run = IngestionRun.objects.get()
+        self.assertEqual(run.status, 'FAILED')
+        self.assertEqual(run.stage, 'loans')
+        self.assertEqual(run.customer_rows_done, self.num_customers)
+        self.assertEqual(run.loan_rows_done, 2 * self.BATCH_SIZE)
+        self.assertEqual(run.rows_total, self.num_customers + self.num_loans)
+        self.assertEqual(Loan.objects.count(), 2 * self.BATCH_SIZE)
+
+        with mock.patch.object(tasks, 'ingest_loan_batch', wraps=real_ingest_loan_batch) as ingest_loan_batch:
+            result = tasks.ingest_data(run_id=run.pk)
+
+        self.assertEqual(result, 'Data ingestion completed successfully.')
+        # Resumed at the third batch, whose first row is CSV line 2 + 2 * BATCH_SIZE.
+        self.assertEqual(ingest_loan_batch.call_args_list[0].args[1], 2 + 2 * self.BATCH_SIZE)
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'COMPLETED')
+        self.assertEqual(run.rows_done, self.num_customers + self.num_loans)
+        self.assertEqual(Loan.objects.count(), self.num_loans)
+        self.assertEqual(Customer.objects.count(), self.num_customers)
+        self.assertEqual(tasks.ingest_data(run_id=run.pk), f'Ingestion run {run.pk} already completed.')
+
+    def test_resume_counts_parsed_rows_not_lines(self):
+        # Quoted names spanning two lines, and a blank line that the parser skips.
+        customers = pd.read_csv(self.customer_file)
+        customers['First Name'] = customers['First Name'] + '\nof line two'
+        header, rows = customers.to_csv(index=False).split('\n', 1)
+        with open(self.customer_file, 'w') as f:
+            f.write(f'{header}\n\n{rows}')
+
+        real_ingest_customer_batch = tasks.ingest_customer_batch
+        calls = []
+
+        def failing_after_one_batch(customer_df):
+            calls.append(customer_df)
+            if len(calls) == 2:
+                raise RuntimeError('worker lost')
+            real_ingest_customer_batch(customer_df)
+
+        with mock.patch.object(tasks, 'ingest_customer_batch', failing_after_one_batch):
+            with self.assertRaises(RuntimeError):
+                tasks.ingest_data(self.customer_file, self.loan_file, batch_size=self.BATCH_SIZE)
+        run = IngestionRun.objects.get()
+        self.assertEqual(run.customer_rows_done, self.BATCH_SIZE)
+
+        with mock.patch.object(tasks, 'ingest_customer_batch', wraps=real_ingest_customer_batch) as ingest_customer_batch:
+            tasks.ingest_data(run_id=run.pk)
+        resumed = ingest_customer_batch.call_args_list[0].args[0]
+        self.assertEqual(resumed['Customer ID'].tolist(), customers['Customer ID'].tolist()[self.BATCH_SIZE:])
+        self.assertEqual(
+            sorted(Customer.objects.values_list('customer_id', 'first_name')),
+            sorted(zip(customers['Customer ID'].tolist(), customers['First Name'].tolist())),
+        )
+
+    def fail_at_third_loan_batch(self):
+        real_ingest_loan_batch = tasks.ingest_loan_batch
+        calls = []
+
+        def failing_after_two_batches(loan_df, first_row_number):
+            calls.append(first_row_number)
+            if len(calls) == 3:
+                raise RuntimeError('worker lost')
+            real_ingest_loan_batch(loan_df, first_row_number)
+
+        with mock.patch.object(tasks, 'ingest_loan_batch', failing_after_two_batches):
+            with self.assertRaises(RuntimeError):
+                tasks.ingest_data(self.customer_file, self.loan_file, batch_size=self.BATCH_SIZE)
+        return IngestionRun.objects.get()
+
+    def test_resume_seeks_past_committed_rows(self):
+        run = self.fail_at_third_loan_batch()
+        with open(self.loan_file, 'rb') as f:
+            content = f.read()
+        header_end = content.index(b'\n') + 1
+        # The offset is the end of the second batch.
+        self.assertEqual(content[:run.loan_offset].count(b'\n'), 1 + 2 * self.BATCH_SIZE)
+
+        # Garble the committed rows in place: a resume that parsed them again would fail.
+        garbled = bytes(b if b in b'\n,' else ord('x') for b in content[header_end:run.loan_offset])
+        with open(self.loan_file, 'wb') as f:
+            f.write(content[:header_end] + garbled + content[run.loan_offset:])
+
+        self.assertEqual(tasks.ingest_data(run_id=run.pk), 'Data ingestion completed successfully.')
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'COMPLETED')
+        self.assertEqual(run.loan_offset, len(content))
+        self.assertEqual(Loan.objects.count(), self.num_loans)
+
+    def test_resume_fails_when_the_file_no_longer_fits_the_checkpoint(self):
+        run = self.fail_at_third_loan_batch()
+        with open(self.loan_file, 'r+b') as f:
+            f.truncate(run.loan_offset - 10)
+
+        self.assertEqual(
+            tasks.ingest_data(run_id=run.pk),
+            f'{self.loan_file}: byte {run.loan_offset} is not the end of row {2 * self.BATCH_SIZE}.',
+        )
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'FAILED')
+        self.assertEqual(Loan.objects.count(), 2 * self.BATCH_SIZE)
@@ -0,0 +1,77 @@
+"""
+/offers/ applies the same rules as check-eligibility to a grid of amounts and tenures.
+"""
+from datetime import date, timedelta
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from core.models import Loan
+from core.policy import offer_amounts
+from core.tests.fixtures import make_customer
+
+TENURES = [6, 12, 24, 36, 60]
+
+
+class OffersTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def customer_near_emi_cap(self, customer_id, current_debt=0):
+        customer = make_customer(customer_id, monthly_salary=50000, approved_limit=1800000, current_debt=current_debt)
+        # An ACTIVE loan using most of the EMI cap, so only part of the grid is approvable.
+        start_date = date.today() - timedelta(days=90)
+        Loan.objects.create(
+            loan_id=customer_id, customer=customer, loan_amount=400000, tenure=24, interest_rate=12,
+            monthly_repayment=20000, emis_paid_on_time=3, start_date=start_date,
+            end_date=start_date + timedelta(days=720),
+        )
+        return customer
+
+    def offers(self, customer, **params):
+        response = self.client.get(f'/api/offers/{customer.customer_id}/', {'tenure': TENURES, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def check_eligibility(self, customer, loan_amount, interest_rate, tenure):
+        return self.client.post('/api/check-eligibility/', {
+            'customer_id': customer.customer_id,
+            'loan_amount': loan_amount,
+            'interest_rate': interest_rate,
+            'tenure': tenure,
+        }, format='json').data
+
+    def test_offers_match_check_eligibility_for_every_combination(self):
+        customer = self.customer_near_emi_cap(1)
+        data = self.offers(customer, interest_rate=10, min_amount=10000, max_amount=300000, amount_steps=30)
+        offered = {(offer['loan_amount'], offer['tenure']): offer for offer in data['offers']}
+        self.assertTrue(offered)
+
+        approved = set()
+        for loan_amount in offer_amounts(10000, 300000, 30):
+            for tenure in TENURES:
+                eligibility = self.check_eligibility(customer, float(loan_amount), 10, tenure)
+                if not eligibility['approval']:
+                    continue
+                approved.add((float(loan_amount), tenure))
+                offer = offered.get((float(loan_amount), tenure))
+                self.assertIsNotNone(offer, f'{loan_amount} over {tenure} months is approved but not offered')
+                self.assertEqual(offer['monthly_installment'], eligibility['monthly_installment'])
+                self.assertEqual(data['corrected_interest_rate'], eligibility['corrected_interest_rate'])
+        self.assertEqual(set(offered), approved)
+        # Part of the grid is over the EMI cap.
+        self.assertLess(len(approved), len(offer_amounts(10000, 300000, 30)) * len(TENURES))
+
+    def test_customer_over_their_limit_gets_no_offers_and_no_approval(self):
+        customer = self.customer_near_emi_cap(1, current_debt=2000000)
+        self.assertEqual(self.offers(customer, interest_rate=10)['offers'], [])
+        self.assertFalse(self.check_eligibility(customer, 10000, 10, 12)['approval'])
+
+    def test_offered_amounts_stay_within_the_requested_range(self):
+        amounts = offer_amounts(10500, 20400, 3)
+        self.assertEqual(amounts.tolist(), [10500, 15000, 20000])
+        customer = self.customer_near_emi_cap(1)
+        for offer in self.offers(customer, interest_rate=10, min_amount=10500, max_amount=20400, amount_steps=3)['offers']:
+            self.assertGreaterEqual(offer['loan_amount'], 10500)
+            self.assertLessEqual(offer['loan_amount'], 20400)
@@ -0,0 +1,88 @@
+"""
+The partitioned `loans` table on PostgreSQL: migrating it back and forth, and keeping
+loan_id unique across partitions. Skipped on other databases.
+"""
+from datetime import date, timedelta
+from unittest import skipUnless
+
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+from core.models import Loan
+from core.partitions import create_loan_partition
+from core.tests.fixtures import make_customer
+
+
+def migrate(target):
+    executor = MigrationExecutor(connection)
+    executor.loader.build_graph()
+    executor.migrate([target])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'loans are only partitioned on PostgreSQL')
+class LoanPartitionMigrationTests(TransactionTestCase):
+
+    def tearDown(self):
+        migrate(MigrationExecutor(connection).loader.graph.leaf_nodes('core')[0])
+
+    def table_kind(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT relkind FROM pg_class WHERE relname = 'loans'")
+            return cursor.fetchone()[0]
+
+    def primary_key(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_get_constraintdef(oid) FROM pg_constraint WHERE conname = 'loans_pkey'")
+            return cursor.fetchone()[0]
+
+    def insert_loan(self, loan_id, start_date):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO loans (loan_id, customer_id, loan_amount, tenure, interest_rate, monthly_repayment, '
+                'emis_paid_on_time, start_date, end_date, status, created_at, updated_at) '
+                "VALUES (%s, 1, 1000, 12, 12, 88.85, 0, %s, %s, 'ACTIVE', NOW(), NOW())",
+                [loan_id, start_date, start_date + timedelta(days=360)],
+            )
+
+    def test_migrations_reverse_and_reapply_with_data(self):
+        make_customer()
+        self.insert_loan(1, date(2022, 5, 1))
+        self.insert_loan(2, date(2023, 5, 1))
+        self.assertEqual(self.table_kind(), 'p')
+        self.assertEqual(self.primary_key(), 'PRIMARY KEY (loan_id, start_date)')
+
+        migrate(('core', '0003_alter_customer_current_debt'))
+        self.assertEqual(self.table_kind(), 'r')
+        self.assertEqual(self.primary_key(), 'PRIMARY KEY (loan_id)')
+        self.assertEqual(sorted(Loan.objects.values_list('loan_id', flat=True)), [1, 2])
+
+        migrate(('core', '0006_loan_id_unique'))
+        self.assertEqual(self.table_kind(), 'p')
+        self.assertEqual(sorted(Loan.objects.values_list('loan_id', flat=True)), [1, 2])
+        # The registry was filled from the rows already there.
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.insert_loan(2, date(2022, 6, 1))
+
+    def test_loan_id_is_unique_across_partitions(self):
+        make_customer()
+        self.insert_loan(1, date(2023, 5, 1))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.insert_loan(1, date(2024, 5, 1))
+
+        # Moving a loan to another year's partition keeps its ID...
+        Loan.objects.filter(loan_id=1).update(start_date=date(2024, 5, 1))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.insert_loan(1, date(2022, 5, 1))
+        # ...and deleting it frees the ID again.
+        Loan.objects.filter(loan_id=1).delete()
+        self.insert_loan(1, date(2022, 5, 1))
+        self.assertEqual(Loan.objects.get(loan_id=1).start_date, date(2022, 5, 1))
+
+    def test_rows_moved_out_of_the_default_partition_keep_their_ids(self):
+        make_customer()
+        self.insert_loan(1, date(2099, 5, 1))
+        self.assertTrue(create_loan_partition(2099))
+        self.assertEqual(Loan.objects.get(loan_id=1).start_date, date(2099, 5, 1))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.insert_loan(1, date(2023, 5, 1))
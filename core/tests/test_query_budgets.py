@@ -0,0 +1,360 @@
+"""
+Query budgets for every endpoint and for ingest_data.
+
+Each endpoint is exercised for customers with 1, 10 and 1000 loans: the number of
+queries must stay the same and within budget whatever the loan count, and only
+view-loans may fetch rows in proportion to it.
+"""
+import math
+import os
+import tempfile
+from concurrent.futures import Future
+from contextlib import ExitStack
+from datetime import date, timedelta
+from unittest import mock
+
+from django.db import IntegrityError, connection
+from django.db.models.query import QuerySet
+from django.db.backends.utils import CursorWrapper
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from core.datagen import CSV_DATE_FORMAT, CUSTOMER_COLUMNS, LOAN_COLUMNS, generate
+from core.group_commit import GroupCommitter, PendingLoan
+from core.models import Customer, Loan
+from core.snapshots import SnapshotStore
+from core.tasks import ingest_data
+from core.tests.fixtures import make_customer
+
+LOAN_COUNTS = [1, 10, 1000]
+
+
+class QueryBudget:
+    """
+    Records the SQL queries run and the rows fetched from the database while active.
+    """
+
+    def __enter__(self):
+        self.rows = 0
+        self._stack = ExitStack()
+        self._captured = self._stack.enter_context(CaptureQueriesContext(connection))
+        for method in ('fetchone', 'fetchmany', 'fetchall'):
+            self._stack.enter_context(
+                mock.patch.object(CursorWrapper, method, self._counting(method), create=True)
+            )
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._stack.__exit__(*exc_info)
+
+    @property
+    def queries(self):
+        return len(self._captured)
+
+    def _counting(self, method):
+        budget = self
+
+        def fetch(cursor, *args):
+            result = getattr(cursor.cursor, method)(*args)
+            if method == 'fetchone':
+                budget.rows += result is not None
+            else:
+                budget.rows += len(result)
+            return result
+        return fetch
+
+
+class EndpointQueryBudgetTests(TestCase):
+    # Maximum queries per request, for any number of loans.
+    REGISTER_QUERIES = 5  # reserve customer_id, savepoint, phone number, insert, release savepoint
+    ELIGIBILITY_QUERIES = 2  # customer, loan summary
+    CREATE_LOAN_QUERIES = 5  # customer, loan summary, reserve loan_id, insert, debt update
+    VIEW_LOAN_QUERIES = 1  # loan joined with customer
+    VIEW_LOANS_QUERIES = 2  # customer, loans
+    OFFERS_QUERIES = 2  # customer, loan summary
+    EXPORT_QUERIES = 1  # loans joined with customers, fetched in chunks
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def make_customer(self, customer_id, num_loans):
+        """
+        A well-paid customer with `num_loans` loans, all but one fully repaid in past
+        years, so that every request takes the approval path.
+        """
+        customer = make_customer(customer_id, monthly_salary=1000000, approved_limit=36000000)
+        start_date = date.today().replace(year=date.today().year - 3)
+        Loan.objects.bulk_create([
+            Loan(
+                loan_id=customer_id * 10000 + index,
+                customer=customer,
+                loan_amount=1000,
+                tenure=12,
+                interest_rate=10,
+                monthly_repayment=88,
+                emis_paid_on_time=12 if index else 6,
+                start_date=start_date,
+                end_date=start_date + timedelta(days=360),
+                status='COMPLETED' if index else 'ACTIVE',
+            )
+            for index in range(num_loans)
+        ])
+        return customer
+
+    def measure(self, request):
+        with QueryBudget() as budget:
+            response = request()
+        return response, budget
+
+    def assertConstantQueries(self, budgets, max_queries):
+        query_counts = [budget.queries for budget in budgets]
+        self.assertEqual(len(set(query_counts)), 1, f'Query count depends on loan count: {query_counts}')
+        self.assertLessEqual(query_counts[0], max_queries)
+
+    def test_register(self):
+        for index, num_loans in enumerate(LOAN_COUNTS):
+            self.make_customer(index + 1, num_loans)
+        response, budget = self.measure(lambda: self.client.post('/api/register/', {
+            'first_name': 'New',
+            'last_name': 'Customer',
+            'age': 30,
+            'monthly_income': 50000,
+            'phone_number': '8000000001',
+        }, format='json'))
+        self.assertEqual(response.status_code, 201)
+        self.assertLessEqual(budget.queries, self.REGISTER_QUERIES)
+        self.assertLessEqual(budget.rows, 2)
+
+    def test_check_eligibility(self):
+        budgets = []
+        for index, num_loans in enumerate(LOAN_COUNTS):
+            customer = self.make_customer(index + 1, num_loans)
+            response, budget = self.measure(lambda: self.client.post('/api/check-eligibility/', {
+                'customer_id': customer.customer_id,
+                'loan_amount': 10000,
+                'interest_rate': 12,
+                'tenure': 12,
+            }, format='json'))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.data['approval'])
+            self.assertLessEqual(budget.rows, 2)
+            budgets.append(budget)
+        self.assertConstantQueries(budgets, self.ELIGIBILITY_QUERIES)
+
+    def test_check_eligibility_from_snapshots(self):
+        customers = [self.make_customer(index + 1, num_loans) for index, num_loans in enumerate(LOAN_COUNTS)]
+        store = SnapshotStore(max_age=300)
+        store.load()
+
+        def check(customer):
+            return self.measure(lambda: self.client.post('/api/check-eligibility/', {
+                'customer_id': customer.customer_id,
+                'loan_amount': 10000,
+                'interest_rate': 12,
+                'tenure': 12,
+            }, format='json'))
+
+        from_database = [check(customer)[0].data for customer in customers]
+        with mock.patch('core.snapshots.get_snapshot_store', return_value=store):
+            for customer, expected in zip(customers, from_database):
+                response, budget = check(customer)
+                self.assertEqual(response.data, expected)
+                self.assertEqual(budget.queries, 0)
+
+            # A change notification sends the next request to the database, which refreshes the row.
+            store.handle_message(str(customers[0].customer_id).encode())
+            self.assertEqual(check(customers[0])[1].queries, self.ELIGIBILITY_QUERIES)
+            self.assertEqual(check(customers[0])[1].queries, 0)
+
+    def test_create_loan(self):
+        budgets = []
+        for index, num_loans in enumerate(LOAN_COUNTS):
+            customer = self.make_customer(index + 1, num_loans)
+            response, budget = self.measure(lambda: self.client.post('/api/create-loan/', {
+                'customer_id': customer.customer_id,
+                'loan_amount': 10000,
+                'interest_rate': 12,
+                'tenure': 12,
+            }, format='json'))
+            self.assertEqual(response.status_code, 201)
+            self.assertLessEqual(budget.rows, 4)
+            budgets.append(budget)
+        self.assertConstantQueries(budgets, self.CREATE_LOAN_QUERIES)
+
+    def test_view_loan(self):
+        budgets = []
+        for index, num_loans in enumerate(LOAN_COUNTS):
+            customer = self.make_customer(index + 1, num_loans)
+            loan = customer.loans.order_by('-loan_id').first()
+            response, budget = self.measure(lambda: self.client.get(f'/api/view-loan/{loan.loan_id}/'))
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(budget.rows, 1)
+            budgets.append(budget)
+        self.assertConstantQueries(budgets, self.VIEW_LOAN_QUERIES)
+
+    def test_view_loans(self):
+        budgets = []
+        for index, num_loans in enumerate(LOAN_COUNTS):
+            customer = self.make_customer(index + 1, num_loans)
+            response, budget = self.measure(lambda: self.client.get(f'/api/view-loans/{customer.customer_id}/'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data), num_loans)
+            # The customer row plus the loans themselves.
+            self.assertLessEqual(budget.rows, num_loans + 1)
+            budgets.append(budget)
+        self.assertConstantQueries(budgets, self.VIEW_LOANS_QUERIES)
+
+    def test_offers(self):
+        budgets = []
+        for index, num_loans in enumerate(LOAN_COUNTS):
+            customer = self.make_customer(index + 1, num_loans)
+            response, budget = self.measure(lambda: self.client.get(
+                f'/api/offers/{customer.customer_id}/', {'interest_rate': 12, 'tenure': [12, 24]}
+            ))
+            self.assertEqual(response.status_code, 200)
+            installments = [offer['monthly_installment'] for offer in response.data['offers']]
+            self.assertTrue(installments)
+            self.assertEqual(installments, sorted(installments))
+            self.assertLessEqual(budget.rows, 2)
+            budgets.append(budget)
+        self.assertConstantQueries(budgets, self.OFFERS_QUERIES)
+
+    @override_settings(EXPORT_API_KEYS=['export-key'])
+    def test_export_loans(self):
+        self.client.credentials(HTTP_X_API_KEY='export-key')
+        budgets = []
+        total_loans = 0
+        for index, num_loans in enumerate(LOAN_COUNTS):
+            self.make_customer(index + 1, num_loans)
+            total_loans += num_loans
+            for file_format in ('csv', 'ndjson'):
+                def export():
+                    response = self.client.get('/api/export-loans/', {'file_format': file_format})
+                    return response, b''.join(response.streaming_content)
+                (response, content), budget = self.measure(export)
+                self.assertEqual(response.status_code, 200)
+                # One line per loan plus the CSV header.
+                self.assertEqual(content.count(b'\n'), total_loans + (file_format == 'csv'))
+                self.assertLessEqual(budget.rows, total_loans)
+                budgets.append(budget)
+        self.assertConstantQueries(budgets, self.EXPORT_QUERIES)
+
+
+class IngestQueryBudgetTests(TestCase):
+    # Small enough for one INSERT per batch within SQLite's 999 parameter limit.
+    BATCH_SIZE = 50
+    # Each batch commits with its IngestionRun checkpoint; under TestCase the transaction is a savepoint.
+    # savepoint, raise customer_id counter, release phone numbers, register phone numbers, upsert, checkpoint,
+    # release savepoint
+    CUSTOMER_BATCH_QUERIES = 7
+    # savepoint, existing customers, raise loan_id counter, delete, insert, checkpoint, release savepoint
+    LOAN_BATCH_QUERIES = 7
+    # run insert, run start, stage change, savepoint, current_debt update, run completion, release savepoint
+    FINAL_QUERIES = 7
+
+    def write_csvs(self, directory, num_customers, loans_per_customer):
+        customers, loans = next(generate(
+            seed=7, num_customers=num_customers, loans_per_customer=loans_per_customer,
+            chunk_size=num_customers, today=date(2024, 6, 30),
+        ))
+        for column in ('Date of Approval', 'End Date'):
+            loans[column] = loans[column].dt.strftime(CSV_DATE_FORMAT)
+        customer_file = os.path.join(directory, 'customer_data.csv')
+        loan_file = os.path.join(directory, 'loan_data.csv')
+        customers[CUSTOMER_COLUMNS].to_csv(customer_file, index=False)
+        loans[LOAN_COLUMNS].to_csv(loan_file, index=False)
+        return customer_file, loan_file, len(customers), len(loans)
+
+    def test_ingest_data(self):
+        for loans_per_customer in LOAN_COUNTS:
+            with self.subTest(loans_per_customer=loans_per_customer), tempfile.TemporaryDirectory() as directory:
+                Loan.objects.all().delete()
+                Customer.objects.all().delete()
+                customer_file, loan_file, num_customers, num_loans = self.write_csvs(directory, 3, loans_per_customer)
+
+                with QueryBudget() as budget:
+                    result = ingest_data(customer_file, loan_file, batch_size=self.BATCH_SIZE)
+
+                self.assertEqual(result, 'Data ingestion completed successfully.')
+                self.assertEqual(Loan.objects.count(), num_loans)
+                customer_batches = math.ceil(num_customers / self.BATCH_SIZE)
+                loan_batches = math.ceil(num_loans / self.BATCH_SIZE)
+                self.assertLessEqual(
+                    budget.queries,
+                    customer_batches * self.CUSTOMER_BATCH_QUERIES
+                    + loan_batches * self.LOAN_BATCH_QUERIES
+                    + self.FINAL_QUERIES
+                )
+                # Only the IDs of existing customers are read back, at most one per loan row.
+                self.assertLessEqual(budget.rows, num_loans)
+
+                # The bulk debt update agrees with the per-customer calculation (to the
+                # rupee, since current_debt is an integer column).
+                customer = Customer.objects.first()
+                ingested_debt = customer.current_debt
+                customer.update_current_debt()
+                customer.refresh_from_db()
+                self.assertAlmostEqual(float(ingested_debt), float(customer.current_debt), delta=1)
+
+
+class GroupCommitQueryBudgetTests(TestCase):
+    BATCH_QUERIES = 5  # reserve loan_ids, savepoint, insert, debt update, release savepoint
+
+    def test_batch_is_written_with_constant_queries(self):
+        customers = [make_customer(customer_id, current_debt=1000) for customer_id in (1, 2, 3)]
+        committer = GroupCommitter(window=0, max_batch=100)
+        # Up to 50 loans fit one INSERT within SQLite's 999 parameter limit.
+        for batch_size in (1, 10, 50):
+            batch = [
+                PendingLoan(
+                    Loan(
+                        customer=customers[index % len(customers)], loan_amount=1000, tenure=12,
+                        interest_rate=12, monthly_repayment=88.85, start_date=date.today(),
+                        end_date=date.today() + timedelta(days=360),
+                    ),
+                    1000,
+                    Future(),
+                )
+                for index in range(batch_size)
+            ]
+            first_loan_id = Loan.objects.count() + 1
+            with QueryBudget() as budget:
+                committer.commit(batch)
+            self.assertLessEqual(budget.queries, self.BATCH_QUERIES)
+            self.assertEqual(
+                [pending.future.result().loan_id for pending in batch],
+                list(range(first_loan_id, first_loan_id + batch_size)),
+            )
+
+        # Each customer's debt grew by 1000 for every loan it got.
+        loans_per_customer = {customer.customer_id: customer.loans.count() for customer in customers}
+        for customer in Customer.objects.all():
+            self.assertEqual(customer.current_debt, 1000 + 1000 * loans_per_customer[customer.customer_id])
+
+    def test_batch_is_retried_after_loan_id_collision(self):
+        customer = make_customer()
+        pending = PendingLoan(
+            Loan(
+                customer=customer, loan_amount=1000, tenure=12, interest_rate=12, monthly_repayment=88.85,
+                start_date=date.today(), end_date=date.today() + timedelta(days=360),
+            ),
+            1000,
+            Future(),
+        )
+        real_bulk_create = QuerySet.bulk_create
+        attempts = []
+
+        def collide_once(queryset, objs):
+            attempts.append([loan.loan_id for loan in objs])
+            if len(attempts) == 1:
+                raise IntegrityError('duplicate loan_id')
+            return real_bulk_create(queryset, objs)
+
+        with mock.patch.object(QuerySet, 'bulk_create', autospec=True, side_effect=collide_once):
+            GroupCommitter(window=0, max_batch=100).commit([pending])
+        # The retry reserves a fresh loan_id.
+        self.assertEqual(attempts, [[1], [2]])
+        self.assertEqual(pending.future.result().loan_id, 2)
+        customer.refresh_from_db()
+        self.assertEqual(customer.current_debt, 1000)
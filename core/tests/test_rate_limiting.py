@@ -0,0 +1,110 @@
+"""
+Token-bucket rate limiting and load shedding, against an in-memory Redis (fakeredis).
+"""
+import time
+from unittest import mock
+
+import fakeredis
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from core.tests.fixtures import make_customer
+
+
+class RedisTestCase(TestCase):
+    """
+    Points the request coordination code at a fresh in-memory Redis for each test.
+    """
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        for module in ('core.throttling', 'core.middleware'):
+            patcher = mock.patch(f'{module}.get_redis', return_value=self.redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.customer = make_customer()
+
+
+@override_settings(RATE_LIMITS={'view-loans': {'customer': '2/min'}})
+class TokenBucketThrottleTests(RedisTestCase):
+
+    def view_loans(self, now):
+        with mock.patch('core.throttling.time.time', return_value=now):
+            return self.client.get(f'/api/view-loans/{self.customer.customer_id}/')
+
+    def test_bucket_runs_out_and_refills(self):
+        now = time.time()
+        self.assertEqual(self.view_loans(now).status_code, 200)
+        self.assertEqual(self.view_loans(now).status_code, 200)
+        self.assertEqual(self.view_loans(now).status_code, 429)
+        # 2/min refills one token every 30 seconds.
+        self.assertEqual(self.view_loans(now + 29).status_code, 429)
+        self.assertEqual(self.view_loans(now + 59).status_code, 200)
+        self.assertEqual(self.view_loans(now + 59).status_code, 429)
+
+    def test_limited_request_gets_retry_after(self):
+        now = time.time()
+        self.view_loans(now)
+        self.view_loans(now)
+        response = self.view_loans(now + 10)
+        self.assertEqual(response.status_code, 429)
+        # 20 seconds until the next token, rounded up.
+        self.assertAlmostEqual(int(response['Retry-After']), 20, delta=1)
+
+    def test_customers_have_separate_buckets(self):
+        now = time.time()
+        for _ in range(3):
+            self.view_loans(now)
+        with mock.patch('core.throttling.time.time', return_value=now):
+            # A customer that does not exist still has its own, full bucket.
+            self.assertEqual(self.client.get('/api/view-loans/2/').status_code, 404)
+
+
+@override_settings(MAX_CONCURRENT_REQUESTS={'view-loans': 1})
+class LoadSheddingTests(RedisTestCase):
+
+    def test_full_route_is_shed_with_503(self):
+        # Another request holds the only slot.
+        self.redis.zadd('inflight:view-loans', {'other-request': time.time()})
+        response = self.client.get(f'/api/view-loans/{self.customer.customer_id}/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+        self.redis.zrem('inflight:view-loans', 'other-request')
+        self.assertEqual(self.client.get(f'/api/view-loans/{self.customer.customer_id}/').status_code, 200)
+        self.assertEqual(self.redis.zcard('inflight:view-loans'), 0)
+
+    def test_slot_is_released_when_the_view_raises(self):
+        with mock.patch('core.views.ViewLoansView.get', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.client.get(f'/api/view-loans/{self.customer.customer_id}/')
+        self.assertEqual(self.redis.zcard('inflight:view-loans'), 0)
+
+    def test_slots_of_dead_workers_are_reclaimed(self):
+        with override_settings(LOAD_SHEDDING_SLOT_TIMEOUT=30):
+            self.redis.zadd('inflight:view-loans', {'dead-worker': time.time() - 60})
+            self.assertEqual(self.client.get(f'/api/view-loans/{self.customer.customer_id}/').status_code, 200)
+
+
+@override_settings(RATE_LIMITS={'view-loans': {'client': '1/min'}}, EXPORT_API_KEYS=['export-key'])
+class ClientRateThrottleTests(RedisTestCase):
+
+    def view_loans(self, **headers):
+        return self.client.get(f'/api/view-loans/{self.customer.customer_id}/', **headers)
+
+    def test_client_chosen_header_does_not_give_a_new_bucket(self):
+        self.assertEqual(self.view_loans(HTTP_X_CLIENT_ID='client-1').status_code, 200)
+        self.assertEqual(self.view_loans(HTTP_X_CLIENT_ID='client-2').status_code, 429)
+        # Nor does an API key that is not configured.
+        self.assertEqual(self.view_loans(HTTP_X_API_KEY='made-up').status_code, 429)
+
+    def test_users_and_api_keys_have_their_own_buckets(self):
+        self.assertEqual(self.view_loans().status_code, 200)
+        self.assertEqual(self.view_loans(HTTP_X_API_KEY='export-key').status_code, 200)
+        self.assertEqual(self.view_loans(HTTP_X_API_KEY='export-key').status_code, 429)
+
+        self.client.force_authenticate(User.objects.create_user('analyst'))
+        self.assertEqual(self.view_loans().status_code, 200)
+        self.assertEqual(self.view_loans().status_code, 429)
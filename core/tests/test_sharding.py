@@ -0,0 +1,257 @@
+"""
+Customer sharding across the two test databases, 'default' and 'shard_1'.
+"""
+import os
+import tempfile
+from io import StringIO
+from concurrent.futures import Future
+from datetime import date, timedelta
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import IntegrityError, connections
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from core import tasks
+from core.datagen import CSV_DATE_FORMAT, CUSTOMER_COLUMNS, LOAN_COLUMNS, generate
+from core.export import export_rows
+from core.group_commit import GroupCommitter, PendingLoan
+from core.models import CreditScore, Customer, CustomerPhone, Loan
+from core.policy import load_customer_snapshots
+from core.sharding import customer_bucket, next_loan_id, raise_id_floor, shard_for_customer, shards_for_loan
+from core.tests.fixtures import make_customer
+
+SHARDS = {'default': (0, 512), 'shard_1': (512, 1024)}
+
+
+@skipUnless('shard_1' in settings.DATABASES, 'needs a second database, as in test_settings')
+@override_settings(CUSTOMER_SHARDS=SHARDS)
+class ShardingTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def register(self, index):
+        response = self.client.post('/api/register/', {
+            'first_name': 'Shard',
+            'last_name': f'Customer {index}',
+            'age': 30,
+            'monthly_income': 100000,
+            'phone_number': f'9{index:09d}',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['customer_id']
+
+    def ingest(self, num_customers, loans_per_customer):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        customers, loans = next(generate(
+            seed=3, num_customers=num_customers, loans_per_customer=loans_per_customer,
+            chunk_size=num_customers, today=date(2024, 6, 30),
+        ))
+        for column in ('Date of Approval', 'End Date'):
+            loans[column] = loans[column].dt.strftime(CSV_DATE_FORMAT)
+        customer_file = os.path.join(directory.name, 'customer_data.csv')
+        loan_file = os.path.join(directory.name, 'loan_data.csv')
+        customers[CUSTOMER_COLUMNS].to_csv(customer_file, index=False)
+        loans[LOAN_COLUMNS].to_csv(loan_file, index=False)
+        self.assertEqual(tasks.ingest_data(customer_file, loan_file, batch_size=25), 'Data ingestion completed successfully.')
+        return len(customers), len(loans)
+
+    def test_bucket_ranges_must_cover_every_bucket(self):
+        with override_settings(CUSTOMER_SHARDS={'default': (0, 512), 'shard_1': (600, 1024)}):
+            with self.assertRaises(ImproperlyConfigured):
+                shard_for_customer(1)
+
+    def test_endpoints_keep_customers_and_loans_on_their_shard(self):
+        customer_ids = [self.register(index) for index in range(1, 9)]
+        self.assertEqual(customer_ids, list(range(1, 9)))
+        self.assertEqual({shard_for_customer(customer_id) for customer_id in customer_ids}, set(SHARDS))
+        # Phone numbers are unique across shards.
+        response = self.client.post('/api/register/', {
+            'first_name': 'Again', 'last_name': 'Customer', 'age': 30, 'monthly_income': 100000,
+            'phone_number': '9000000008',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        loan_ids = []
+        for customer_id in customer_ids:
+            alias = shard_for_customer(customer_id)
+            other = next(other for other in SHARDS if other != alias)
+            self.assertTrue(Customer.objects.using(alias).filter(pk=customer_id).exists())
+            self.assertFalse(Customer.objects.using(other).filter(pk=customer_id).exists())
+
+            request = {'customer_id': customer_id, 'loan_amount': 100000, 'interest_rate': 12, 'tenure': 12}
+            self.assertTrue(self.client.post('/api/check-eligibility/', request, format='json').data['approval'])
+            response = self.client.post('/api/create-loan/', request, format='json')
+            self.assertEqual(response.status_code, 201)
+            loan_id = response.data['loan_id']
+            loan_ids.append(loan_id)
+            # The loan sits with its customer, and its ID points there first.
+            self.assertEqual(shards_for_loan(loan_id)[0], alias)
+            self.assertEqual(Customer.objects.using(alias).get(pk=customer_id).current_debt, 100000)
+
+            self.assertEqual(self.client.get(f'/api/view-loan/{loan_id}/').data['customer']['customer_id'], customer_id)
+            self.assertEqual([loan['loan_id'] for loan in self.client.get(f'/api/view-loans/{customer_id}/').data], [loan_id])
+            self.assertEqual(self.client.get(f'/api/offers/{customer_id}/', {'interest_rate': 12}).status_code, 200)
+
+        self.assertEqual(len(set(loan_ids)), len(loan_ids))
+        self.assertEqual(self.client.get(f'/api/view-loan/{max(loan_ids) + 1}/').status_code, 404)
+
+    def test_ingestion_splits_customers_with_their_loans(self):
+        num_customers, num_loans = self.ingest(40, 3)
+        counts = {alias: Customer.objects.using(alias).count() for alias in SHARDS}
+        self.assertEqual(sum(counts.values()), num_customers)
+        self.assertTrue(all(counts.values()), counts)
+        self.assertEqual(sum(Loan.objects.using(alias).count() for alias in SHARDS), num_loans)
+        for alias in SHARDS:
+            for loan in Loan.objects.using(alias).select_related('customer'):
+                self.assertEqual(shard_for_customer(loan.customer_id), alias)
+
+        # current_debt was recomputed on every shard.
+        for alias in SHARDS:
+            customer = Customer.objects.using(alias).filter(loans__status='ACTIVE').first()
+            ingested_debt = customer.current_debt
+            customer.update_current_debt()
+            self.assertAlmostEqual(float(ingested_debt), float(customer.current_debt), delta=1)
+
+        # Ingested loan IDs do not follow the shard residue; view-loan finds them anyway.
+        for alias in SHARDS:
+            loan = Loan.objects.using(alias).first()
+            self.assertEqual(self.client.get(f'/api/view-loan/{loan.loan_id}/').data['loan_id'], loan.loan_id)
+
+    def test_reports_gather_every_shard(self):
+        num_customers, num_loans = self.ingest(30, 2)
+
+        loan_ids = [row[0] for row in export_rows(chunk_size=7)]
+        self.assertEqual(len(loan_ids), num_loans)
+        self.assertEqual(loan_ids, sorted(loan_ids))
+
+        snapshots = load_customer_snapshots(chunk_size=7)
+        self.assertEqual(snapshots['customer_id'].tolist(), list(range(1, num_customers + 1)))
+        for name in ('monthly_salary', 'approved_limit'):
+            self.assertEqual(
+                snapshots[name].tolist(),
+                [
+                    getattr(Customer.objects.using(shard_for_customer(customer_id)).get(pk=customer_id), name)
+                    for customer_id in range(1, num_customers + 1)
+                ],
+            )
+
+    def test_group_commit_writes_each_shard(self):
+        customers = [make_customer(customer_id) for customer_id in range(1, 7)]
+        batch = [
+            PendingLoan(
+                Loan(
+                    customer=customer, loan_amount=1000, tenure=12, interest_rate=12, monthly_repayment=88.85,
+                    start_date=date.today(), end_date=date.today() + timedelta(days=360),
+                ),
+                1000,
+                Future(),
+            )
+            for customer in customers * 2
+        ]
+        GroupCommitter(window=0, max_batch=100).commit(batch)
+
+        loan_ids = [pending.future.result().loan_id for pending in batch]
+        self.assertEqual(len(set(loan_ids)), len(loan_ids))
+        for customer, pending in zip(customers * 2, batch):
+            alias = shard_for_customer(customer.customer_id)
+            self.assertEqual(shards_for_loan(pending.loan.loan_id)[0], alias)
+            self.assertTrue(Loan.objects.using(alias).filter(pk=pending.loan.loan_id, customer=customer).exists())
+        for customer in customers:
+            customer.refresh_from_db()
+            self.assertEqual(customer.current_debt, 2000)
+
+    def test_registration_allocates_ids_and_phone_numbers_across_shards(self):
+        num_customers, _ = self.ingest(20, 1)
+        self.assertEqual(CustomerPhone.objects.count(), num_customers)
+        # A number ingested onto either shard is taken.
+        for alias in SHARDS:
+            customer = Customer.objects.using(alias).first()
+            response = self.client.post('/api/register/', {
+                'first_name': 'Again', 'last_name': 'Customer', 'age': 30, 'monthly_income': 100000,
+                'phone_number': customer.phone_number,
+            }, format='json')
+            self.assertEqual(response.status_code, 400)
+        # New IDs continue after the ingested ones, from one counter.
+        self.assertEqual(self.register(101), num_customers + 3)
+        self.assertEqual(self.register(102), num_customers + 4)
+        self.assertEqual(CustomerPhone.objects.get(phone_number='9000000102').customer_id, num_customers + 4)
+
+    def test_moving_buckets_keeps_customers_with_their_loans(self):
+        num_customers, num_loans = self.ingest(30, 2)
+        Customer.objects.using('shard_1').update(current_debt=1234)
+        moving = list(Customer.objects.using('shard_1').order_by('customer_id'))
+        CreditScore.objects.using('shard_1').create(customer=moving[0], score=70)
+        self.assertTrue(moving)
+
+        stdout = StringIO()
+        call_command('move_customer_buckets', '512', '1024', 'default', batch_size=4, stdout=stdout)
+        self.assertIn(f'Moved {len(moving)} customers', stdout.getvalue())
+        self.assertEqual(Customer.objects.using('shard_1').count(), 0)
+        self.assertEqual(Loan.objects.using('shard_1').count(), 0)
+        self.assertEqual(CreditScore.objects.using('shard_1').count(), 0)
+        self.assertEqual(Customer.objects.using('default').count(), num_customers)
+        self.assertEqual(Loan.objects.using('default').count(), num_loans)
+        moved = list(Customer.objects.using('default').filter(pk__in=[customer.pk for customer in moving]).order_by('customer_id'))
+        self.assertEqual(
+            [(customer.pk, customer.current_debt, customer.created_at) for customer in moved],
+            [(customer.pk, customer.current_debt, customer.created_at) for customer in moving],
+        )
+        self.assertEqual(CreditScore.objects.using('default').get().customer_id, moving[0].pk)
+
+        # With the range given to 'default', shard_1 keeps no buckets and its customers are served from 'default'.
+        with override_settings(CUSTOMER_SHARDS={'default': (0, 1024), 'shard_1': (0, 0)}):
+            customer = moving[0]
+            self.assertGreaterEqual(customer_bucket(customer.pk), 512)
+            response = self.client.get(f'/api/view-loans/{customer.pk}/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data), Loan.objects.using('default').filter(customer_id=customer.pk).count())
+            self.assertEqual(self.register(101), num_customers + 1)
+
+    def test_moving_buckets_raises_the_id_counters(self):
+        # Rows written behind the counters' back, as before they were kept up to date.
+        customer_id = next(customer_id for customer_id in range(500, 600) if shard_for_customer(customer_id) == 'shard_1')
+        customer = Customer.objects.using('shard_1').create(
+            customer_id=customer_id, first_name='Moved', last_name='Customer', age=30,
+            phone_number='9000000500', monthly_salary=100000, approved_limit=3600000,
+        )
+        Loan.objects.using('shard_1').create(
+            loan_id=7000, customer=customer, loan_amount=1000, tenure=12, interest_rate=12, monthly_repayment=88.85,
+            start_date=date.today(), end_date=date.today() + timedelta(days=360),
+        )
+
+        call_command('move_customer_buckets', '512', '1024', 'default', stdout=StringIO())
+        with override_settings(CUSTOMER_SHARDS={'default': (0, 1024), 'shard_1': (0, 0)}):
+            self.assertEqual(self.register(101), customer_id + 1)
+            self.assertEqual(next_loan_id('default'), 7002)
+
+    def test_registration_deletes_the_customer_when_default_fails_to_commit(self):
+        customer_id = next(customer_id for customer_id in range(1, 100) if shard_for_customer(customer_id) == 'shard_1')
+        raise_id_floor('customer', customer_id - 1)
+        default = connections['default']
+        real_savepoint_commit = default.savepoint_commit
+        calls = []
+
+        def failing_once(sid):
+            # Under TestCase, committing the registry's transaction releases a savepoint.
+            calls.append(sid)
+            if len(calls) == 1:
+                raise IntegrityError('commit failed')
+            real_savepoint_commit(sid)
+
+        with mock.patch.object(default, 'savepoint_commit', failing_once):
+            response = self.client.post('/api/register/', {
+                'first_name': 'Lost', 'last_name': 'Customer', 'age': 30, 'monthly_income': 100000,
+                'phone_number': '9000000001',
+            }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Customer.objects.using('shard_1').filter(pk=customer_id).exists())
+        self.assertFalse(CustomerPhone.objects.exists())
+        # The number is free again.
+        self.assertEqual(self.register(1), customer_id + 1)
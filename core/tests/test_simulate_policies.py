@@ -0,0 +1,63 @@
+"""
+simulate_policies reaches the same decisions as the per-request rules of check-eligibility.
+"""
+import json
+import os
+import tempfile
+from io import StringIO
+
+import numpy as np
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.datagen import sample_loan_terms
+from core.models import Customer
+from core.policy import DEFAULT_POLICY, credit_scores, evaluate_request
+from core.snapshots import customer_snapshot
+from core.tests.fixtures import make_customer
+
+SEED = 7
+
+
+class SimulatePoliciesTests(TestCase):
+
+    def simulate(self):
+        with tempfile.TemporaryDirectory() as directory:
+            json_path = os.path.join(directory, 'policies.json')
+            call_command('simulate_policies', seed=SEED, workers=1, json_path=json_path, stdout=StringIO())
+            with open(json_path) as f:
+                return json.load(f)
+
+    def test_default_policy_counts_match_evaluate_request(self):
+        call_command('generate_data', customers=40, output_format='db', seed=3, stdout=StringIO())
+        # Over their limit, and a limit so large that doubling it overflows int32.
+        make_customer(41, current_debt=5000000)
+        make_customer(42, monthly_salary=4000000, approved_limit=1500000000)
+
+        customers = list(Customer.objects.order_by('customer_id'))
+        salaries = np.array([customer.monthly_salary for customer in customers])
+        loan_amounts, interest_rates, tenures = sample_loan_terms(np.random.default_rng(SEED), salaries)
+        expected = {'approved': 0, 'rejected_score': 0, 'rejected_debt': 0, 'rejected_emi_cap': 0}
+        for customer, loan_amount, interest_rate, tenure in zip(customers, loan_amounts, interest_rates, tenures):
+            snapshot = customer_snapshot(customer)
+            approved, _, _ = evaluate_request(DEFAULT_POLICY, snapshot, loan_amount, interest_rate, int(tenure))
+            if approved:
+                expected['approved'] += 1
+            elif snapshot.credit_score <= DEFAULT_POLICY.low_slab:
+                expected['rejected_score'] += 1
+            elif snapshot.current_debt > snapshot.approved_limit:
+                expected['rejected_debt'] += 1
+            else:
+                expected['rejected_emi_cap'] += 1
+
+        default = self.simulate()[0]
+        self.assertEqual(default['policy'], DEFAULT_POLICY._asdict())
+        self.assertEqual(default['requests'], len(customers))
+        self.assertEqual({metric: default[metric] for metric in expected}, expected)
+        self.assertGreaterEqual(expected['rejected_debt'], 1)
+
+    def test_large_limits_do_not_overflow(self):
+        limit = np.array([1500000000], dtype=np.int32)
+        no_loans = np.zeros(1, dtype=np.int32)
+        # No loan volume at all earns the full 35 points, plus 30 for a perfect record and 15 for no loans this year.
+        self.assertEqual(credit_scores(limit, no_loans, no_loans, no_loans, no_loans, np.zeros(1)).tolist(), [80])
@@ -0,0 +1,31 @@
+"""
+What importing the WSGI application does, which gunicorn's preload_app runs once in the master.
+"""
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+CHECK_IMPORT = """
+import sys, threading
+from django.db import connections
+from credit_approval_system.wsgi import application
+print(sorted(name for name in ('pandas', 'core.tasks') if name in sys.modules))
+print(threading.active_count())
+print(sum(connection.connection is not None for connection in connections.all(initialized_only=True)))
+"""
+
+
+class WarmStartupTests(SimpleTestCase):
+
+    def test_wsgi_import_loads_no_ingestion_modules_and_leaves_nothing_to_fork(self):
+        # A fresh interpreter, with the settings module the tests run under.
+        output = subprocess.run(
+            [sys.executable, '-c', CHECK_IMPORT], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.split('\n')
+        # pandas is only needed to ingest CSVs, which web workers never do.
+        self.assertEqual(output[0], '[]')
+        # No threads or open connections that a forked worker would inherit.
+        self.assertEqual(output[1], '1')
+        self.assertEqual(output[2], '0')
@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import time
+
+import redis
+from django.conf import settings
+from rest_framework.throttling import BaseThrottle
+
+from .permissions import export_api_key
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Refill the bucket for the time elapsed since the last request, then try to take one token.
+# Returns {allowed, seconds until a token is available}; the wait is a string because Redis
+# truncates Lua numbers to integers.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill_rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local last = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - last) * refill_rate)
+local allowed = 0
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait = (1 - tokens) / refill_rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill_rate) + 1)
+return {allowed, tostring(wait)}
+"""
+
+
+def parse_rate(rate):
+    """
+    Parse a rate string such as "30/min" into (bucket capacity, period in seconds).
+    """
+    num, period = rate.split('/')
+    duration = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+    return int(num), duration
+
+
+def get_route_name(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    return resolver_match.url_name if resolver_match else None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Redis-backed token bucket limiter.
+
+    Limits are configured per `core.urls` route name in `settings.RATE_LIMITS`,
+    e.g. {'create-loan': {'customer': '10/min', 'client': '300/min'}}. Routes or
+    scopes without an entry are not limited. If Redis is unreachable the request
+    is allowed through rather than failing the API.
+    """
+    scope = None
+
+    def get_identity(self, request, view):
+        raise NotImplementedError('.get_identity() must be overridden')
+
+    def allow_request(self, request, view):
+        self.wait_seconds = None
+        route = get_route_name(request)
+        rate = settings.RATE_LIMITS.get(route, {}).get(self.scope)
+        if not rate:
+            return True
+
+        identity = self.get_identity(request, view)
+        if identity is None:
+            return True
+
+        capacity, period = parse_rate(rate)
+        key = f'ratelimit:{route}:{self.scope}:{identity}'
+        try:
+            allowed, wait = get_redis().eval(
+                TOKEN_BUCKET_SCRIPT, 1, key, capacity, capacity / period, time.time()
+            )
+        except redis.RedisError:
+            logger.warning('Rate limiter unavailable, allowing request to %s', route, exc_info=True)
+            return True
+
+        if allowed:
+            return True
+        self.wait_seconds = float(wait)
+        return False
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class CustomerRateThrottle(TokenBucketThrottle):
+    """
+    Limits requests per customer_id, taken from the URL or the request body.
+    """
+    scope = 'customer'
+
+    def get_identity(self, request, view):
+        customer_id = view.kwargs.get('customer_id')
+        if customer_id is None and hasattr(request.data, 'get'):
+            customer_id = request.data.get('customer_id')
+        try:
+            return int(customer_id)
+        except (TypeError, ValueError):
+            # Missing or malformed IDs are rejected by the serializer instead.
+            return None
+
+
+class ClientRateThrottle(TokenBucketThrottle):
+    """
+    Limits requests per API client: the signed-in user, else a valid X-Api-Key, else the
+    client IP. Headers the client can choose freely (such as X-Client-Id) are not used,
+    since changing them per request would give every request a new bucket.
+    """
+    scope = 'client'
+
+    def get_identity(self, request, view):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.pk}'
+        api_key = export_api_key(request)
+        if api_key is not None:
+            # Keys are not written to Redis as they are.
+            return f'key:{hashlib.sha256(api_key.encode()).hexdigest()[:16]}'
+        return self.get_ident(request)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import RegisterView, CheckEligibilityView, CreateLoanView, ViewLoanView, ViewLoansView
+from .views import RegisterView, CheckEligibilityView, CreateLoanView, ViewLoanView, ViewLoansView, ExportLoansView, OffersView
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
@@ -7,4 +7,6 @@ urlpatterns = [
     path('create-loan/', CreateLoanView.as_view(), name='create-loan'),
     path('view-loan/<int:loan_id>/', ViewLoanView.as_view(), name='view-loan'),
     path('view-loans/<int:customer_id>/', ViewLoansView.as_view(), name='view-loans'),
+    path('offers/<int:customer_id>/', OffersView.as_view(), name='offers'),
+    path('export-loans/', ExportLoansView.as_view(), name='export-loans'),
 ]
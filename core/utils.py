@@ -1,15 +1,36 @@
-from .models import Loan, Customer
+from .models import Customer
 from django.utils import timezone
-from django.db.models import Sum, Count
+from django.db.models import Sum, Count, Q
 
-def calculate_credit_score(customer: Customer) -> int:
+
+def get_loan_summary(customer: Customer) -> dict:
+    """
+    Aggregates everything the credit score and eligibility rules need from a
+    customer's loans in a single query, so the cost does not grow with loan count.
+    The query runs on the customer's shard.
+    """
+    summary = customer.loans.aggregate(
+        total_emis_paid_on_time=Sum('emis_paid_on_time'),
+        total_tenure=Sum('tenure'),
+        num_loans=Count('pk'),
+        current_year_loans=Count('pk', filter=Q(start_date__year=timezone.now().year)),
+        total_loan_volume=Sum('loan_amount'),
+        total_current_emi=Sum('monthly_repayment', filter=Q(status='ACTIVE')),
+    )
+    return {key: value or 0 for key, value in summary.items()}
+
+
+def calculate_credit_score(customer: Customer, loan_summary: dict = None) -> int:
     """
     Calculates the credit score for a given customer based on historical loan data.
+    Pass a `loan_summary` from get_loan_summary() to reuse an aggregate already fetched.
     """
+    if loan_summary is None:
+        loan_summary = get_loan_summary(customer)
+
     # Component 1: Past Loans paid on time vs. total EMIs
-    past_loans = Loan.objects.filter(customer=customer)
-    total_emis_paid_on_time = past_loans.aggregate(total=Sum('emis_paid_on_time'))['total'] or 0
-    total_tenure_sum = past_loans.aggregate(total=Sum('tenure'))['total'] or 0
+    total_emis_paid_on_time = loan_summary['total_emis_paid_on_time']
+    total_tenure_sum = loan_summary['total_tenure']
 
     # A simple ratio for on-time payments. More complex logic can be added.
     # For now, let's assume a score based on the percentage of on-time payments.
@@ -20,15 +41,15 @@ def calculate_credit_score(customer: Customer) -> int:
         score_from_payments = 30 # No loans, perfect record so far
 
     # Component 2: Number of loans taken in the past
-    num_loans = past_loans.count()
+    num_loans = loan_summary['num_loans']
     score_from_num_loans = min(num_loans * 5, 20) # Max 20 points
 
     # Component 3: Loan activity in the current year (less is better)
-    current_year_loans = past_loans.filter(start_date__year=timezone.now().year).count()
+    current_year_loans = loan_summary['current_year_loans']
     score_from_activity = max(15 - (current_year_loans * 5), 0) # Max 15 points
 
     # Component 4: Loan approved volume (lower is better)
-    total_loan_volume = past_loans.aggregate(total=Sum('loan_amount'))['total'] or 0
+    total_loan_volume = loan_summary['total_loan_volume']
     if total_loan_volume > customer.approved_limit * 2: # High debt ratio
         score_from_volume = 0
     elif total_loan_volume > customer.approved_limit:
@@ -5,15 +5,24 @@ from .serializers import (
     RegisterRequestSerializer, RegisterResponseSerializer, 
     EligibilityRequestSerializer, EligibilityResponseSerializer,
     CreateLoanRequestSerializer, CreateLoanResponseSerializer,
-    ViewLoanResponseSerializer, ViewLoansResponseSerializer
+    ViewLoanResponseSerializer, ViewLoansResponseSerializer,
+    ExportLoansRequestSerializer, OffersRequestSerializer, OffersResponseSerializer
 )
-from .models import Customer, Loan
+from .models import Customer, CustomerPhone, Loan
 from django.utils import timezone
 from datetime import timedelta
-from .utils import calculate_credit_score
+from .idempotency import idempotent
+from .policy import DEFAULT_POLICY, evaluate_offers, evaluate_request, offer_amounts
+from .snapshots import customer_snapshot, get_customer_snapshot, publish_customer_change
+from .group_commit import get_group_committer
+from .sharding import next_customer_id, next_loan_id, shard_for_customer, shards_for_loan
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from .export import CONTENT_TYPES, ExportError, export_rows, stream_export
+from .permissions import IsStaffOrExportApiKey
+from django.http import StreamingHttpResponse
 import math
-from django.db.models import Max
-from decimal import Decimal
+import numpy as np
 
 
 class RegisterView(APIView):
@@ -25,29 +34,41 @@ class RegisterView(APIView):
         if serializer.is_valid():
             data = serializer.validated_data
             
-            # Check if customer with phone number already exists
-            if Customer.objects.filter(phone_number=data['phone_number']).exists():
-                return Response({'error': 'Customer with this phone number already exists.'}, status=status.HTTP_400_BAD_REQUEST)
-
             # Calculate approved limit: 36 * monthly_salary, rounded to nearest lakh
             monthly_salary = data['monthly_income']
             approved_limit = round(36 * monthly_salary / 100000) * 100000
 
             # Get the next available customer_id
-            last_customer_id = Customer.objects.aggregate(max_id=Max('customer_id'))['max_id']
-            new_customer_id = (last_customer_id or 0) + 1
-
-            # Create customer instance
-            customer = Customer.objects.create(
-                customer_id=new_customer_id,
-                first_name=data['first_name'],
-                last_name=data['last_name'],
-                age=data['age'],
-                monthly_salary=monthly_salary,
-                phone_number=data['phone_number'],
-                approved_limit=approved_limit
-            )
-            
+            new_customer_id = next_customer_id()
+
+            # Claim the phone number in the registry on 'default', which rejects a number
+            # used on any shard, then create the customer on the shard that owns its
+            # customer_id. The shard commits first, so if 'default' then fails to commit,
+            # the customer is deleted again rather than left without its phone number.
+            shard = shard_for_customer(new_customer_id)
+            customer = None
+            try:
+                with transaction.atomic(using='default'):
+                    CustomerPhone.objects.using('default').create(
+                        phone_number=data['phone_number'], customer_id=new_customer_id
+                    )
+                    with transaction.atomic(using=shard, savepoint=False):
+                        customer = Customer.objects.using(shard).create(
+                            customer_id=new_customer_id,
+                            first_name=data['first_name'],
+                            last_name=data['last_name'],
+                            age=data['age'],
+                            monthly_salary=monthly_salary,
+                            phone_number=data['phone_number'],
+                            approved_limit=approved_limit
+                        )
+            except Exception as e:
+                if customer is not None and shard != 'default':
+                    Customer.objects.using(shard).filter(pk=new_customer_id).delete()
+                if isinstance(e, IntegrityError):
+                    return Response({'error': 'Customer with this phone number already exists.'}, status=status.HTTP_400_BAD_REQUEST)
+                raise
+
             # Prepare and return the response
             response_serializer = RegisterResponseSerializer(customer)
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
@@ -70,41 +91,16 @@ class CheckEligibilityView(APIView):
         interest_rate = data['interest_rate']
         tenure = data['tenure']
 
-        try:
-            customer = Customer.objects.get(pk=customer_id)
-        except Customer.DoesNotExist:
+        # Served from the in-memory snapshot store when it is enabled.
+        snapshot = get_customer_snapshot(customer_id)
+        if snapshot is None:
             return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        credit_score = calculate_credit_score(customer)
-        
-        # Rule 1: Check current debt vs approved limit
-        if customer.current_debt > customer.approved_limit:
-            approval = False
-
-        # Rule 2: Credit score based approval and interest rate correction
-        corrected_interest_rate = interest_rate
-        if credit_score > 50:
-            approval = True
-        elif 30 < credit_score <= 50:
-            approval = True
-            if corrected_interest_rate < 12.0:
-                 corrected_interest_rate = 12.0
-        elif 10 < credit_score <= 30:
-            approval = True
-            if corrected_interest_rate < 16.0:
-                corrected_interest_rate = 16.0
-        else: # credit_score <= 10
-            approval = False
-
-        # Rule 3: Check if sum of all current EMIs > 50% of monthly salary
-        current_loans = Loan.objects.filter(customer=customer, status='ACTIVE')
-        total_current_emi = sum([loan.monthly_repayment for loan in current_loans])
-        
-        # Calculate EMI for the new loan
-        new_emi = (loan_amount * (corrected_interest_rate / 1200) * (1 + (corrected_interest_rate / 1200))**tenure) / ((1 + (corrected_interest_rate / 1200))**tenure - 1)
-
-        if total_current_emi + Decimal(str(new_emi)) > customer.monthly_salary * 0.5:
-            approval = False
+        # Current debt within the approved limit, credit score slabs (which may raise the
+        # interest rate) and the EMI cap: the same rules as create-loan and /offers/.
+        approval, corrected_interest_rate, new_emi = evaluate_request(
+            DEFAULT_POLICY, snapshot, loan_amount, interest_rate, tenure
+        )
 
         response_data = {
             'customer_id': customer_id,
@@ -121,7 +117,9 @@ class CheckEligibilityView(APIView):
 class CreateLoanView(APIView):
     """
     API endpoint to create a new loan for a customer.
+    Supports the Idempotency-Key header so client retries do not create duplicate loans.
     """
+    @idempotent('create-loan')
     def post(self, request):
         serializer = CreateLoanRequestSerializer(data=request.data)
         if not serializer.is_valid():
@@ -134,44 +132,18 @@ class CreateLoanView(APIView):
         tenure = data['tenure']
 
         try:
-            customer = Customer.objects.get(pk=customer_id)
+            customer = Customer.objects.using(shard_for_customer(customer_id)).get(pk=customer_id)
         except Customer.DoesNotExist:
             return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        # Perform eligibility check
-        credit_score = calculate_credit_score(customer)
-        approval = True
-        corrected_interest_rate = interest_rate
-
-        if customer.current_debt > customer.approved_limit:
-            approval = False
-
-        if credit_score > 50:
-            pass # Approved with given interest rate
-        elif 30 < credit_score <= 50:
-            if corrected_interest_rate < 12.0:
-                corrected_interest_rate = 12.0
-        elif 10 < credit_score <= 30:
-            if corrected_interest_rate < 16.0:
-                corrected_interest_rate = 16.0
-        else: # credit_score <= 10
-            approval = False
-
-        current_loans = Loan.objects.filter(customer=customer, status='ACTIVE')
-        total_current_emi = sum([loan.monthly_repayment for loan in current_loans])
-        new_emi = (loan_amount * (corrected_interest_rate / 1200) * (1 + (corrected_interest_rate / 1200))**tenure) / ((1 + (corrected_interest_rate / 1200))**tenure - 1)
-
-        if total_current_emi + Decimal(str(new_emi)) > customer.monthly_salary * 0.5:
-            approval = False
+        # Perform eligibility check, as check-eligibility does
+        approval, corrected_interest_rate, new_emi = evaluate_request(
+            DEFAULT_POLICY, customer_snapshot(customer), loan_amount, interest_rate, tenure
+        )
 
         # Create loan if approved
         if approval:
-            # Get the next available loan_id
-            last_loan_id = Loan.objects.aggregate(max_id=Max('loan_id'))['max_id']
-            new_loan_id = (last_loan_id or 0) + 1
-
-            loan = Loan.objects.create(
-                loan_id=new_loan_id,
+            loan = Loan(
                 customer=customer,
                 loan_amount=loan_amount,
                 interest_rate=corrected_interest_rate,
@@ -181,9 +153,18 @@ class CreateLoanView(APIView):
                 end_date=timezone.now().date() + timedelta(days=30*tenure),
                 status='ACTIVE'
             )
-            # Update customer's current debt
-            customer.current_debt += loan_amount
-            customer.save()
+            if settings.GROUP_COMMIT_ENABLED:
+                # Written with other requests' loans in one transaction (see core.group_commit)
+                loan = get_group_committer().write(loan, int(loan_amount))
+            else:
+                # Get the next available loan_id for the customer's shard
+                loan.loan_id = next_loan_id(customer._state.db)
+                loan.save(force_insert=True)
+
+                # Update customer's current debt
+                customer.current_debt += loan_amount
+                customer.save(update_fields=['current_debt', 'updated_at'])
+                publish_customer_change(customer.customer_id)
 
             response_data = {
                 'loan_id': loan.loan_id,
@@ -209,13 +190,15 @@ class ViewLoanView(APIView):
     API endpoint to view details of a specific loan.
     """
     def get(self, request, loan_id):
-        try:
-            loan = Loan.objects.get(loan_id=loan_id)
-        except Loan.DoesNotExist:
-            return Response({'error': 'Loan not found'}, status=status.HTTP_404_NOT_FOUND)
-
-        serializer = ViewLoanResponseSerializer(loan)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Loans created here are found on the first shard tried; ingested ones may need the others.
+        for alias in shards_for_loan(loan_id):
+            try:
+                loan = Loan.objects.using(alias).select_related('customer').get(loan_id=loan_id)
+            except Loan.DoesNotExist:
+                continue
+            serializer = ViewLoanResponseSerializer(loan)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response({'error': 'Loan not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
 class ViewLoansView(APIView):
@@ -224,10 +207,81 @@ class ViewLoansView(APIView):
     """
     def get(self, request, customer_id):
         try:
-            customer = Customer.objects.get(pk=customer_id)
+            customer = Customer.objects.using(shard_for_customer(customer_id)).get(pk=customer_id)
         except Customer.DoesNotExist:
             return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        loans = Loan.objects.filter(customer=customer)
+        loans = customer.loans.all()
         serializer = ViewLoansResponseSerializer(loans, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class ExportLoansView(APIView):
+    """
+    API endpoint to stream all loans, joined with their customer, as CSV, NDJSON or Parquet.
+    The export includes customers' names, phone numbers and salaries, so it is restricted
+    to staff users and API keys.
+    """
+    permission_classes = [IsStaffOrExportApiKey]
+
+    def get(self, request):
+        serializer = ExportLoansRequestSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+
+        rows = export_rows(
+            statuses=data.get('status'),
+            start_date_from=data.get('start_date_from'),
+            start_date_to=data.get('start_date_to'),
+        )
+        try:
+            stream = stream_export(data['file_format'], rows)
+        except ExportError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        filename = f'loans-{timezone.localdate():%Y-%m-%d}.{data["file_format"]}'
+        response = StreamingHttpResponse(stream, content_type=CONTENT_TYPES[data['file_format']])
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class OffersView(APIView):
+    """
+    API endpoint listing every loan amount and tenure combination, from a grid, that
+    a customer would be approved for at the given interest rate, ranked by EMI.
+    """
+    def get(self, request, customer_id):
+        serializer = OffersRequestSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+
+        snapshot = get_customer_snapshot(customer_id)
+        if snapshot is None:
+            return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        # The same rules as check-eligibility and create-loan, over the whole grid at once
+        amounts = offer_amounts(data['min_amount'], data.get('max_amount') or snapshot.approved_limit, data['amount_steps'])
+        tenures = np.array(sorted(set(data['tenure'])))
+        approved, corrected_interest_rate, emis = evaluate_offers(
+            DEFAULT_POLICY, snapshot, data['interest_rate'], amounts, tenures
+        )
+        amount_index, tenure_index = np.nonzero(approved)
+        ranking = np.argsort(emis[amount_index, tenure_index], kind='stable')
+        offers = [
+            {
+                'loan_amount': amounts[amount_index[i]],
+                'tenure': tenures[tenure_index[i]],
+                'monthly_installment': round(float(emis[amount_index[i], tenure_index[i]]), 2),
+            }
+            for i in ranking
+        ]
+
+        response_data = {
+            'customer_id': customer_id,
+            'interest_rate': data['interest_rate'],
+            'corrected_interest_rate': corrected_interest_rate if offers else None,
+            'offers': offers,
+        }
+        return Response(OffersResponseSerializer(response_data).data, status=status.HTTP_200_OK)
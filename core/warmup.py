@@ -0,0 +1,54 @@
+"""
+Work a web worker would otherwise do on its first requests, done up front.
+
+warm_up() runs when the WSGI application is imported. Under gunicorn with
+preload_app (gunicorn.conf.py) that happens once, in the master, and the forked
+workers share the result copy-on-write: imported modules, compiled URL patterns,
+REST framework's default classes, translation catalogs, the shard bucket table
+and the customer snapshot store. It leaves no database connection open and
+starts no threads, since neither survives a fork; start_worker() does both in
+each worker once it has forked.
+"""
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.urls import get_resolver
+from django.utils import translation
+from rest_framework.views import APIView
+
+from .group_commit import get_group_committer
+from .sharding import shard_aliases, shard_for_customer
+from .snapshots import get_snapshot_store
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    # Import every view and serializer and compile every URL pattern.
+    get_resolver().reverse_dict
+    # REST framework imports its renderer, parser, authentication and throttle classes on first use.
+    view = APIView()
+    for get_components in (view.get_renderers, view.get_parsers, view.get_authenticators,
+                           view.get_permissions, view.get_throttles):
+        get_components()
+    view.get_content_negotiator()
+    # Loads the gettext catalogs that error messages are translated from.
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.deactivate()
+    shard_for_customer(0)
+    get_snapshot_store(start_listener=False)
+    connections.close_all()
+
+
+def start_worker():
+    """Connect to every database and start this worker's background threads."""
+    for alias in {'default', *shard_aliases()}:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError:
+            # The first request retries, and reports the error if it persists.
+            logger.warning('Could not connect to database %s at worker start', alias, exc_info=True)
+    get_snapshot_store()
+    if settings.GROUP_COMMIT_ENABLED:
+        get_group_committer().start()
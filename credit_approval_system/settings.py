@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import json
 from pathlib import Path
 from decouple import config
 
@@ -54,6 +55,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.LoadSheddingMiddleware',
+    'core.middleware.QueryCountMiddleware',
 ]
 
 ROOT_URLCONF = 'credit_approval_system.urls'
@@ -80,7 +83,7 @@ WSGI_APPLICATION = 'credit_approval_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-from decouple import config
+from decouple import Csv, config
 
 DATABASES = {
     'default': {
@@ -90,9 +93,26 @@ DATABASES = {
         'PASSWORD': config('POSTGRES_PASSWORD'),
         'HOST': 'db',
         'PORT': 5432,
+        # Keep each worker's connection open between requests (seconds; 0 reconnects per
+        # request), checking it is still usable before a request reuses it.
+        'CONN_MAX_AGE': config('CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Customer sharding (core/sharding.py): each customer, with their loans, lives on the database
+# that owns the hash bucket of their customer_id. CUSTOMER_SHARDS maps aliases to [first, last)
+# ranges of the 1024 buckets, as JSON. SHARD_HOSTS adds a database per host with no buckets:
+# ranges only change by editing CUSTOMER_SHARDS after move_customer_buckets has moved their
+# customers, so adding a host never strands existing customers on the wrong database.
+SHARD_HOSTS = config('SHARD_HOSTS', default='', cast=Csv())
+for _index, _host in enumerate(SHARD_HOSTS, start=1):
+    DATABASES[f'shard_{_index}'] = {**DATABASES['default'], 'HOST': _host}
+CUSTOMER_SHARDS = config('CUSTOMER_SHARDS', default='{"default": [0, 1024]}', cast=json.loads)
+for _alias in DATABASES:
+    CUSTOMER_SHARDS.setdefault(_alias, (0, 0))
+DATABASE_ROUTERS = ['core.routers.CustomerShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -135,10 +155,80 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+REDIS_URL = config('REDIS_URL', default='redis://redis:6379/0')
+
 # Celery Configuration
-CELERY_BROKER_URL = 'redis://redis:6379/0'
-CELERY_RESULT_BACKEND = 'redis://redis:6379/0'
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+CELERY_BEAT_SCHEDULE = {
+    'create-loan-partitions': {
+        'task': 'core.tasks.create_loan_partitions',
+        'schedule': 24 * 60 * 60,  # daily; partitions are created years ahead
+    },
+}
+
+# Yearly loans partitions to keep created ahead of the current year (PostgreSQL only).
+LOAN_PARTITIONS_AHEAD = 2
+
+# Django REST Framework
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.CustomerRateThrottle',
+        'core.throttling.ClientRateThrottle',
+    ],
+}
+
+# Keys accepted in the X-Api-Key header by endpoints that expose customer data in bulk
+# (/export-loans/). Staff users signed in through the admin can use them without a key.
+EXPORT_API_KEYS = config('EXPORT_API_KEYS', default='', cast=Csv())
+
+# Token-bucket rate limits per core.urls route name, as "<requests>/<period>".
+# The customer scope is keyed by customer_id, the client scope by signed-in user, API key or client IP.
+RATE_LIMITS = {
+    'register': {'client': '60/min'},
+    'check-eligibility': {'customer': '30/min', 'client': '600/min'},
+    'create-loan': {'customer': '10/min', 'client': '300/min'},
+    'view-loan': {'client': '1200/min'},
+    'view-loans': {'customer': '60/min', 'client': '1200/min'},
+    'offers': {'customer': '30/min', 'client': '600/min'},
+    'export-loans': {'client': '10/hour'},
+}
+
+# Load shedding: maximum in-flight requests per route across all web workers.
+MAX_CONCURRENT_REQUESTS = {
+    'check-eligibility': config('MAX_CONCURRENT_ELIGIBILITY', default=64, cast=int),
+    'create-loan': config('MAX_CONCURRENT_CREATE_LOAN', default=32, cast=int),
+}
+LOAD_SHEDDING_RETRY_AFTER = 1  # seconds
+LOAD_SHEDDING_SLOT_TIMEOUT = 30  # seconds before a slot held by a dead worker is reclaimed
+
+# Benchmark runs switch off rate limits and load shedding so they measure the API itself.
+if not config('THROTTLING_ENABLED', default=True, cast=bool):
+    RATE_LIMITS = {}
+    MAX_CONCURRENT_REQUESTS = {}
+
+# Report the SQL query count of each request in an X-DB-Query-Count response header.
+QUERY_COUNT_HEADER = config('QUERY_COUNT_HEADER', default=False, cast=bool)
+
+# In-memory customer snapshots for check-eligibility (core/snapshots.py). Every web worker
+# loads all customers at startup and keeps them fresh through Redis pub/sub.
+CUSTOMER_SNAPSHOTS_ENABLED = config('CUSTOMER_SNAPSHOTS_ENABLED', default=False, cast=bool)
+CUSTOMER_SNAPSHOT_MAX_AGE = 300  # seconds before a snapshot is re-read even without a change notification
+CUSTOMER_SNAPSHOT_CHANNEL = 'customer-snapshots'
+
+# Group commit for create-loan (core/group_commit.py): approved loans from concurrent requests
+# in a worker are written in one transaction. Needs threaded workers (gunicorn --threads).
+GROUP_COMMIT_ENABLED = config('GROUP_COMMIT_ENABLED', default=False, cast=bool)
+GROUP_COMMIT_WINDOW = config('GROUP_COMMIT_WINDOW', default=0.005, cast=float)  # seconds to collect a batch
+GROUP_COMMIT_MAX_BATCH = 500
+GROUP_COMMIT_TIMEOUT = 10  # seconds before a request logs that its batch is slow; it keeps waiting
+
+# Idempotency-Key support for create-loan (seconds)
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60  # how long a stored response is replayed
+IDEMPOTENCY_LOCK_TIMEOUT = 30  # how long an in-flight request holds its key
+IDEMPOTENCY_WAIT_TIMEOUT = 10  # how long a duplicate waits for the in-flight result
+IDEMPOTENCY_POLL_INTERVAL = 0.05
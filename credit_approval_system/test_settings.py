@@ -0,0 +1,28 @@
+"""
+Settings for running the test suite in-process, with no external services:
+
+    python manage.py test --settings=credit_approval_system.test_settings
+"""
+import os
+
+for name in ('SECRET_KEY', 'POSTGRES_DB', 'POSTGRES_USER', 'POSTGRES_PASSWORD'):
+    os.environ.setdefault(name, 'test')
+
+from .settings import *  # noqa: E402,F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+    # Gets the customer tables only; sharding tests give it buckets with override_settings.
+    'shard_1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+}
+CUSTOMER_SHARDS = {'default': (0, 1024)}
+
+# Rate limiting and load shedding need Redis.
+RATE_LIMITS = {}
+MAX_CONCURRENT_REQUESTS = {}
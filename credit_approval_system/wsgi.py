@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'credit_approval_system.settings')
 
 application = get_wsgi_application()
+
+# Do the one-off work of the first requests now; with gunicorn's preload_app this runs
+# once in the master and is shared with every worker (see gunicorn.conf.py).
+from core.warmup import warm_up  # noqa: E402
+
+warm_up()
@@ -10,5 +10,18 @@ done
 # Apply database migrations
 python manage.py migrate
 
+# Customer shards (SHARD_HOSTS) are the databases shard_1, shard_2, ... in that order
+shard=1
+for host in $(echo "$SHARD_HOSTS" | tr ',' ' ')
+do
+  until nc -z -v -w30 "$host" 5432
+  do
+    echo "Waiting for shard database $host..."
+    sleep 5
+  done
+  python manage.py migrate --database "shard_$shard"
+  shard=$((shard + 1))
+done
+
 # Start server
 exec "$@"
@@ -0,0 +1,36 @@
+"""
+Gunicorn settings for the web service: gunicorn -c gunicorn.conf.py credit_approval_system.wsgi:application
+
+With WARM_STARTUP on (the default) the application is imported once in the master
+before the workers fork (preload_app). Django, REST framework, numpy and the
+customer snapshot store are then loaded once and shared copy-on-write, and a new
+worker is ready as soon as it forks. Set WARM_STARTUP=False to have each worker
+import the application itself, e.g. to pick up code changes on a worker restart.
+"""
+import gc
+
+# Imported as a module: gunicorn would read a top-level `config` as its own setting.
+import decouple
+
+bind = '0.0.0.0:8000'
+workers = decouple.config('WEB_CONCURRENCY', default=1, cast=int)
+threads = decouple.config('WEB_THREADS', default=1, cast=int)
+preload_app = decouple.config('WARM_STARTUP', default=True, cast=bool)
+
+
+def pre_fork(server, worker):
+    if not server.cfg.preload_app:
+        return
+    from django.db import connections
+
+    # A connection inherited by several processes would be shared on the wire.
+    connections.close_all()
+    # Move everything loaded so far out of the garbage collector's reach, so collections
+    # in the workers do not write to (and so copy) the pages they share with the master.
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    from core.warmup import start_worker
+
+    start_worker()